@@ -9,6 +9,7 @@ import uvicorn
 
 from config import Config
 from storage import user_levels, moderator_stats, punishments, active_punishments, init_punishment_system
+from storage import async_set_user_level
 from handlers import send_moderation_log, send_punishment_log
 
 logger = logging.getLogger(__name__)
@@ -87,7 +88,7 @@ async def set_user_level(user_id: int, level: int, api_key: str = Depends(get_ap
     if level not in [0, 1, 2, 3]:
         raise HTTPException(status_code=400, detail="Level must be between 0 and 3")
     
-    user_levels.set(user_id, level)
+    await async_set_user_level(user_id, level)
     return {"message": f"User {user_id} level set to {level}"}
 
 @app.get("/moderators/stats", response_model=List[ModStatsResponse])
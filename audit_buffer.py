@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def _on_event_loop() -> bool:
+    """Вызван ли код из потока с работающим event loop"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+class AuditLogBuffer:
+    """Write-behind буфер записей аудита.
+
+    Записи копятся в памяти и сбрасываются в audit_logs многострочными
+    INSERT из фонового потока: при накоплении batch_size записей или раз в
+    flush_interval секунд. Размер буфера ограничен max_size; когда он полон,
+    добавляющий поток ждет до block_timeout секунд, после чего запись
+    отбрасывается и учитывается в статистике. В потоке event loop ожидания
+    нет: запись сразу отбрасывается, чтобы не останавливать обработку апдейтов.
+    """
+
+    def __init__(self, database=None,
+                 batch_size: int = Config.AUDIT_BATCH_SIZE,
+                 flush_interval: float = Config.AUDIT_FLUSH_INTERVAL,
+                 max_size: int = Config.AUDIT_BUFFER_MAX_SIZE,
+                 block_timeout: float = Config.AUDIT_BUFFER_BLOCK_TIMEOUT):
+        self._database = database
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_size = max(self.batch_size, max_size)
+        self.block_timeout = block_timeout
+
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+
+    @property
+    def database(self):
+        if self._database is not None:
+            return self._database
+        import database
+        return database.db
+
+    def start(self):
+        """Запустить фоновый поток сброса"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+
+        self._thread = threading.Thread(target=self._run, name="audit-log-flusher", daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Буфер аудита запущен (batch={self.batch_size}, interval={self.flush_interval}с)")
+
+    def stop(self, timeout: float = 10.0):
+        """Остановить поток и записать все накопленные записи"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+        # Если поток не успел дописать буфер — дописываем сами
+        self.flush()
+        logger.info(f"✅ Буфер аудита остановлен: {self.get_stats()}")
+
+    def add(self, user_id: int, action_type: str, action_details: Dict[str, Any],
+            ip_address: str = None, user_agent: str = None) -> bool:
+        """Поставить запись аудита в очередь на запись"""
+        entry = {
+            'user_id': user_id,
+            'action_type': action_type,
+            'action_details': action_details,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'created_at': datetime.now()
+        }
+
+        if not self._running:
+            # Буфер не запущен (скрипты, API-процесс) — пишем напрямую
+            self.database.add_audit_log(user_id, action_type, action_details, ip_address, user_agent)
+            return True
+
+        with self._cond:
+            if len(self._buffer) >= self.max_size:
+                # Backpressure: будим поток сброса и ждем освобождения места
+                self._blocked += 1
+                self._cond.notify_all()
+                block_timeout = 0 if _on_event_loop() else self.block_timeout
+                deadline = time.monotonic() + block_timeout
+                while len(self._buffer) >= self.max_size and self._running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                if len(self._buffer) >= self.max_size:
+                    self._dropped += 1
+                    if self._dropped % 100 == 1:
+                        logger.warning(f"⚠️ Буфер аудита переполнен, отброшено записей: {self._dropped}")
+                    return False
+
+            self._buffer.append(entry)
+            self._enqueued += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+        return True
+
+    def flush(self) -> int:
+        """Синхронно записать все накопленные записи"""
+        written = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return written
+            if not self._write(batch, requeue=False):
+                return written
+            written += len(batch)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            count = min(self.batch_size, len(self._buffer))
+            batch = [self._buffer.popleft() for _ in range(count)]
+            if batch:
+                # Освободилось место — будим ожидающих производителей
+                self._cond.notify_all()
+            return batch
+
+    def _write(self, batch: List[Dict[str, Any]], requeue: bool) -> bool:
+        try:
+            self.database.add_audit_logs_bulk(batch)
+            with self._cond:
+                self._written += len(batch)
+                self._flushes += 1
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи пачки аудита ({len(batch)} записей): {e}")
+            with self._cond:
+                self._failed_flushes += 1
+                if not requeue:
+                    self._dropped += len(batch)
+                    return False
+
+                # Возвращаем записи в начало буфера, насколько хватает места
+                space = max(0, self.max_size - len(self._buffer))
+                for entry in reversed(batch[:space]):
+                    self._buffer.appendleft(entry)
+                self._dropped += len(batch) - min(space, len(batch))
+            return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while self._running and len(self._buffer) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                running = self._running
+                if not running and not self._buffer:
+                    return
+
+            batch = self._take_batch()
+            if batch and not self._write(batch, requeue=running):
+                # База недоступна — не долбим ее в цикле
+                time.sleep(self.flush_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить статистику буфера"""
+        with self._cond:
+            return {
+                'pending': len(self._buffer),
+                'enqueued': self._enqueued,
+                'written': self._written,
+                'dropped': self._dropped,
+                'blocked': self._blocked,
+                'flushes': self._flushes,
+                'failed_flushes': self._failed_flushes
+            }
+
+# Глобальный буфер аудита
+audit_buffer = AuditLogBuffer()
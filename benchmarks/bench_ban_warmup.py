@@ -0,0 +1,68 @@
+"""
+Бенчмарк прогрева кэша банов при запуске (pre_cache_active_bans).
+
+Сравнивает прежний SETEX на каждый бан с cache_set_many, который пишет
+баны пачками по REDIS_PIPELINE_BATCH через pipeline. Обращения к MySQL
+подменяются списком сгенерированных банов.
+
+Запуск (нужен Redis и зависимости бота; база из --url будет очищена):
+    python benchmarks/bench_ban_warmup.py --url redis://localhost:6379/15 --bans 100000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+from redis_storage import RedisStorage
+
+def make_bans(count: int):
+    now = datetime.now()
+    return [
+        {
+            'ban_type': 'user' if i % 2 else 'ip',
+            'identifier': str(1000000 + i),
+            'expires_at': now + timedelta(hours=1 + i % 48) if i % 5 else None
+        }
+        for i in range(count)
+    ]
+
+def legacy_warmup(redis_storage: RedisStorage, bans):
+    """Прежняя реализация: по одному SETEX на бан"""
+    for ban in bans:
+        cache_key = f"ban:{ban['ban_type']}:{ban['identifier']}"
+        expires_in = (ban['expires_at'] - datetime.now()).total_seconds() if ban['expires_at'] else 3600
+        redis_storage.cache_set(
+            cache_key,
+            {'banned': True, 'expires_at': ban['expires_at'].isoformat() if ban['expires_at'] else None},
+            max(60, int(expires_in))
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default="redis://localhost:6379/15")
+    parser.add_argument('--bans', type=int, default=100_000)
+    args = parser.parse_args()
+
+    bans = make_bans(args.bans)
+    redis_storage = RedisStorage(args.url)
+    storage.redis_storage = redis_storage
+    storage.db = SimpleNamespace(get_active_bans=lambda: bans)
+
+    print(f"{'variant':<12} {'bans':>8} {'seconds':>9} {'bans/s':>10}")
+    for name, warmup in (("legacy", lambda: legacy_warmup(redis_storage, bans)),
+                         ("pipelined", storage.pre_cache_active_bans)):
+        redis_storage.redis.flushdb()
+        started = time.perf_counter()
+        warmup()
+        elapsed = time.perf_counter() - started
+        print(f"{name:<12} {args.bans:>8} {elapsed:>9.2f} {args.bans / elapsed:>10.0f}")
+
+    redis_storage.redis.flushdb()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк сериализации значений кэша RedisStorage.
+
+Сравнивает pickle с кодеками из cache_codec на формах данных, которые
+реально кладутся в кэш: уровень пользователя, сообщение в очереди,
+запись бана, таблица лидеров и статистика пользователя.
+
+Запуск (Redis и MySQL не нужны):
+    python benchmarks/bench_cache_codec.py --iterations 20000
+"""
+import argparse
+import os
+import pickle
+import sys
+import timeit
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_codec import CacheCodec, CodecError, JSONSerializer, MsgpackSerializer
+
+NOW = datetime(2024, 5, 17, 14, 30, 12)
+
+PAYLOADS = {
+    'user_level': 2,
+    'message': {
+        'user_id': 512345678,
+        'type': 'text',
+        'content': 'Анонимное сообщение средней длины, ' * 8,
+        'username': 'some_user',
+        'level': 0,
+        'owner_message_id': 18231
+    },
+    'ban': {'banned': True, 'expires_at': NOW + timedelta(days=1)},
+    'leaderboard': [
+        {
+            'moderator_id': 400000000 + i,
+            'username': f'moderator_{i}',
+            'approved': 120 + i,
+            'rejected': 30 + i,
+            'reviewed': 150 + 2 * i,
+            'avg_moderation_time': 42.5 + i,
+            'efficiency': 80.0 - i,
+            'rank': i + 1
+        }
+        for i in range(10)
+    ],
+    'user_stats': {
+        'user_id': 512345678,
+        'total_messages': 37,
+        'approved_messages': 30,
+        'rejected_messages': 7,
+        'total_moderation_time': 4211,
+        'avg_moderation_time': 113.8,
+        'success_rate': 81.08,
+        'last_activity': NOW,
+        'created_at': NOW - timedelta(days=90),
+        'updated_at': NOW
+    },
+    'daily_stats': [
+        {
+            'date': (NOW - timedelta(days=i)).date(),
+            'total_messages': 200 + i,
+            'approved_count': 150,
+            'rejected_count': 50 + i,
+            'avg_moderation_time': 61.2,
+            'approval_rate': Decimal('75.0')
+        }
+        for i in range(7)
+    ]
+}
+
+class PickleCodec:
+    name = "pickle"
+    
+    @staticmethod
+    def dumps(value):
+        return pickle.dumps(value)
+    
+    @staticmethod
+    def loads(data):
+        return pickle.loads(data)
+
+def codecs():
+    result = [PickleCodec()]
+    for serializer_class in (MsgpackSerializer, JSONSerializer):
+        try:
+            result.append(CacheCodec(serializer_class()))
+        except CodecError as e:
+            print(f"пропуск {serializer_class.name}: {e}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    
+    print(f"{'payload':<12} {'codec':<8} {'bytes':>7} {'encode µs':>10} {'decode µs':>10}")
+    for payload_name, payload in PAYLOADS.items():
+        for codec in codecs():
+            encoded = codec.dumps(payload)
+            assert codec.loads(encoded) == payload, f"{codec.name} искажает {payload_name}"
+            
+            encode = timeit.timeit(lambda: codec.dumps(payload), number=args.iterations)
+            decode = timeit.timeit(lambda: codec.loads(encoded), number=args.iterations)
+            print(f"{payload_name:<12} {codec.name:<8} {len(encoded):>7} "
+                  f"{encode / args.iterations * 1e6:>10.2f} {decode / args.iterations * 1e6:>10.2f}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Микро-бенчмарк вычисления прав на один апдейт с контентом.
+
+Сравнивает прежнюю цепочку, где фильтр, check_command_access и обработчик
+каждый раз заново запрашивают уровень и бан пользователя, с PermissionContext,
+вычисляемым один раз в PermissionMiddleware. Обращения к хранилищу
+подменяются счетчиком с настраиваемой задержкой (имитация RTT до Redis).
+
+Запуск (нужен aiogram и .env, к Redis/MySQL не обращается):
+    python benchmarks/bench_permission_context.py --updates 5000 --latency-ms 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import filters
+import middlewares
+from commands import check_command_access
+from filters import IsPrivateOrOwnerAdmin
+from middlewares import resolve_permissions
+
+class LookupCounter:
+    """Подмена обращений к хранилищу прав"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lookups = 0
+
+    def get_user_level(self, user_id: int) -> int:
+        self.lookups += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return 0
+
+    async def async_get_user_level(self, user_id: int) -> int:
+        return self.get_user_level(user_id)
+
+    async def async_is_user_banned(self, user_id: int) -> bool:
+        self.lookups += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return False
+
+def make_message(user_id: int):
+    return SimpleNamespace(
+        from_user=SimpleNamespace(id=user_id, username=None),
+        chat=SimpleNamespace(id=user_id, type=filters.ChatType.PRIVATE)
+    )
+
+async def legacy_update(message, content_filter):
+    """Каждый шаг сам запрашивает права"""
+    user_id = message.from_user.id
+    await content_filter(message)
+    await check_command_access(message)                 # handle_text_message
+    await middlewares.async_get_user_level(user_id)     # уровень для message_data
+    await check_command_access(message)                 # send_to_moderator
+    await middlewares.async_get_user_level(user_id)     # проверка канала владельца
+
+async def context_update(message, content_filter):
+    """Права вычислены один раз и передаются дальше"""
+    permissions = await resolve_permissions(message.from_user.id)
+    await content_filter(message, permissions)
+    await check_command_access(message, permissions)
+    _ = permissions.level
+    await check_command_access(message, permissions)
+    _ = permissions.level
+
+async def run(variant, counter: LookupCounter, updates: int):
+    content_filter = IsPrivateOrOwnerAdmin()
+    counter.lookups = 0
+    started = time.perf_counter()
+    for i in range(updates):
+        await variant(make_message(100000 + i % 500), content_filter)
+    elapsed = time.perf_counter() - started
+    return counter.lookups / updates, elapsed / updates * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="задержка одного обращения к хранилищу")
+    args = parser.parse_args()
+
+    counter = LookupCounter(args.latency_ms / 1000)
+    filters.async_get_user_level = counter.async_get_user_level
+    middlewares.async_get_user_level = counter.async_get_user_level
+    middlewares.async_is_user_banned = counter.async_is_user_banned
+
+    print(f"{'variant':<10} {'lookups/update':>15} {'µs/update':>10}")
+    for name, variant in (("legacy", legacy_update), ("context", context_update)):
+        lookups, micros = asyncio.run(run(variant, counter, args.updates))
+        print(f"{name:<10} {lookups:>15.1f} {micros:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Бенчмарк снятия истекших наказаний в PunishmentSystem.
+
+Сравнивает прежнюю проверку — обход всех active_punishments раз в минуту —
+с кучей сроков: стоимость одной проверки, когда ничего не истекло, и
+опоздание снятия мута относительно expires_at. Снятие мута в Telegram и
+запись в Redis подменяются пустыми вызовами.
+
+Запуск (нужны aiogram и Redis — к нему подключается redis_storage при импорте):
+    python benchmarks/bench_punishment_expiry.py --mutes 100000 --checks 200
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis_storage
+from punishment_system import Punishment, PunishmentSystem
+
+class BenchPunishmentSystem(PunishmentSystem):
+    """PunishmentSystem без обращений к Telegram"""
+
+    async def apply_mute(self, punishment: Punishment):
+        pass
+
+    async def remove_mute(self, punishment: Punishment):
+        pass
+
+async def legacy_check(system: PunishmentSystem):
+    """Прежняя реализация: линейный обход активных наказаний"""
+    now = datetime.datetime.now()
+    expired = [user_id for user_id, punishment in system.active_punishments.items() if now >= punishment.expires_at]
+    for user_id in expired:
+        await system.remove_punishment(user_id)
+
+def make_mute(user_id: int, seconds: float) -> Punishment:
+    now = datetime.datetime.now()
+    return Punishment(user_id, 'mute', int(seconds), "bench", 0, now, now + datetime.timedelta(seconds=seconds))
+
+async def run(mutes: int, checks: int):
+    system = BenchPunishmentSystem(bot=None)
+    for user_id in range(mutes):
+        await system.add_punishment(make_mute(user_id, 3600 + user_id % 86400))
+
+    print(f"{'variant':<10} {'µs/check (nothing expired)':>28}")
+    for name, check in (("legacy", lambda: legacy_check(system)), ("heap", system.check_expired_punishments)):
+        started = time.perf_counter()
+        for _ in range(checks):
+            await check()
+        print(f"{name:<10} {(time.perf_counter() - started) / checks * 1e6:>28.1f}")
+
+    # Опоздание снятия: мут на 1 секунду при работающей фоновой задаче
+    await system.start()
+    await system.add_punishment(make_mute(-1, 1))
+    expires_at = system.active_punishments[-1].expires_at
+    while -1 in system.active_punishments:
+        await asyncio.sleep(0.001)
+    late_ms = (datetime.datetime.now() - expires_at).total_seconds() * 1000
+    print(f"heap expiry lateness: {late_ms:.1f} ms (legacy: up to 60000 ms)")
+    await system.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mutes', type=int, default=100_000)
+    parser.add_argument('--checks', type=int, default=200)
+    args = parser.parse_args()
+
+    # add_punishment пишет наказание в Redis — в бенчмарке не нужно
+    redis_storage.redis_storage.add_punishment = lambda *args, **kwargs: None
+    asyncio.run(run(args.mutes, args.checks))
+
+if __name__ == "__main__":
+    main()
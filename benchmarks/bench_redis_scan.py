@@ -0,0 +1,106 @@
+"""
+Бенчмарк обхода ключей Redis: KEYS против SCAN + UNLINK и ящика уведомлений.
+
+Заполняет отдельную базу Redis keyspace'ом из --keys ключей кэша (среди них
+уведомления --users пользователей) и сравнивает:
+  - удаление по шаблону: KEYS + DEL против SCAN + пакетного UNLINK;
+  - уведомления одного пользователя: KEYS по шаблону против ящика уведомлений.
+Параллельный поток все это время пингует Redis: максимальная задержка PING
+показывает, насколько операция блокирует остальных клиентов.
+
+Запуск (нужен Redis; база из --url будет очищена):
+    python benchmarks/bench_redis_scan.py --url redis://localhost:6379/15 --keys 1000000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+
+from redis_storage import RedisStorage
+
+class PingProbe:
+    """Фоновый поток, измеряющий задержку PING во время операции"""
+
+    def __init__(self, url: str):
+        self.client = redis.from_url(url)
+        self.max_ms = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            self.client.ping()
+            self.max_ms = max(self.max_ms, (time.perf_counter() - started) * 1000)
+            time.sleep(0.001)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def populate(storage: RedisStorage, keys: int, users: int, per_user: int):
+    """Заполнить базу: уведомления пользователей и прочие ключи кэша"""
+    storage.redis.flushdb()
+    with storage.redis.pipeline(transaction=False) as pipe:
+        for user_id in range(users):
+            for i in range(per_user):
+                storage.add_notification(user_id, "bench", {'i': i})
+                # Прежняя раскладка: отдельный ключ на уведомление
+                pipe.set(storage._key(f"cache:notifications:{user_id}:{i}"), b"x")
+        pipe.execute()
+
+        for i in range(keys - users * per_user):
+            pipe.set(storage._key(f"cache:bench:{i}"), b"x")
+            if i % 10000 == 9999:
+                pipe.execute()
+        pipe.execute()
+
+def measure(url: str, operation):
+    with PingProbe(url) as probe:
+        started = time.perf_counter()
+        result = operation()
+        elapsed = (time.perf_counter() - started) * 1000
+    return result, elapsed, probe.max_ms
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default="redis://localhost:6379/15")
+    parser.add_argument('--keys', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--per-user', type=int, default=10)
+    args = parser.parse_args()
+
+    storage = RedisStorage(args.url)
+    user_pattern = storage._key("cache:notifications:0:*")
+
+    print(f"{'operation':<32} {'result':>8} {'ms':>10} {'max PING ms':>12}")
+
+    def report(name, result, elapsed, ping):
+        print(f"{name:<32} {result:>8} {elapsed:>10.1f} {ping:>12.1f}")
+
+    populate(storage, args.keys, args.users, args.per_user)
+    report("user lookup: KEYS", *measure(args.url, lambda: len(storage.redis.keys(user_pattern))))
+    report("user lookup: inbox", *measure(args.url, lambda: len(storage.get_user_notifications(0))))
+
+    def keys_delete():
+        keys = storage.redis.keys(storage._key("cache:bench:*"))
+        return storage.redis.delete(*keys) if keys else 0
+
+    report("delete pattern: KEYS + DEL", *measure(args.url, keys_delete))
+
+    populate(storage, args.keys, args.users, args.per_user)
+    report("delete pattern: SCAN + UNLINK", *measure(args.url, lambda: storage.cache_delete_pattern("bench:*")))
+
+    storage.redis.flushdb()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Бенчмарк счетчиков статистики модерации под параллельной нагрузкой.
+
+Сравнивает прежний SELECT-then-UPDATE с атомарным upsert
+MySQLDatabase.update_moderator_stats: число обращений к серверу,
+ожидания блокировок InnoDB и потерянные инкременты.
+
+Запуск (нужна MySQL из .env):
+    python benchmarks/bench_stats_upsert.py --workers 16 --actions 2000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import MySQLDatabase
+
+BENCH_MODERATORS = [-900001, -900002, -900003]
+
+class CountingDatabase(MySQLDatabase):
+    """MySQLDatabase, считающий выполненные запросы"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.round_trips = 0
+        self._lock = threading.Lock()
+    
+    def get_cursor(self):
+        context = super().get_cursor()
+        database = self
+        
+        class _Counting:
+            def __enter__(self):
+                cursor = context.__enter__()
+                execute = cursor.execute
+                
+                def counted(*args, **kwargs):
+                    with database._lock:
+                        database.round_trips += 1
+                    return execute(*args, **kwargs)
+                
+                cursor.execute = counted
+                return cursor
+            
+            def __exit__(self, *exc):
+                return context.__exit__(*exc)
+        
+        return _Counting()
+
+def legacy_update_moderator_stats(db: MySQLDatabase, moderator_id: int, action: str, moderation_time: int = 0):
+    """Прежняя реализация: чтение, расчет в Python, запись"""
+    with db.get_cursor() as cursor:
+        cursor.execute("SELECT * FROM moderator_stats WHERE moderator_id = %s", (moderator_id,))
+        stats = cursor.fetchone()
+        
+        if not stats:
+            cursor.execute(
+                "INSERT IGNORE INTO moderator_stats (moderator_id, approved, rejected, reviewed, warnings) VALUES (%s, 0, 0, 0, 0)",
+                (moderator_id,)
+            )
+            stats = {'approved': 0, 'rejected': 0, 'reviewed': 0, 'warnings': 0, 'avg_moderation_time': 0}
+        
+        reviewed = stats['reviewed'] + 1
+        approved = stats['approved'] + (1 if action == 'approved' else 0)
+        rejected = stats['rejected'] + (1 if action == 'rejected' else 0)
+        warnings = stats['warnings'] + (1 if action == 'warning' else 0)
+        total_time = stats['avg_moderation_time'] * stats['reviewed'] + moderation_time
+        avg_time = total_time / reviewed
+        efficiency = approved / reviewed * 100
+        
+        cursor.execute("""
+            UPDATE moderator_stats 
+            SET approved = %s, rejected = %s, reviewed = %s, warnings = %s,
+                avg_moderation_time = %s, efficiency = %s, updated_at = NOW()
+            WHERE moderator_id = %s
+        """, (approved, rejected, reviewed, warnings, avg_time, efficiency, moderator_id))
+
+def lock_status(db: MySQLDatabase) -> dict:
+    with db.get_cursor() as cursor:
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_%%'")
+        return {row['Variable_name']: int(row['Value']) for row in cursor.fetchall()}
+
+def reset(db: MySQLDatabase):
+    with db.get_cursor() as cursor:
+        for moderator_id in BENCH_MODERATORS:
+            cursor.execute("INSERT IGNORE INTO users (user_id, level) VALUES (%s, 1)", (moderator_id,))
+            cursor.execute("DELETE FROM moderator_stats WHERE moderator_id = %s", (moderator_id,))
+
+def cleanup(db: MySQLDatabase):
+    with db.get_cursor() as cursor:
+        for moderator_id in BENCH_MODERATORS:
+            cursor.execute("DELETE FROM users WHERE user_id = %s", (moderator_id,))
+
+def run(db: CountingDatabase, update, workers: int, actions: int) -> dict:
+    reset(db)
+    before = lock_status(db)
+    db.round_trips = 0
+    
+    def one(i: int):
+        moderator_id = BENCH_MODERATORS[i % len(BENCH_MODERATORS)]
+        update(moderator_id, 'approved' if i % 3 else 'rejected', i % 120)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(one, range(actions)))
+    elapsed = time.perf_counter() - started
+    
+    round_trips = db.round_trips
+    after = lock_status(db)
+    
+    with db.get_cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(SUM(reviewed), 0) AS reviewed FROM moderator_stats WHERE moderator_id IN (%s, %s, %s)",
+            tuple(BENCH_MODERATORS)
+        )
+        reviewed = int(cursor.fetchone()['reviewed'])
+    
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'actions_per_s': round(actions / elapsed, 1),
+        'round_trips_per_action': round(round_trips / actions, 2),
+        'lock_waits': after['Innodb_row_lock_waits'] - before['Innodb_row_lock_waits'],
+        'lock_time_ms': after['Innodb_row_lock_time'] - before['Innodb_row_lock_time'],
+        'lost_increments': actions - reviewed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--actions', type=int, default=2000)
+    args = parser.parse_args()
+    
+    db = CountingDatabase(
+        Config.MYSQL_HOST, Config.MYSQL_USER, Config.MYSQL_PASSWORD, Config.MYSQL_DATABASE,
+        pooled=True, pool_size=args.workers, max_overflow=0
+    )
+    if not db.connect():
+        sys.exit("MySQL недоступна")
+    db.initialize_database()
+    
+    try:
+        results = {
+            'select-then-update': run(db, lambda *a: legacy_update_moderator_stats(db, *a), args.workers, args.actions),
+            'upsert': run(db, db.update_moderator_stats, args.workers, args.actions),
+        }
+    finally:
+        cleanup(db)
+        db.disconnect()
+    
+    print(f"workers={args.workers} actions={args.actions} hot_rows={len(BENCH_MODERATORS)}")
+    for name, result in results.items():
+        print(f"{name:>20}: " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import json
+import logging
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Первый байт закодированного значения — идентификатор формата и его версии.
+# Менять формат кодирования можно только вместе с новым идентификатором.
+FORMAT_MSGPACK_V1 = 0x01
+FORMAT_JSON_V1 = 0x02
+
+# Коды типов, которых нет в msgpack/JSON
+_TYPE_DATETIME = 1
+_TYPE_DATE = 2
+_TYPE_DECIMAL = 3
+_TYPE_TIMEDELTA = 4
+_TYPE_ROWS = 5
+
+_JSON_TAGS = {'dt': _TYPE_DATETIME, 'd': _TYPE_DATE, 'dec': _TYPE_DECIMAL, 'td': _TYPE_TIMEDELTA}
+
+class CodecError(ValueError):
+    """Значение не может быть закодировано или раскодировано"""
+
+class _Rows:
+    """Список однотипных словарей (строки из БД), хранимый как ключи + значения"""
+    
+    __slots__ = ('keys', 'values')
+    
+    def __init__(self, keys: List[Any], values: List[List[Any]]):
+        self.keys = keys
+        self.values = values
+    
+    def restore(self) -> List[Dict[Any, Any]]:
+        return [dict(zip(self.keys, row)) for row in self.values]
+
+def _compact(value: Any) -> Any:
+    """Заменить списки словарей с одинаковыми ключами на _Rows.
+    
+    Таблицы лидеров и выборки из БД повторяют одни и те же ключи в каждой
+    строке; без этого они занимают в кэше больше, чем в pickle.
+    """
+    kind = type(value)
+    if kind is dict:
+        return {k: _compact(v) if type(v) in _CONTAINERS else v for k, v in value.items()}
+    if kind is list or kind is tuple:
+        if len(value) > 1 and type(value[0]) is dict:
+            keys = list(value[0])
+            if all(type(row) is dict and len(row) == len(keys) and list(row) == keys for row in value):
+                return _Rows(keys, [
+                    [_compact(v) if type(v) in _CONTAINERS else v for v in row.values()]
+                    for row in value
+                ])
+        return [_compact(item) if type(item) in _CONTAINERS else item for item in value]
+    return value
+
+_CONTAINERS = (dict, list, tuple)
+
+def _pack_extra(value: Any):
+    """Преобразовать нестандартный тип в пару (код типа, строка)"""
+    if isinstance(value, datetime):
+        return _TYPE_DATETIME, value.isoformat()
+    if isinstance(value, date):
+        return _TYPE_DATE, value.isoformat()
+    if isinstance(value, Decimal):
+        return _TYPE_DECIMAL, str(value)
+    if isinstance(value, timedelta):
+        return _TYPE_TIMEDELTA, repr(value.total_seconds())
+    return None
+
+def _unpack_extra(code: int, text: str) -> Any:
+    if code == _TYPE_DATETIME:
+        return datetime.fromisoformat(text)
+    if code == _TYPE_DATE:
+        return date.fromisoformat(text)
+    if code == _TYPE_DECIMAL:
+        return Decimal(text)
+    if code == _TYPE_TIMEDELTA:
+        return timedelta(seconds=float(text))
+    raise CodecError(f"Неизвестный код типа: {code}")
+
+class CacheSerializer:
+    """Базовый сериализатор значений кэша с байтом версии формата"""
+
+    format_id: int = 0
+    name: str = "base"
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            return bytes((self.format_id,)) + self._encode(value)
+        except CodecError:
+            raise
+        except Exception as e:
+            raise CodecError(f"{self.name}: не удалось закодировать {type(value).__name__}: {e}") from e
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            return self._decode(memoryview(data)[1:])
+        except CodecError:
+            raise
+        except Exception as e:
+            raise CodecError(f"{self.name}: не удалось раскодировать значение: {e}") from e
+
+    def _encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def _decode(self, payload: memoryview) -> Any:
+        raise NotImplementedError
+
+class MsgpackSerializer(CacheSerializer):
+    """Компактный бинарный формат msgpack с ext-типами для datetime/Decimal"""
+
+    format_id = FORMAT_MSGPACK_V1
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise CodecError("msgpack не установлен")
+
+    @classmethod
+    def _default(cls, value: Any):
+        if isinstance(value, _Rows):
+            return msgpack.ExtType(_TYPE_ROWS, msgpack.packb(
+                [value.keys, value.values], default=cls._default, use_bin_type=True
+            ))
+        extra = _pack_extra(value)
+        if extra is not None:
+            code, text = extra
+            return msgpack.ExtType(code, text.encode('utf-8'))
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        raise TypeError(f"Тип {type(value).__name__} не поддерживается")
+
+    @classmethod
+    def _ext_hook(cls, code: int, data: bytes):
+        if code == _TYPE_ROWS:
+            keys, values = msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=cls._ext_hook)
+            return _Rows(keys, values).restore()
+        return _unpack_extra(code, data.decode('utf-8'))
+
+    def _encode(self, value: Any) -> bytes:
+        return msgpack.packb(_compact(value), default=self._default, use_bin_type=True)
+
+    def _decode(self, payload: memoryview) -> Any:
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False, ext_hook=self._ext_hook)
+
+class JSONSerializer(CacheSerializer):
+    """JSON (orjson при наличии) с тегированными datetime/Decimal.
+
+    Ключи словарей после чтения всегда строки.
+    """
+
+    format_id = FORMAT_JSON_V1
+    name = "json"
+
+    @staticmethod
+    def _default(value: Any):
+        if isinstance(value, _Rows):
+            return {'__t': 'rows', 'k': value.keys, 'v': value.values}
+        extra = _pack_extra(value)
+        if extra is not None:
+            code, text = extra
+            tag = next(tag for tag, tag_code in _JSON_TAGS.items() if tag_code == code)
+            return {'__t': tag, 'v': text}
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        raise TypeError(f"Тип {type(value).__name__} не поддерживается")
+
+    @staticmethod
+    def _revive_object(obj: Dict[str, Any]) -> Any:
+        tag = obj.get('__t')
+        if tag is None:
+            return obj
+        if tag == 'rows' and len(obj) == 3:
+            return _Rows(obj['k'], obj['v']).restore()
+        if tag in _JSON_TAGS and len(obj) == 2 and 'v' in obj:
+            return _unpack_extra(_JSON_TAGS[tag], obj['v'])
+        return obj
+
+    @classmethod
+    def _revive(cls, value: Any) -> Any:
+        if isinstance(value, dict):
+            return cls._revive_object({k: cls._revive(v) for k, v in value.items()})
+        if isinstance(value, list):
+            return [cls._revive(item) for item in value]
+        return value
+
+    def _encode(self, value: Any) -> bytes:
+        value = _compact(value)
+        if orjson is not None:
+            return orjson.dumps(
+                value,
+                default=self._default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            )
+        return json.dumps(value, default=self._default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def _decode(self, payload: memoryview) -> Any:
+        if orjson is not None:
+            raw = payload.tobytes()
+            value = orjson.loads(raw)
+            # Обход нужен только если при записи были тегированные типы
+            return self._revive(value) if b'"__t"' in raw else value
+        return json.loads(bytes(payload).decode('utf-8'), object_hook=self._revive_object)
+
+class CacheCodec:
+    """Кодек кэша: пишет выбранным сериализатором, читает любым известным по байту версии"""
+
+    def __init__(self, writer: CacheSerializer):
+        self.writer = writer
+        self.readers: Dict[int, CacheSerializer] = {writer.format_id: writer}
+        for serializer_class in (MsgpackSerializer, JSONSerializer):
+            if serializer_class.format_id not in self.readers:
+                try:
+                    self.readers[serializer_class.format_id] = serializer_class()
+                except CodecError:
+                    pass
+
+    @property
+    def name(self) -> str:
+        return self.writer.name
+
+    def dumps(self, value: Any) -> bytes:
+        return self.writer.dumps(value)
+
+    def loads(self, data: bytes) -> Any:
+        if not data:
+            raise CodecError("Пустое значение")
+        reader = self.readers.get(data[0])
+        if reader is None:
+            # Например, значение, записанное старой версией через pickle
+            raise CodecError(f"Неизвестный формат значения: 0x{data[0]:02x}")
+        return reader.loads(data)
+
+def get_serializer(name: str = "auto") -> CacheCodec:
+    """Создать кодек по имени: auto, msgpack или json"""
+    name = (name or "auto").lower()
+    if name == "msgpack" or (name == "auto" and msgpack is not None):
+        return CacheCodec(MsgpackSerializer())
+    if name in ("json", "auto"):
+        return CacheCodec(JSONSerializer())
+    raise CodecError(f"Неизвестный сериализатор кэша: {name}")
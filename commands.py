@@ -8,17 +8,14 @@ import psutil
 import os
 
 from config import Config
+import storage
 from storage import pending_messages, user_levels, moderator_stats, get_punishments, punishments
+from storage import get_moderators, count_moderators, get_user_levels_page, pending_queue
+from middlewares import PermissionContext, resolve_permissions
 
-# Клавиатуры
-def create_moderation_keyboard(message_id):
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{message_id}"),
-            InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reject_{message_id}")
-        ]
-    ])
+from keyboards import create_moderation_keyboard
 
+# Клавиатуры
 def get_cancel_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -65,6 +62,21 @@ system_settings = {
     'notifications_enabled': True
 }
 
+async def check_command_access(message: types.Message, permissions: PermissionContext = None) -> bool:
+    """Проверить, может ли пользователь отправлять сообщения (бан, мут)"""
+    if permissions is None or permissions.user_id != message.from_user.id:
+        permissions = await resolve_permissions(message.from_user.id, storage.punishment_system)
+    
+    if permissions.is_banned:
+        await message.answer("🚫 Вы заблокированы и не можете отправлять сообщения")
+        return False
+    
+    if permissions.is_muted:
+        await message.answer("🔇 Вы временно не можете отправлять сообщения")
+        return False
+    
+    return True
+
 async def cmd_start(message: types.Message):
     welcome_text = """
 🚀 Здесь можно отправить анонимное сообщение человеку, который опубликовал эту ссылку
@@ -102,19 +114,23 @@ async def cmd_pending(message: types.Message):
         await message.answer("❌ У вас нет прав для этой команды")
         return
     
-    if not pending_messages:
+    if not pending_queue:
         await message.answer("📭 Нет сообщений в ожидании модeraции")
         return
     
-    count = 0
-    for msg_id, msg_data in pending_messages.items():
-        if msg_data['user_id'] == message.from_user.id:
+    # Каждый вызов показывает следующую страницу; "/pending 1" — с начала очереди
+    restart = message.text.strip().split()[-1] == "1" if message.text else False
+    page, has_more = pending_queue.page(message.from_user.id, 5, restart=restart)
+    
+    if not page:
+        await message.answer("📭 Нет доступных вам сообщений в ожидании модерации")
+        return
+    
+    for msg_id in page:
+        msg_data = pending_messages.get(msg_id)
+        if not msg_data:
             continue
-            
-        if count >= 5:  # Ограничиваем показ 5 сообщениями
-            await message.answer("📋 Показаны первые 5 сообщений. Используйте /pending снова для просмотра следующих.")
-            break
-            
+        
         if msg_data['type'] == 'text':
             await message.answer(
                 f"📨 Сообщение для модерации (ID: {msg_id}):\n\n{msg_data['content']}",
@@ -138,9 +154,11 @@ async def cmd_pending(message: types.Message):
                 caption=f"📨 Голосовое сообщение для модерации (ID: {msg_id})",
                 reply_markup=create_moderation_keyboard(msg_id)
             )
-        
-        count += 1
-        await asyncio.sleep(0.5)  # Небольшая задержка между сообщениями
+    
+    if has_more:
+        await message.answer(f"📋 Показано {len(page)} из {len(pending_queue)}. Используйте /pending для следующей страницы.")
+    else:
+        await message.answer("📋 Это конец очереди. Следующий /pending начнет сначала.")
 
 async def cmd_checkprofile(message: types.Message):
     user_level = user_levels.get(message.from_user.id, 0)
@@ -203,8 +221,8 @@ async def cmd_setlevel(message: types.Message):
             await message.answer("❌ Уровень должен быть от 0 до 3")
             return
         
-        from storage import set_user_level
-        set_user_level(target_id, level)
+        from storage import async_set_user_level
+        await async_set_user_level(target_id, level)
         
         level_names = {
             0: "Пользователь",
@@ -324,7 +342,7 @@ async def cmd_stats(message: types.Message):
         return
     
     total_users = len(user_levels)
-    moderators = sum(1 for level in user_levels.values() if level >= 1)
+    moderators = count_moderators()
     total_messages = sum(stats.get('reviewed', 0) for stats in moderator_stats.values())
     approved = sum(stats.get('approved', 0) for stats in moderator_stats.values())
     rejected = sum(stats.get('rejected', 0) for stats in moderator_stats.values())
@@ -383,7 +401,7 @@ async def cmd_mods(message: types.Message):
         await message.answer("❌ У вас нет прав для этой команды")
         return
     
-    mods = [uid for uid, level in user_levels.items() if level >= 1]
+    mods = get_moderators()
     
     if not mods:
         await message.answer("📭 Нет активных модераторов")
@@ -527,7 +545,7 @@ async def cmd_reports(message: types.Message):
     report_text += f"✅ Одобрено: {sum([stats.get('approved', 0) for stats in moderator_stats.values()])}\n"
     report_text += f"❌ Отклонено: {sum([stats.get('rejected', 0) for stats in moderator_stats.values()])}\n"
     report_text += f"👥 Активных пользователей: {len(user_levels)}\n"
-    report_text += f"👮 Активных модераторов: {sum(1 for uid, level in user_levels.items() if level >= 1)}\n\n"
+    report_text += f"👮 Активных модераторов: {count_moderators()}\n\n"
     
     # Топ модераторов за день
     top_mods = sorted(
@@ -561,12 +579,26 @@ async def handle_admin_callback(callback: types.CallbackQuery):
         return
     
     if data == "users_list":
-        users_list = "\n".join([f"ID: {uid} | Уровень: {level}" for uid, level in list(user_levels.items())[:10]])
+        users_list = "\n".join([f"ID: {uid} | Уровень: {level}" for uid, level in get_user_levels_page(10)])
         await callback.message.answer(f"👥 Последние 10 пользователей:\n\n{users_list}")
         await callback.answer()
     
+    elif data == "users_stats":
+        # Счетчики по индексу уровней, без обхода всех пользователей
+        owners = count_moderators(3)
+        tech_mods = count_moderators(2) - owners
+        mods = count_moderators(1) - owners - tech_mods
+        stats_text = f"📊 Статистика пользователей\n\n"
+        stats_text += f"👥 Всего: {len(user_levels)}\n"
+        stats_text += f"👮 Модераторов: {mods}\n"
+        stats_text += f"🛠 Тех. модераторов: {tech_mods}\n"
+        stats_text += f"👑 Владельцев: {owners}"
+        await callback.message.answer(stats_text)
+        await callback.answer()
+    
     elif data == "emergency_clear":
         pending_messages.clear()
+        pending_queue.clear()
         await callback.message.answer("✅ Очередь модерации очищена")
         await callback.answer()
     
@@ -615,6 +647,7 @@ async def cmd_cleanup(message: types.Message):
     
     for msg_id in to_delete:
         del pending_messages[msg_id]
+        pending_queue.remove(msg_id)
     
     await message.answer(f"🧹 Очистка завершена. Удалено {len(to_delete)} из {old_count} сообщений")
 
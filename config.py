@@ -19,6 +19,8 @@ class Config:
     MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 10))
     MYSQL_MAX_OVERFLOW = int(os.getenv("MYSQL_MAX_OVERFLOW", 20))
     MYSQL_POOL_RECYCLE = int(os.getenv("MYSQL_POOL_RECYCLE", 3600))
+    MYSQL_POOL_ENABLED = os.getenv("MYSQL_POOL_ENABLED", "True").lower() == "true"
+    MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", 30))  # секунд ожидания свободного соединения
     
     # ==================== КАНАЛЫ ДЛЯ ЛОГИРОВАНИЯ ====================
     LOG_MODERATION_CHANNEL = os.getenv("LOG_MODERATION_CHANNEL", "@moderation_logs")
@@ -33,10 +35,13 @@ class Config:
     MAX_MESSAGE_LENGTH = int(os.getenv("MAX_MESSAGE_LENGTH", 1000))
     MAX_PHOTO_SIZE = int(os.getenv("MAX_PHOTO_SIZE", 10 * 1024 * 1024))  # 10MB
     MAX_VIDEO_SIZE = int(os.getenv("MAX_VIDEO_SIZE", 20 * 1024 * 1024))  # 20MB
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory или redis (общий для реплик)
+    RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", 10000))  # Пользователей в памяти фильтра
     
     # ==================== НАСТРОЙКИ МОДЕРАЦИИ ====================
     AUTO_MODERATION = os.getenv("AUTO_MODERATION", "False").lower() == "true"
     MODERATION_TIMEOUT = int(os.getenv("MODERATION_TIMEOUT", 300))  # 5 минут
+    MODERATION_LEASE_TTL = int(os.getenv("MODERATION_LEASE_TTL", 120))  # закрепление сообщения за модератором, секунд
     MODERATION_QUEUE_LIMIT = int(os.getenv("MODERATION_QUEUE_LIMIT", 100))
     MESSAGE_EXPIRY_HOURS = int(os.getenv("MESSAGE_EXPIRY_HOURS", 24))
     
@@ -59,17 +64,44 @@ class Config:
     CACHE_TTL = int(os.getenv("CACHE_TTL", 300))  # 5 минут
     USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1000))
     MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", 500))
+    CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "auto")  # auto, msgpack или json
+    BAN_STATUS_CACHE_TTL = int(os.getenv("BAN_STATUS_CACHE_TTL", 60))  # Статус бана в памяти процесса
+    CHAT_ADMIN_CACHE_TTL = int(os.getenv("CHAT_ADMIN_CACHE_TTL", 600))  # Права бота в группах
+    REDIS_SCAN_COUNT = int(os.getenv("REDIS_SCAN_COUNT", 1000))  # ключей за один шаг SCAN
+    REDIS_DELETE_BATCH = int(os.getenv("REDIS_DELETE_BATCH", 500))  # ключей в одном UNLINK
+    REDIS_PIPELINE_BATCH = int(os.getenv("REDIS_PIPELINE_BATCH", 1000))  # ключей в одном MGET / pipeline
     
     # ==================== НАСТРОЙКИ УВЕДОМЛЕНИЙ ====================
     NOTIFICATIONS_ENABLED = os.getenv("NOTIFICATIONS_ENABLED", "True").lower() == "true"
     NOTIFY_ON_NEW_USER = os.getenv("NOTIFY_ON_NEW_USER", "True").lower() == "true"
     NOTIFY_ON_MODERATION = os.getenv("NOTIFY_ON_MODERATION", "True").lower() == "true"
     NOTIFY_ON_ERROR = os.getenv("NOTIFY_ON_ERROR", "True").lower() == "true"
+    NOTIFICATIONS_INBOX_SIZE = int(os.getenv("NOTIFICATIONS_INBOX_SIZE", 100))  # последних уведомлений на пользователя
+    ERROR_LOG_WINDOW = int(os.getenv("ERROR_LOG_WINDOW", 60))  # окно дедупликации одинаковых ошибок, секунд
+    ERROR_LOG_MAX_PER_MINUTE = int(os.getenv("ERROR_LOG_MAX_PER_MINUTE", 10))  # сообщений об ошибках в минуту
     
     # ==================== НАСТРОЙКИ ОЧЕРЕДЕЙ ====================
     QUEUE_PROCESSING_ENABLED = os.getenv("QUEUE_PROCESSING_ENABLED", "True").lower() == "true"
     QUEUE_PROCESSING_INTERVAL = int(os.getenv("QUEUE_PROCESSING_INTERVAL", 60))  # 60 секунд
+    QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", 4))  # параллельных обработчиков очереди задач
     MAX_QUEUE_RETRIES = int(os.getenv("MAX_QUEUE_RETRIES", 3))
+    QUEUE_VISIBILITY_TIMEOUT = int(os.getenv("QUEUE_VISIBILITY_TIMEOUT", 60))  # без подтверждения сообщение снова выдается через N секунд
+    
+    # ==================== ЛИМИТЫ ОТПРАВКИ TELEGRAM ====================
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))  # сообщений в секунду на бота
+    TELEGRAM_PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", 1))  # сообщений в секунду на чат
+    FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 10))  # одновременных отправок при рассылке
+    SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))  # повторов после 429
+    SEND_WORKERS = int(os.getenv("SEND_WORKERS", 4))  # воркеров планировщика отправки
+    LOG_DIGEST_ENABLED = os.getenv("LOG_DIGEST_ENABLED", "True").lower() == "true"  # сводки в лог-каналы
+    LOG_DIGEST_INTERVAL = float(os.getenv("LOG_DIGEST_INTERVAL", 30))  # секунд между сводками
+    LOG_DIGEST_MAX_ENTRIES = int(os.getenv("LOG_DIGEST_MAX_ENTRIES", 20))  # записей в одной сводке
+    
+    # ==================== НАСТРОЙКИ ЛОГА АУДИТА ====================
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 100))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 2))  # секунд
+    AUDIT_BUFFER_MAX_SIZE = int(os.getenv("AUDIT_BUFFER_MAX_SIZE", 10000))
+    AUDIT_BUFFER_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BUFFER_BLOCK_TIMEOUT", 0.5))  # секунд
     
     # ==================== НАСТРОЙКИ СИСТЕМЫ ====================
     DEBUG = os.getenv("DEBUG", "False").lower() == "true"
@@ -147,6 +179,12 @@ class Config:
             errors.append("DEFAULT_MUTE_DURATION не может быть отрицательным")
         if cls.DEFAULT_BAN_DURATION < 0:
             errors.append("DEFAULT_BAN_DURATION не может быть отрицательным")
+        if cls.MYSQL_POOL_SIZE <= 0:
+            errors.append("MYSQL_POOL_SIZE должен быть больше 0")
+        if cls.MYSQL_MAX_OVERFLOW < 0:
+            errors.append("MYSQL_MAX_OVERFLOW не может быть отрицательным")
+        if cls.RATE_LIMIT_BACKEND not in ("memory", "redis"):
+            errors.append("RATE_LIMIT_BACKEND должен быть memory или redis")
         
         if errors:
             raise ValueError(" | ".join(errors))
@@ -173,7 +211,9 @@ class Config:
             'port': cls.MYSQL_PORT,
             'user': cls.MYSQL_USER,
             'pool_size': cls.MYSQL_POOL_SIZE,
-            'max_overflow': cls.MYSQL_MAX_OVERFLOW
+            'max_overflow': cls.MYSQL_MAX_OVERFLOW,
+            'pool_recycle': cls.MYSQL_POOL_RECYCLE,
+            'pool_enabled': cls.MYSQL_POOL_ENABLED
         }
 
 # Создаем экземпляр конфигурации
@@ -1,33 +1,268 @@
 import mysql.connector
 from mysql.connector import Error
+import asyncio
+import functools
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import datetime
 import json
 
+from config import Config
+
 logger = logging.getLogger(__name__)
 
+class PoolTimeoutError(Error):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+class ConnectionPool:
+    """Пул соединений MySQL с overflow, recycle и проверкой здоровья"""
+    
+    def __init__(self, connect_args: Dict[str, Any], pool_size: int, max_overflow: int,
+                 pool_recycle: int, timeout: float = 30.0):
+        self.connect_args = connect_args
+        self.pool_size = max(1, pool_size)
+        self.max_overflow = max(0, max_overflow)
+        self.pool_recycle = pool_recycle
+        self.timeout = timeout
+        
+        # Свободные соединения: (connection, created_at)
+        self._idle: deque = deque()
+        self._cond = threading.Condition()
+        self._opened = 0
+        self._checked_out = 0
+        
+        # Метрики для подбора размера пула
+        self._checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._waiting = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._invalidated = 0
+    
+    def _create(self) -> Tuple[Any, float]:
+        connection = mysql.connector.connect(**self.connect_args)
+        return connection, time.monotonic()
+    
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+    
+    def _validate(self, entry: Tuple[Any, float]) -> Tuple[Any, float]:
+        """Проверить соединение перед выдачей: recycle по возрасту и ping"""
+        connection, created_at = entry
+        
+        if self.pool_recycle > 0 and time.monotonic() - created_at > self.pool_recycle:
+            self._close_quietly(connection)
+            self._recycled += 1
+            return self._create()
+        
+        if not connection.is_connected():
+            self._close_quietly(connection)
+            self._invalidated += 1
+            return self._create()
+        
+        return entry
+    
+    def checkout(self) -> Tuple[Any, float]:
+        """Получить соединение из пула"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._opened < self.pool_size + self.max_overflow:
+                        # Резервируем место, само соединение создаем вне блокировки
+                        self._opened += 1
+                        entry = None
+                        break
+                    
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            msg=f"Пул соединений исчерпан ({self._opened} открыто), ожидание {self.timeout}с"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            
+            waited = time.monotonic() - started
+            self._checkouts += 1
+            self._checked_out += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        
+        try:
+            return self._create() if entry is None else self._validate(entry)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+    
+    def checkin(self, entry: Tuple[Any, float], discard: bool = False):
+        """Вернуть соединение в пул"""
+        with self._cond:
+            self._checked_out -= 1
+            # Overflow-соединения закрываются сразу после использования
+            keep = not discard and len(self._idle) < self.pool_size
+            if keep:
+                self._idle.append(entry)
+            else:
+                self._opened -= 1
+            self._cond.notify()
+        
+        if not keep:
+            self._close_quietly(entry[0])
+    
+    def close(self):
+        """Закрыть все свободные соединения"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._opened -= len(idle)
+        
+        for connection, _ in idle:
+            self._close_quietly(connection)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Получить статистику занятости и ожидания пула"""
+        with self._cond:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'opened': self._opened,
+                'checked_out': self._checked_out,
+                'idle': len(self._idle),
+                'overflow': max(0, self._opened - self.pool_size),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'avg_wait_ms': round(self._total_wait / self._checkouts * 1000, 2) if self._checkouts else 0,
+                'max_wait_ms': round(self._max_wait * 1000, 2),
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'invalidated': self._invalidated
+            }
+
+class AsyncMySQLDatabase:
+    """Асинхронный интерфейс к MySQLDatabase с тем же набором методов.
+    
+    Запросы выполняются в выделенном пуле потоков размером с пул соединений,
+    каждый вызов получает свое соединение, поэтому медленный запрос не
+    останавливает event loop и остальные апдейты.
+    """
+    
+    def __init__(self, sync_db: Optional['MySQLDatabase'] = None, max_workers: Optional[int] = None):
+        self._sync_db = sync_db
+        self.max_workers = max_workers or (Config.MYSQL_POOL_SIZE + Config.MYSQL_MAX_OVERFLOW)
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @property
+    def sync_db(self) -> 'MySQLDatabase':
+        return self._sync_db if self._sync_db is not None else globals().get('db')
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mysql")
+        return self._executor
+    
+    async def run(self, func, *args, **kwargs):
+        """Выполнить блокирующую функцию в пуле потоков базы данных"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+    
+    def __getattr__(self, name: str):
+        if name.startswith('_') or name == 'get_cursor':
+            raise AttributeError(f"{type(self).__name__} не предоставляет {name}, используйте run()")
+        
+        attr = getattr(self.sync_db, name)
+        if not callable(attr):
+            return attr
+        
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+    
+    def close(self):
+        """Дождаться выполняющихся запросов и остановить пул потоков"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+# Асинхронный доступ к глобальному экземпляру db
+async_db = AsyncMySQLDatabase()
+
 class MySQLDatabase:
-    def __init__(self, host: str, user: str, password: str, database: str):
+    def __init__(self, host: str, user: str, password: str, database: str,
+                 port: int = Config.MYSQL_PORT,
+                 pooled: bool = Config.MYSQL_POOL_ENABLED,
+                 pool_size: int = Config.MYSQL_POOL_SIZE,
+                 max_overflow: int = Config.MYSQL_MAX_OVERFLOW,
+                 pool_recycle: int = Config.MYSQL_POOL_RECYCLE,
+                 pool_timeout: float = Config.MYSQL_POOL_TIMEOUT):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
+        self.port = port
         self.connection = None
+        self.pool: Optional[ConnectionPool] = None
+        
+        self.pooled = pooled
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        self.pool_timeout = pool_timeout
+    
+    def _connect_args(self) -> Dict[str, Any]:
+        return {
+            'host': self.host,
+            'user': self.user,
+            'password': self.password,
+            'database': self.database,
+            'port': self.port,
+            'charset': 'utf8mb4',
+            'collation': 'utf8mb4_unicode_ci',
+            'autocommit': True
+        }
         
     def connect(self):
-        """Установка соединения с MySQL"""
+        """Установка соединения с MySQL (или создание пула соединений)"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                charset='utf8mb4',
-                collation='utf8mb4_unicode_ci',
-                autocommit=True
-            )
+            if self.pooled:
+                if self.pool is None:
+                    self.pool = ConnectionPool(
+                        self._connect_args(),
+                        self.pool_size,
+                        self.max_overflow,
+                        self.pool_recycle,
+                        self.pool_timeout
+                    )
+                # Проверяем доступность базы одним соединением
+                entry = self.pool.checkout()
+                self.pool.checkin(entry)
+                logger.info(f"✅ Успешное подключение к MySQL (пул: {self.pool_size} + {self.max_overflow} overflow)")
+                return True
+            
+            self.connection = mysql.connector.connect(**self._connect_args())
             logger.info("✅ Успешное подключение к MySQL")
             return True
         except Error as e:
@@ -36,13 +271,39 @@ class MySQLDatabase:
     
     def disconnect(self):
         """Закрытие соединения"""
+        if self.pool:
+            self.pool.close()
+            logger.info("✅ Пул соединений MySQL закрыт")
         if self.connection and self.connection.is_connected():
             self.connection.close()
             logger.info("✅ Соединение с MySQL закрыто")
     
+    def is_connected(self) -> bool:
+        """Проверить доступность MySQL"""
+        if self.pool:
+            try:
+                with self.get_cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchall()
+                return True
+            except Error:
+                return False
+        return bool(self.connection and self.connection.is_connected())
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Получить статистику пула соединений"""
+        if self.pool:
+            return self.pool.get_stats()
+        return {'pooled': False, 'connected': bool(self.connection and self.connection.is_connected())}
+    
     @contextmanager
     def get_cursor(self):
         """Контекстный менеджер для работы с курсором"""
+        if self.pooled:
+            with self._pooled_cursor() as cursor:
+                yield cursor
+            return
+        
         cursor = None
         try:
             if not self.connection or not self.connection.is_connected():
@@ -59,6 +320,34 @@ class MySQLDatabase:
             if cursor:
                 cursor.close()
     
+    @contextmanager
+    def _pooled_cursor(self):
+        """Курсор на соединении, выданном из пула на время одного вызова"""
+        if self.pool is None:
+            self.connect()
+        
+        entry = self.pool.checkout()
+        connection = entry[0]
+        cursor = None
+        broken = False
+        try:
+            cursor = connection.cursor(dictionary=True)
+            yield cursor
+        except Error as e:
+            logger.error(f"❌ Ошибка MySQL: {e}")
+            try:
+                connection.rollback()
+            except Error:
+                broken = True
+            raise
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Error:
+                    broken = True
+            self.pool.checkin(entry, discard=broken)
+    
     def initialize_database(self):
         """Инициализация таблиц в базе данных"""
         tables = [
@@ -248,36 +537,25 @@ class MySQLDatabase:
             }
     
     def update_user_statistics(self, user_id: int, approved: bool, moderation_time: int):
-        """Обновить статистику пользователя"""
+        """Обновить статистику пользователя одним атомарным upsert"""
+        # Присваивания в ON DUPLICATE KEY UPDATE выполняются слева направо,
+        # поэтому среднее и процент считаются от уже увеличенных счетчиков
         with self.get_cursor() as cursor:
-            # Получаем текущую статистику
-            cursor.execute("SELECT * FROM user_statistics WHERE user_id = %s", (user_id,))
-            stats = cursor.fetchone()
-            
-            if stats:
-                total = stats['total_messages'] + 1
-                approved_count = stats['approved_messages'] + (1 if approved else 0)
-                rejected_count = stats['rejected_messages'] + (0 if approved else 1)
-                total_time = stats['total_moderation_time'] + moderation_time
-                avg_time = total_time / total if total > 0 else 0
-                success_rate = (approved_count / total * 100) if total > 0 else 0
-                
-                cursor.execute("""
-                    UPDATE user_statistics 
-                    SET total_messages = %s, approved_messages = %s, rejected_messages = %s,
-                        total_moderation_time = %s, avg_moderation_time = %s, success_rate = %s,
-                        last_activity = NOW(), updated_at = NOW()
-                    WHERE user_id = %s
-                """, (total, approved_count, rejected_count, total_time, avg_time, success_rate, user_id))
-            else:
-                success_rate = 100 if approved else 0
-                cursor.execute("""
-                    INSERT INTO user_statistics 
-                    (user_id, total_messages, approved_messages, rejected_messages, 
-                     total_moderation_time, avg_moderation_time, success_rate, last_activity)
-                    VALUES (%s, 1, %s, %s, %s, %s, %s, NOW())
-                """, (user_id, 1 if approved else 0, 0 if approved else 1, 
-                      moderation_time, moderation_time, success_rate))
+            cursor.execute("""
+                INSERT INTO user_statistics 
+                (user_id, total_messages, approved_messages, rejected_messages, 
+                 total_moderation_time, avg_moderation_time, success_rate, last_activity)
+                VALUES (%s, 1, %s, %s, %s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                    total_messages = total_messages + 1,
+                    approved_messages = approved_messages + VALUES(approved_messages),
+                    rejected_messages = rejected_messages + VALUES(rejected_messages),
+                    total_moderation_time = total_moderation_time + VALUES(total_moderation_time),
+                    avg_moderation_time = total_moderation_time / total_messages,
+                    success_rate = approved_messages / total_messages * 100,
+                    last_activity = NOW()
+            """, (user_id, 1 if approved else 0, 0 if approved else 1,
+                  moderation_time, moderation_time, 100 if approved else 0))
     
     # ==================== МЕТОДЫ ДЛЯ АНАЛИТИКИ МОДЕРАЦИИ ====================
     
@@ -291,32 +569,21 @@ class MySQLDatabase:
             return cursor.fetchone()
     
     def update_moderation_analytics(self, approved: bool, moderation_time: int):
-        """Обновить ежедневную аналитику модерации"""
+        """Обновить ежедневную аналитику модерации одним атомарным upsert"""
         date = datetime.datetime.now().strftime('%Y-%m-%d')
         
         with self.get_cursor() as cursor:
-            cursor.execute("SELECT * FROM moderation_analytics WHERE date = %s", (date,))
-            analytics = cursor.fetchone()
-            
-            if analytics:
-                total = analytics['total_messages'] + 1
-                approved_count = analytics['approved_count'] + (1 if approved else 0)
-                rejected_count = analytics['rejected_count'] + (0 if approved else 1)
-                total_time = analytics['avg_moderation_time'] * analytics['total_messages'] + moderation_time
-                avg_time = total_time / total
-                
-                cursor.execute("""
-                    UPDATE moderation_analytics 
-                    SET total_messages = %s, approved_count = %s, rejected_count = %s,
-                        avg_moderation_time = %s, updated_at = NOW()
-                    WHERE date = %s
-                """, (total, approved_count, rejected_count, avg_time, date))
-            else:
-                cursor.execute("""
-                    INSERT INTO moderation_analytics 
-                    (date, total_messages, approved_count, rejected_count, avg_moderation_time)
-                    VALUES (%s, 1, %s, %s, %s)
-                """, (date, 1 if approved else 0, 0 if approved else 1, moderation_time))
+            cursor.execute("""
+                INSERT INTO moderation_analytics 
+                (date, total_messages, approved_count, rejected_count, avg_moderation_time)
+                VALUES (%s, 1, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    avg_moderation_time = (avg_moderation_time * total_messages + VALUES(avg_moderation_time))
+                                          / (total_messages + 1),
+                    total_messages = total_messages + 1,
+                    approved_count = approved_count + VALUES(approved_count),
+                    rejected_count = rejected_count + VALUES(rejected_count)
+            """, (date, 1 if approved else 0, 0 if approved else 1, moderation_time))
     
     # ==================== МЕТОДЫ ДЛЯ РАСШИРЕННЫХ БАНОВ ====================
     
@@ -370,6 +637,26 @@ class MySQLDatabase:
                 VALUES (%s, %s, %s, %s, %s)
             """, (user_id, action_type, json.dumps(action_details), ip_address, user_agent))
     
+    def add_audit_logs_bulk(self, entries: List[Dict[str, Any]]) -> int:
+        """Добавить пачку записей в лог аудита одним многострочным INSERT"""
+        if not entries:
+            return 0
+        
+        rows = [
+            (entry['user_id'], entry['action_type'], json.dumps(entry['action_details']),
+             entry.get('ip_address'), entry.get('user_agent'), entry['created_at'])
+            for entry in entries
+        ]
+        
+        with self.get_cursor() as cursor:
+            # executemany для INSERT склеивается коннектором в один запрос
+            cursor.executemany("""
+                INSERT INTO audit_logs 
+                (user_id, action_type, action_details, ip_address, user_agent, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, rows)
+            return len(rows)
+    
     def get_audit_logs(self, user_id: int = None, limit: int = 100) -> List[Dict[str, Any]]:
         """Получить логи аудита"""
         with self.get_cursor() as cursor:
@@ -419,34 +706,30 @@ class MySQLDatabase:
             return result or {'approved': 0, 'rejected': 0, 'reviewed': 0, 'warnings': 0, 'avg_moderation_time': 0, 'efficiency': 0}
     
     def update_moderator_stats(self, moderator_id: int, action: str, moderation_time: int = 0):
+        """Обновить статистику модератора одним атомарным upsert"""
+        # Среднее время пересчитывается до увеличения reviewed,
+        # эффективность (процент одобренных) — после
         with self.get_cursor() as cursor:
-            cursor.execute("SELECT * FROM moderator_stats WHERE moderator_id = %s", (moderator_id,))
-            stats = cursor.fetchone()
-            
-            if not stats:
-                cursor.execute(
-                    "INSERT INTO moderator_stats (moderator_id, approved, rejected, reviewed, warnings) VALUES (%s, 0, 0, 0, 0)",
-                    (moderator_id,)
-                )
-                stats = {'approved': 0, 'rejected': 0, 'reviewed': 0, 'warnings': 0, 'avg_moderation_time': 0}
-            
-            reviewed = stats['reviewed'] + 1
-            approved = stats['approved'] + (1 if action == 'approved' else 0)
-            rejected = stats['rejected'] + (1 if action == 'rejected' else 0)
-            warnings = stats['warnings'] + (1 if action == 'warning' else 0)
-            
-            # Обновляем среднее время модерации
-            total_time = stats['avg_moderation_time'] * stats['reviewed'] + moderation_time
-            avg_time = total_time / reviewed if reviewed > 0 else 0
-            
-            # Эффективность (процент одобренных от всех рассмотренных)
-            efficiency = (approved / reviewed * 100) if reviewed > 0 else 0
-            
             cursor.execute("""
-                UPDATE moderator_stats 
-                SET approved = %s, rejected = %s, reviewed = %s, warnings = %s,
-                    avg_moderation_time = %s, efficiency = %s, updated_at = NOW()
-                WHERE moderator_id = %s
-            """, (approved, rejected, reviewed, warnings, avg_time, efficiency, moderator_id))
+                INSERT INTO moderator_stats 
+                (moderator_id, approved, rejected, reviewed, warnings, avg_moderation_time, efficiency)
+                VALUES (%s, %s, %s, 1, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    avg_moderation_time = (avg_moderation_time * reviewed + VALUES(avg_moderation_time))
+                                          / (reviewed + 1),
+                    reviewed = reviewed + 1,
+                    approved = approved + VALUES(approved),
+                    rejected = rejected + VALUES(rejected),
+                    warnings = warnings + VALUES(warnings),
+                    efficiency = approved / reviewed * 100,
+                    updated_at = NOW()
+            """, (
+                moderator_id,
+                1 if action == 'approved' else 0,
+                1 if action == 'rejected' else 0,
+                1 if action == 'warning' else 0,
+                moderation_time,
+                100 if action == 'approved' else 0
+            ))
     
     def add_message(self, message_data: Dict[s
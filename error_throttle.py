@@ -0,0 +1,116 @@
+import os
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+@dataclass
+class _ErrorWindow:
+    started: float
+    context: str
+    error: str
+    count: int = 1
+    suppressed: int = 0
+
+@dataclass
+class ErrorSummary:
+    """Ошибка, повторы которой были подавлены в окне"""
+    fingerprint: str
+    context: str
+    error: str
+    count: int
+    suppressed: int
+
+class ErrorThrottle:
+    """Дедупликация и ограничение частоты сообщений об ошибках.
+
+    Одинаковые ошибки определяются по отпечатку (тип исключения + место, где
+    оно возникло). Первая ошибка с отпечатком в окне window секунд
+    публикуется сразу, повторы только считаются и попадают в сводку после
+    закрытия окна. Всего публикаций — не больше max_per_minute в минуту.
+    """
+
+    def __init__(self, window: float = Config.ERROR_LOG_WINDOW,
+                 max_per_minute: int = Config.ERROR_LOG_MAX_PER_MINUTE):
+        self.window = window
+        self.max_per_minute = max(1, max_per_minute)
+        self._windows: Dict[str, _ErrorWindow] = {}
+        self._summaries: List[ErrorSummary] = []
+        self._posts: deque = deque()
+        self._stats = {'posted': 0, 'suppressed': 0, 'capped': 0}
+
+    @staticmethod
+    def fingerprint(exc: Optional[BaseException] = None, context: str = "", error: str = "") -> str:
+        """Отпечаток ошибки: тип исключения и последний кадр traceback"""
+        if exc is None:
+            return f"{context}: {error[:100]}"
+
+        frames = traceback.extract_tb(exc.__traceback__) if exc.__traceback__ else []
+        if not frames:
+            return f"{type(exc).__name__} ({context})"
+        frame = frames[-1]
+        return f"{type(exc).__name__} @ {os.path.basename(frame.filename)}:{frame.lineno} ({frame.name})"
+
+    def _take_post_slot(self, now: float) -> bool:
+        while self._posts and now - self._posts[0] >= 60:
+            self._posts.popleft()
+        if len(self._posts) >= self.max_per_minute:
+            return False
+        self._posts.append(now)
+        return True
+
+    def _expire(self, now: float):
+        for fingerprint, window in list(self._windows.items()):
+            if now - window.started >= self.window:
+                del self._windows[fingerprint]
+                if window.suppressed:
+                    self._summaries.append(ErrorSummary(
+                        fingerprint, window.context, window.error, window.count, window.suppressed
+                    ))
+
+    def hit(self, fingerprint: str, context: str, error: str) -> bool:
+        """Учесть ошибку; True — ее нужно опубликовать сейчас"""
+        now = time.monotonic()
+        self._expire(now)
+
+        window = self._windows.get(fingerprint)
+        if window is not None:
+            window.count += 1
+            window.suppressed += 1
+            self._stats['suppressed'] += 1
+            return False
+
+        if not self._take_post_slot(now):
+            # Лимит публикаций исчерпан: ошибка попадет в сводку
+            self._windows[fingerprint] = _ErrorWindow(now, context, error, suppressed=1)
+            self._stats['capped'] += 1
+            return False
+
+        self._windows[fingerprint] = _ErrorWindow(now, context, error)
+        self._stats['posted'] += 1
+        return True
+
+    def pop_summaries(self) -> List[ErrorSummary]:
+        """Забрать сводки по закрытым окнам, если лимит публикаций позволяет"""
+        now = time.monotonic()
+        self._expire(now)
+        if not self._summaries or not self._take_post_slot(now):
+            return []
+
+        summaries, self._summaries = self._summaries, []
+        self._stats['posted'] += 1
+        return summaries
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика подавления ошибок"""
+        return {
+            'open_windows': len(self._windows),
+            'pending_summaries': len(self._summaries),
+            **self._stats
+        }
+
+# Общий ограничитель для ERROR_CHANNEL
+error_throttle = ErrorThrottle()
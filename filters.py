@@ -1,9 +1,43 @@
 from aiogram.filters import BaseFilter
 from aiogram.types import Message, ChatType, CallbackQuery
 from typing import Union, Optional
+from collections import OrderedDict, deque
 import asyncio
 from config import Config
-from storage import get_user_level
+from storage import async_get_user_level, async_hit_rate_limit
+from middlewares import PermissionContext
+from local_cache import LocalTTLCache
+
+# Статус бота в чатах: chat_id -> является ли бот администратором.
+# Обновляется из my_chat_member, TTL страхует от пропущенных апдейтов
+bot_admin_cache = LocalTTLCache(Config.USER_CACHE_SIZE, Config.CHAT_ADMIN_CACHE_TTL)
+ADMIN_STATUSES = ('administrator', 'creator')
+
+async def resolve_user_level(user_id: int, permissions: Optional[PermissionContext] = None) -> int:
+    """Уровень из контекста прав апдейта, либо запрос, если middleware не отработал"""
+    if permissions is not None and permissions.user_id == user_id:
+        return permissions.level
+    return await async_get_user_level(user_id)
+
+async def is_bot_admin(bot, chat_id: int) -> bool:
+    """Является ли бот администратором чата (с кэшированием)"""
+    cached = bot_admin_cache.get(chat_id)
+    if cached is not None:
+        return cached
+    
+    try:
+        chat_member = await bot.get_chat_member(chat_id, bot.id)
+    except Exception:
+        # Ошибку не кэшируем: следующая проверка повторит запрос
+        return False
+    
+    is_admin = chat_member.status in ADMIN_STATUSES
+    bot_admin_cache.set(chat_id, is_admin)
+    return is_admin
+
+def update_bot_admin_status(chat_id: int, status: str):
+    """Обновить кэш по апдейту my_chat_member"""
+    bot_admin_cache.set(chat_id, status in ADMIN_STATUSES)
 
 class IsPrivateChat(BaseFilter):
     """Фильтр для проверки приватного чата"""
@@ -12,9 +46,9 @@ class IsPrivateChat(BaseFilter):
 
 class IsOwnerOrPrivate(BaseFilter):
     """Фильтр: либо владелец, либо приватный чат"""
-    async def __call__(self, message: Message) -> bool:
+    async def __call__(self, message: Message, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = message.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         
         # Владелец может писать везде
         if user_level == 3:  # Владелец
@@ -25,36 +59,29 @@ class IsOwnerOrPrivate(BaseFilter):
 
 class IsOwnerAndAdmin(BaseFilter):
     """Фильтр: владелец и бот является администратором"""
-    async def __call__(self, message: Message) -> bool:
+    async def __call__(self, message: Message, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = message.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         
         # Только владелец
         if user_level != 3:
             return False
         
         # Проверяем, что бот является администратором в этом чате
-        try:
-            chat_member = await message.bot.get_chat_member(
-                message.chat.id, 
-                message.bot.id
-            )
-            return chat_member.status in ['administrator', 'creator']
-        except:
-            return False
+        return await is_bot_admin(message.bot, message.chat.id)
 
 class IsOwnerAnywhere(BaseFilter):
     """Фильтр: владелец в любом чате"""
-    async def __call__(self, message: Message) -> bool:
+    async def __call__(self, message: Message, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = message.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         return user_level == 3  # Только владелец
 
 class IsPrivateOrOwnerAdmin(BaseFilter):
     """Фильтр: либо приватный чат, либо владелец с правами администратора"""
-    async def __call__(self, message: Message) -> bool:
+    async def __call__(self, message: Message, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = message.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         
         # Все пользователи в личных сообщениях
         if message.chat.type == ChatType.PRIVATE:
@@ -62,67 +89,89 @@ class IsPrivateOrOwnerAdmin(BaseFilter):
         
         # Владелец с правами администратора
         if user_level == 3:
-            try:
-                chat_member = await message.bot.get_chat_member(
-                    message.chat.id, 
-                    message.bot.id
-                )
-                return chat_member.status in ['administrator', 'creator']
-            except:
-                return False
+            return await is_bot_admin(message.bot, message.chat.id)
         
         return False
 
 class IsModerator(BaseFilter):
     """Фильтр: модератор или выше"""
-    async def __call__(self, message: Message) -> bool:
+    async def __call__(self, message: Message, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = message.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         return user_level >= 1  # Модератор и выше
 
 class IsTechModerator(BaseFilter):
     """Фильтр: технический модератор или выше"""
-    async def ____call__(self, message: Message) -> bool:
+    async def __call__(self, message: Message, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = message.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         return user_level >= 2  # Технический модератор и выше
 
 class IsOwner(BaseFilter):
     """Фильтр: только владелец"""
-    async def __call__(self, message: Message) -> bool:
+    async def __call__(self, message: Message, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = message.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         return user_level == 3  # Только владелец
 
 class RateLimitFilter(BaseFilter):
-    def __init__(self, limit: int = 5, period: int = 60):
+    """Не более limit сообщений за period секунд (скользящее окно).
+
+    backend="memory": на пользователя хранится кольцевой буфер из limit отметок,
+    неактивные пользователи вытесняются. backend="redis": общий лимит для всех
+    экземпляров бота через RedisStorage.hit_rate_limit.
+    """
+    def __init__(self, limit: int = 5, period: int = 60, backend: Optional[str] = None,
+                 max_users: int = Config.RATE_LIMIT_MAX_USERS):
         self.limit = limit
         self.period = period
-        self.user_messages = {}
+        self.backend = backend or Config.RATE_LIMIT_BACKEND
+        self.max_users = max(1, max_users)
+        # Порядок — по последней активности: в начале самые давние пользователи
+        self.user_messages: OrderedDict[int, deque] = OrderedDict()
 
     async def __call__(self, message: Message) -> bool:
         user_id = message.from_user.id
-        now = asyncio.get_event_loop().time()
         
-        if user_id not in self.user_messages:
-            self.user_messages[user_id] = []
+        if self.backend == "redis":
+            result = await async_hit_rate_limit(f"user:{user_id}", self.limit, self.period)
+            allowed = result['allowed']
+        else:
+            allowed = self._hit_memory(user_id, asyncio.get_event_loop().time())
         
-        # Удаляем старые сообщения
-        self.user_messages[user_id] = [
-            ts for ts in self.user_messages[user_id] 
-            if now - ts < self.period
-        ]
-        
-        if len(self.user_messages[user_id]) >= self.limit:
+        if not allowed:
             await message.answer("🚫 Слишком много запросов. Подождите немного.")
             return False
+        return True
+
+    def _hit_memory(self, user_id: int, now: float) -> bool:
+        self._evict(now)
+        
+        timestamps = self.user_messages.get(user_id)
+        if timestamps is None:
+            timestamps = self.user_messages[user_id] = deque(maxlen=self.limit)
+        else:
+            self.user_messages.move_to_end(user_id)
+        
+        # Буфер полон и самая старая отметка еще в окне — лимит исчерпан
+        if len(timestamps) == self.limit and now - timestamps[0] < self.period:
+            return False
         
-        self.user_messages[user_id].append(now)
+        timestamps.append(now)
         return True
 
+    def _evict(self, now: float):
+        """Убрать пользователей, чьи отметки вышли из окна, и лишних сверх max_users"""
+        user_messages = self.user_messages
+        while user_messages:
+            timestamps = user_messages[next(iter(user_messages))]
+            if len(user_messages) < self.max_users and timestamps and now - timestamps[-1] < self.period:
+                break
+            user_messages.popitem(last=False)
+
 class CallbackOwnerFilter(BaseFilter):
     """Фильтр для callback'ов: только владелец"""
-    async def __call__(self, callback: CallbackQuery) -> bool:
+    async def __call__(self, callback: CallbackQuery, permissions: Optional[PermissionContext] = None) -> bool:
         user_id = callback.from_user.id
-        user_level = get_user_level(user_id)
+        user_level = await resolve_user_level(user_id, permissions)
         return user_level == 3
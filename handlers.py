@@ -1,6 +1,9 @@
 import logging
 import datetime
 import traceback
+import functools
+import inspect
+from typing import Optional
 from aiogram import types, F
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
@@ -8,12 +11,19 @@ from aiogram.exceptions import TelegramForbiddenError
 
 from config import Config
 from storage import (
-    add_message, get_message, delete_message, user_levels, 
-    update_moderator_stats, add_warning, add_punishment, can_send_message,
-    get_user_level, update_message_status
+    user_levels, add_warning, add_punishment, get_moderators,
+    async_add_message, async_get_message, async_delete_message,
+    async_update_moderator_stats, async_can_send_message,
+    async_get_user_level, async_update_message_status,
+    async_claim_message, async_release_message_claim, async_get_message_claim,
+    async_remember_deliveries, async_get_deliveries, async_forget_deliveries
 )
-from keyboards import create_moderation_keyboard
+from keyboards import create_moderation_keyboard, create_claimed_keyboard, create_locked_keyboard
 from commands import get_cancel_keyboard, get_start_keyboard, check_command_access
+from middlewares import PermissionContext
+from filters import bot_admin_cache, update_bot_admin_status
+from outbound import fan_out, send_scheduler, log_digest, LANE_USER, LANE_CHANNEL
+from error_throttle import error_throttle
 
 logger = logging.getLogger(__name__)
 
@@ -21,12 +31,20 @@ class PunishmentStates(StatesGroup):
     waiting_for_reason = State()
 
 def error_handler(func):
+    # aiogram передает обертке с **kwargs все данные апдейта (state, permissions, ...),
+    # поэтому отдаем функции только те аргументы, которые она объявила
+    parameters = inspect.signature(func).parameters
+    accepts_any = any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+    
+    @functools.wraps(func)
     async def wrapper(*args, **kwargs):
+        if not accepts_any:
+            kwargs = {name: value for name, value in kwargs.items() if name in parameters}
         try:
             return await func(*args, **kwargs)
         except Exception as e:
             logger.error(f"Error in {func.__name__}: {e}\n{traceback.format_exc()}")
-            await send_error_log(f"Error in {func.__name__}", str(e), traceback.format_exc())
+            await send_error_log(f"Error in {func.__name__}", str(e), traceback.format_exc(), exc=e)
             
             try:
                 message = None
@@ -45,20 +63,46 @@ def error_handler(func):
             
     return wrapper
 
-async def send_error_log(context: str, error: str, traceback_info: str = ""):
+async def send_error_log(context: str, error: str, traceback_info: str = "", exc: Optional[BaseException] = None):
     try:
+        # Повторы одной ошибки не публикуются, а попадают в сводку
+        fingerprint = error_throttle.fingerprint(exc, context, error)
+        if not error_throttle.hit(fingerprint, context, error):
+            return
+        
+        if exc is not None and not traceback_info and exc.__traceback__:
+            traceback_info = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        
         error_message = f"🚨 ОШИБКА: {context}\n\n"
         error_message += f"❌ {error}\n\n"
+        error_message += f"🔖 {fingerprint}\n"
         error_message += f"⏰ {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         
         if traceback_info:
             traceback_preview = traceback_info[:1000] + "..." if len(traceback_info) > 1000 else traceback_info
             error_message += f"\n\n🔍 Traceback:\n{traceback_preview}"
         
-        await types.Bot.get_current().send_message(Config.ERROR_CHANNEL, error_message)
+        send_scheduler.log(Config.ERROR_CHANNEL, error_message)
     except Exception as e:
         logger.error(f"Failed to send error log: {e}")
 
+async def flush_error_summaries():
+    """Опубликовать сводку подавленных повторов ошибок"""
+    try:
+        summaries = error_throttle.pop_summaries()
+        if not summaries:
+            return
+        
+        summary_message = f"🔁 Повторы ошибок за последние {error_throttle.window}с\n\n"
+        for summary in summaries:
+            summary_message += f"×{summary.count} {summary.context}: {summary.error[:200]}\n"
+            summary_message += f"🔖 {summary.fingerprint}\n\n"
+        summary_message += f"⏰ {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        
+        send_scheduler.log(Config.ERROR_CHANNEL, summary_message[:4096])
+    except Exception as e:
+        logger.error(f"Failed to send error summary: {e}")
+
 @error_handler
 async def handle_permission_error(event: types.ErrorEvent):
     """Обработчик ошибок прав доступа"""
@@ -66,6 +110,7 @@ async def handle_permission_error(event: types.ErrorEvent):
         # Бот не имеет прав в этом чате
         try:
             if hasattr(event.update, 'message') and event.update.message:
+                bot_admin_cache.invalidate(event.update.message.chat.id)
                 await event.update.message.answer(
                     "❌ У меня нет прав администратора в этом чате. "
                     "Пожалуйста, предоставьте необходимые права или используйте команды в личных сообщениях."
@@ -75,6 +120,12 @@ async def handle_permission_error(event: types.ErrorEvent):
         return True
     return False
 
+async def handle_my_chat_member(update: types.ChatMemberUpdated):
+    """Изменение прав бота в чате: обновляем кэш статуса администратора"""
+    status = update.new_chat_member.status
+    update_bot_admin_status(update.chat.id, status)
+    logger.info(f"🔄 Статус бота в чате {update.chat.id}: {status}")
+
 @error_handler
 async def send_moderation_log(moderator_username: str, moderator_id: int, message_content: str, message_id: int, user_username: str, approved: bool):
     try:
@@ -90,7 +141,7 @@ async def send_moderation_log(moderator_username: str, moderator_id: int, messag
         log_message += f"📊 Статус: {status_text}\n"
         log_message += f"⏰ {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         
-        await types.Bot.get_current().send_message(Config.LOG_MODERATION_CHANNEL, log_message)
+        log_digest.add(Config.LOG_MODERATION_CHANNEL, log_message)
         logger.info(f"Moderation log: {status_text} by @{moderator_username} for message {message_id}")
     except Exception as e:
         logger.error(f"Failed to send moderation log: {e}")
@@ -106,7 +157,7 @@ async def send_punishment_log(moderator_username: str, moderator_id: int, target
         log_message += f"Причина нарушения: {reason}\n"
         log_message += f"⏰ {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         
-        await types.Bot.get_current().send_message(Config.LOG_PUNISHMENT_CHANNEL, log_message)
+        log_digest.add(Config.LOG_PUNISHMENT_CHANNEL, log_message)
         logger.info(f"Punishment: {punishment_type} by @{moderator_username} for {target_id}")
     except Exception as e:
         logger.error(f"Failed to send punishment log: {e}")
@@ -129,9 +180,15 @@ async def send_to_owner_channel(message: types.Message, message_id: int, content
         
         msg = None
         if content_type == "text":
-            msg = await message.bot.send_message(Config.OWNER_CHANNEL, owner_text)
+            msg = await send_scheduler.submit(
+                LANE_CHANNEL, Config.OWNER_CHANNEL,
+                lambda: message.bot.send_message(Config.OWNER_CHANNEL, owner_text)
+            )
         elif content_type == "photo":
-            msg = await message.bot.send_photo(Config.OWNER_CHANNEL, message.photo[-1].file_id, caption=owner_text)
+            msg = await send_scheduler.submit(
+                LANE_CHANNEL, Config.OWNER_CHANNEL,
+                lambda: message.bot.send_photo(Config.OWNER_CHANNEL, message.photo[-1].file_id, caption=owner_text)
+            )
         
         return msg.message_id if msg else None
         
@@ -145,34 +202,37 @@ async def update_owner_channel_message(message_id: int, approved: bool, owner_me
         status_emoji = "✅" if approved else "❌"
         
         if owner_message_id:
+            # Правка выполняется воркером планировщика вне контекста апдейта,
+            # поэтому бот берется заранее
+            bot = send_scheduler.bot or types.Bot.get_current()
             try:
-                current_message = await types.Bot.get_current().get_message(Config.OWNER_CHANNEL, owner_message_id)
+                current_message = await bot.get_message(Config.OWNER_CHANNEL, owner_message_id)
                 current_text = current_message.text or current_message.caption or ""
                 
                 updated_text = f"{status_emoji} {current_text}"
                 
                 if current_message.text:
-                    await types.Bot.get_current().edit_message_text(
+                    await send_scheduler.submit(LANE_CHANNEL, Config.OWNER_CHANNEL, lambda: bot.edit_message_text(
                         chat_id=Config.OWNER_CHANNEL,
                         message_id=owner_message_id,
                         text=updated_text
-                    )
+                    ))
                 else:
-                    await types.Bot.get_current().edit_message_caption(
+                    await send_scheduler.submit(LANE_CHANNEL, Config.OWNER_CHANNEL, lambda: bot.edit_message_caption(
                         chat_id=Config.OWNER_CHANNEL,
                         message_id=owner_message_id,
                         caption=updated_text
-                    )
+                    ))
                     
             except Exception as e:
                 logger.error(f"Ошибка редактирования сообщения: {e}")
-                await types.Bot.get_current().send_message(
-                    Config.OWNER_CHANNEL,
+                await send_scheduler.send_message(
+                    LANE_CHANNEL, Config.OWNER_CHANNEL,
                     f"{status_emoji} Сообщение ID: {message_id} {'одобрено' if approved else 'отклонено'}"
                 )
         else:
-            await types.Bot.get_current().send_message(
-                Config.OWNER_CHANNEL,
+            await send_scheduler.send_message(
+                LANE_CHANNEL, Config.OWNER_CHANNEL,
                 f"{status_emoji} Сообщение ID: {message_id} {'одобрено' if approved else 'отклонено'}"
             )
         
@@ -180,58 +240,62 @@ async def update_owner_channel_message(message_id: int, approved: bool, owner_me
         logger.error(f"Ошибка обновления канала владельца: {e}")
 
 @error_handler
-async def send_to_moderator(message: types.Message, message_id: int, content_type: str):
+async def send_to_moderator(message: types.Message, message_id: int, content_type: str,
+                            permissions: Optional[PermissionContext] = None):
     try:
-        if not await check_command_access(message):
+        if not await check_command_access(message, permissions):
             return
         
-        if not can_send_message(message.from_user.id):
+        if not await async_can_send_message(message.from_user.id):
             await message.answer("❌ Слишком много сообщений. Подождите немного.", reply_markup=get_cancel_keyboard())
             return
         
-        moderators = [uid for uid, level in user_levels.items() if level >= 1]
+        moderators = get_moderators()
         
         if not moderators:
             await message.answer("❌ Нет активных модераторов для проверки")
             return
         
-        success = False
-        for moderator_id in moderators:
-            try:
-                if content_type == "text":
-                    if len(message.text) > Config.MAX_MESSAGE_LENGTH:
-                        mod_text = f"📨 Сообщение для модерации ({len(message.text)} символов):\n\n"
-                        mod_text += f"{message.text[:500]}..."
-                    else:
-                        mod_text = f"📨 Сообщение для модерации:\n\n{message.text}"
-                    
-                    await message.bot.send_message(
-                        moderator_id, 
-                        mod_text,
-                        reply_markup=create_moderation_keyboard(message_id)
-                    )
-                    success = True
-                
-                elif content_type == "photo":
-                    await message.bot.send_photo(
-                        moderator_id, 
-                        message.photo[-1].file_id,
-                        caption=message.caption or "",
-                        reply_markup=create_moderation_keyboard(message_id)
-                    )
-                    success = True
-                    
-            except Exception as e:
-                logger.warning(f"Не удалось отправить модератору {moderator_id}: {e}")
+        if content_type == "text":
+            if len(message.text) > Config.MAX_MESSAGE_LENGTH:
+                mod_text = f"📨 Сообщение для модерации ({len(message.text)} символов):\n\n"
+                mod_text += f"{message.text[:500]}..."
+            else:
+                mod_text = f"📨 Сообщение для модерации:\n\n{message.text}"
+        
+        async def deliver(moderator_id: int):
+            if content_type == "text":
+                return await message.bot.send_message(
+                    moderator_id, 
+                    mod_text,
+                    reply_markup=create_moderation_keyboard(message_id)
+                )
+            if content_type == "photo":
+                return await message.bot.send_photo(
+                    moderator_id, 
+                    message.photo[-1].file_id,
+                    caption=message.caption or "",
+                    reply_markup=create_moderation_keyboard(message_id)
+                )
+            # Видео, голосовые, кружки, стикеры и документы
+            return await message.copy_to(moderator_id, reply_markup=create_moderation_keyboard(message_id))
+        
+        # Параллельно всем модераторам с учетом лимитов Telegram
+        delivery = await fan_out(moderators, deliver, label=f"сообщение {message_id} модераторам")
         
-        if not success:
+        if not delivery.success:
             await message.answer("❌ Не удалось отправить сообщение на модерацию. Попробуйте позже.", reply_markup=get_cancel_keyboard())
             return
         
-        user_level = get_user_level(message.from_user.id)
+        # Копии у модераторов нужны, чтобы менять их клавиатуры при закреплении
+        await async_remember_deliveries(message_id, {
+            moderator_id: sent.message_id for moderator_id, sent in delivery.delivered.items()
+        })
+        
+        user_level = permissions.level if permissions else await async_get_user_level(message.from_user.id)
         if user_level == 0:
             owner_message_id = await send_to_owner_channel(message, message_id, content_type)
-            message_data = get_message(message_id)
+            message_data = await async_get_message(message_id)
             if message_data and owner_message_id:
                 message_data['owner_message_id'] = owner_message_id
         
@@ -242,12 +306,12 @@ async def send_to_moderator(message: types.Message, message_id: int, content_typ
         await message.answer("❌ Произошла ошибка. Попробуйте позже.", reply_markup=get_cancel_keyboard())
 
 @error_handler
-async def handle_text_message(message: types.Message):
+async def handle_text_message(message: types.Message, permissions: Optional[PermissionContext] = None):
     from commands import handle_buttons
     if await handle_buttons(message):
         return
     
-    if not await check_command_access(message):
+    if not await check_command_access(message, permissions):
         return
     
     if len(message.text) > Config.MAX_MESSAGE_LENGTH:
@@ -255,7 +319,7 @@ async def handle_text_message(message: types.Message):
         return
     
     user_id = message.from_user.id
-    user_level = get_user_level(user_id)
+    user_level = permissions.level if permissions else await async_get_user_level(user_id)
     
     message_data = {
         'user_id': user_id,
@@ -265,20 +329,20 @@ async def handle_text_message(message: types.Message):
         'level': user_level
     }
     
-    message_id = add_message(message_data)
-    await send_to_moderator(message, message_id, "text")
+    message_id = await async_add_message(message_data)
+    await send_to_moderator(message, message_id, "text", permissions)
 
 @error_handler
-async def handle_photo_message(message: types.Message):
+async def handle_photo_message(message: types.Message, permissions: Optional[PermissionContext] = None):
     from commands import handle_buttons
     if await handle_buttons(message):
         return
     
-    if not await check_command_access(message):
+    if not await check_command_access(message, permissions):
         return
     
     user_id = message.from_user.id
-    user_level = get_user_level(user_id)
+    user_level = permissions.level if permissions else await async_get_user_level(user_id)
     
     message_data = {
         'user_id': user_id,
@@ -289,20 +353,20 @@ async def handle_photo_message(message: types.Message):
         'level': user_level
     }
     
-    message_id = add_message(message_data)
-    await send_to_moderator(message, message_id, "photo")
+    message_id = await async_add_message(message_data)
+    await send_to_moderator(message, message_id, "photo", permissions)
 
 @error_handler
-async def handle_video_message(message: types.Message):
+async def handle_video_message(message: types.Message, permissions: Optional[PermissionContext] = None):
     from commands import handle_buttons
     if await handle_buttons(message):
         return
     
-    if not await check_command_access(message):
+    if not await check_command_access(message, permissions):
         return
     
     user_id = message.from_user.id
-    user_level = get_user_level(user_id)
+    user_level = permissions.level if permissions else await async_get_user_level(user_id)
     
     message_data = {
         'user_id': user_id,
@@ -313,20 +377,20 @@ async def handle_video_message(message: types.Message):
         'level': user_level
     }
     
-    message_id = add_message(message_data)
-    await send_to_moderator(message, message_id, "video")
+    message_id = await async_add_message(message_data)
+    await send_to_moderator(message, message_id, "video", permissions)
 
 @error_handler
-async def handle_voice_message(message: types.Message):
+async def handle_voice_message(message: types.Message, permissions: Optional[PermissionContext] = None):
     from commands import handle_buttons
     if await handle_buttons(message):
         return
     
-    if not await check_command_access(message):
+    if not await check_command_access(message, permissions):
         return
     
     user_id = message.from_user.id
-    user_level = get_user_level(user_id)
+    user_level = permissions.level if permissions else await async_get_user_level(user_id)
     
     message_data = {
         'user_id': user_id,
@@ -336,20 +400,20 @@ async def handle_voice_message(message: types.Message):
         'level': user_level
     }
     
-    message_id = add_message(message_data)
-    await send_to_moderator(message, message_id, "voice")
+    message_id = await async_add_message(message_data)
+    await send_to_moderator(message, message_id, "voice", permissions)
 
 @error_handler
-async def handle_video_note_message(message: types.Message):
+async def handle_video_note_message(message: types.Message, permissions: Optional[PermissionContext] = None):
     from commands import handle_buttons
     if await handle_buttons(message):
         return
     
-    if not await check_command_access(message):
+    if not await check_command_access(message, permissions):
         return
     
     user_id = message.from_user.id
-    user_level = get_user_level(user_id)
+    user_level = permissions.level if permissions else await async_get_user_level(user_id)
     
     message_data = {
         'user_id': user_id,
@@ -359,20 +423,20 @@ async def handle_video_note_message(message: types.Message):
         'level': user_level
     }
     
-    message_id = add_message(message_data)
-    await send_to_moderator(message, message_id, "video_note")
+    message_id = await async_add_message(message_data)
+    await send_to_moderator(message, message_id, "video_note", permissions)
 
 @error_handler
-async def handle_sticker_message(message: types.Message):
+async def handle_sticker_message(message: types.Message, permissions: Optional[PermissionContext] = None):
     from commands import handle_buttons
     if await handle_buttons(message):
         return
     
-    if not await check_command_access(message):
+    if not await check_command_access(message, permissions):
         return
     
     user_id = message.from_user.id
-    user_level = get_user_level(user_id)
+    user_level = permissions.level if permissions else await async_get_user_level(user_id)
     
     message_data = {
         'user_id': user_id,
@@ -383,20 +447,20 @@ async def handle_sticker_message(message: types.Message):
         'level': user_level
     }
     
-    message_id = add_message(message_data)
-    await send_to_moderator(message, message_id, "sticker")
+    message_id = await async_add_message(message_data)
+    await send_to_moderator(message, message_id, "sticker", permissions)
 
 @error_handler
-async def handle_document_message(message: types.Message):
+async def handle_document_message(message: types.Message, permissions: Optional[PermissionContext] = None):
     from commands import handle_buttons
     if await handle_buttons(message):
         return
     
-    if not await check_command_access(message):
+    if not await check_command_access(message, permissions):
         return
     
     user_id = message.from_user.id
-    user_level = get_user_level(user_id)
+    user_level = permissions.level if permissions else await async_get_user_level(user_id)
     
     message_data = {
         'user_id': user_id,
@@ -408,22 +472,22 @@ async def handle_document_message(message: types.Message):
         'level': user_level
     }
     
-    message_id = add_message(message_data)
-    await send_to_moderator(message, message_id, "document")
+    message_id = await async_add_message(message_data)
+    await send_to_moderator(message, message_id, "document", permissions)
 
 @error_handler
-async def handle_moderation(callback: types.CallbackQuery):
+async def handle_moderation(callback: types.CallbackQuery, permissions: Optional[PermissionContext] = None):
     try:
         action, message_id = callback.data.split("_")
         message_id = int(message_id)
         
-        message_data = get_message(message_id)
+        message_data = await async_get_message(message_id)
         if not message_data:
             await callback.answer("Сообщение уже обработано или не найдено")
             return
         
         moderator_id = callback.from_user.id
-        moderator_level = get_user_level(moderator_id)
+        moderator_level = permissions.level if permissions else await async_get_user_level(moderator_id)
         moderator_username = callback.from_user.username or "неизвестно"
         
         if message_data['user_id'] == moderator_id:
@@ -434,24 +498,29 @@ async def handle_moderation(callback: types.CallbackQuery):
             await callback.answer("❌ У вас нет прав для модерации")
             return
         
+        # Решение принимает только модератор, за которым закреплено сообщение
+        if not await async_claim_message(message_id, moderator_id):
+            await callback.answer("🔒 Это сообщение уже проверяет другой модератор", show_alert=True)
+            return
+        
         approved = action == "approve"
         moderation_time = 0  # Можно добавить расчет времени
         
         if approved:
             try:
                 if message_data['type'] == 'text':
-                    await callback.bot.send_message(
+                    await send_scheduler.submit(LANE_CHANNEL, Config.CHANNEL_ID, lambda: callback.bot.send_message(
                         Config.CHANNEL_ID,
                         f"📨 Анонимное сообщение:\n\n{message_data['content']}"
-                    )
+                    ))
                 elif message_data['type'] == 'photo':
-                    await callback.bot.send_photo(
+                    await send_scheduler.submit(LANE_CHANNEL, Config.CHANNEL_ID, lambda: callback.bot.send_photo(
                         Config.CHANNEL_ID,
                         message_data['file_id'],
                         caption=message_data.get('caption', '📨 Анонимное фото')
-                    )
+                    ))
                 
-                update_moderator_stats(moderator_id, 'approve', moderation_time)
+                await async_update_moderator_stats(moderator_id, 'approve', moderation_time)
                 message_content = message_data['content'] if message_data['type'] == 'text' else f"{message_data['type']} сообщение"
                 await send_moderation_log(
                     moderator_username, moderator_id, message_content, 
@@ -463,7 +532,7 @@ async def handle_moderation(callback: types.CallbackQuery):
                 await callback.answer("Ошибка публикации")
                 return
         else:
-            update_moderator_stats(moderator_id, 'reject', moderation_time)
+            await async_update_moderator_stats(moderator_id, 'reject', moderation_time)
             message_content = message_data['content'] if message_data['type'] == 'text' else f"{message_data['type']} сообщение"
             await send_moderation_log(
                 moderator_username, moderator_id, message_content,
@@ -478,35 +547,107 @@ async def handle_moderation(callback: types.CallbackQuery):
         status_text = "✅ Ваше сообщение прошло модерацию и опубликовано в канале!" if approved else "❌ Ваше сообщение не прошло модерацию и было отклонено."
         
         try:
-            await callback.bot.send_message(
-                message_data['user_id'],
+            await send_scheduler.send_message(
+                LANE_USER, message_data['user_id'],
                 status_text,
                 reply_markup=get_start_keyboard()
             )
         except Exception as e:
             logger.warning(f"Не удалось уведомить пользователя {message_data['user_id']}: {e}")
         
-        update_message_status(message_id, approved, moderation_time)
-        delete_message(message_id)
+        await async_update_message_status(message_id, approved, moderation_time)
+        await async_delete_message(message_id)
+        await async_release_message_claim(message_id, moderator_id)
         try:
             await callback.message.edit_reply_markup(reply_markup=None)
         except:
             pass
         
+        # Убираем кнопки у остальных модераторов
+        await update_moderator_keyboards(callback.bot, message_id, moderator_id, None)
+        await async_forget_deliveries(message_id)
+        
         await callback.answer("Сообщение опубликовано" if approved else "Сообщение отклонено")
         
     except Exception as e:
         logger.error(f"Ошибка обработки модерации: {e}")
         await callback.answer("Произошла ошибка")
 
+async def update_moderator_keyboards(bot, message_id: int, except_moderator_id: int, reply_markup):
+    """Заменить клавиатуру у копий сообщения всех модераторов, кроме указанного"""
+    deliveries = await async_get_deliveries(message_id)
+    targets = {
+        moderator_id: chat_message_id
+        for moderator_id, chat_message_id in deliveries.items()
+        if moderator_id != except_moderator_id
+    }
+    if not targets:
+        return
+    
+    await fan_out(
+        targets,
+        lambda moderator_id: bot.edit_message_reply_markup(
+            chat_id=moderator_id, message_id=targets[moderator_id], reply_markup=reply_markup
+        ),
+        label=f"клавиатуры сообщения {message_id}"
+    )
+
+@error_handler
+async def handle_claim_callback(callback: types.CallbackQuery, permissions: Optional[PermissionContext] = None):
+    """Закрепление сообщения за модератором: claim_, release_, claiminfo_"""
+    action, message_id = callback.data.split("_")
+    message_id = int(message_id)
+    moderator_id = callback.from_user.id
+    moderator_level = permissions.level if permissions else await async_get_user_level(moderator_id)
+    
+    if moderator_level < 1:
+        await callback.answer("❌ У вас нет прав для модерации")
+        return
+    
+    if action == "claim":
+        message_data = await async_get_message(message_id)
+        if not message_data:
+            await callback.answer("Сообщение уже обработано или не найдено")
+            return
+        
+        if message_data['user_id'] == moderator_id:
+            await callback.answer("❌ Вы не можете проверять свои сообщения")
+            return
+        
+        if not await async_claim_message(message_id, moderator_id):
+            await callback.answer("🔒 Это сообщение уже проверяет другой модератор", show_alert=True)
+            return
+        
+        await callback.message.edit_reply_markup(reply_markup=create_claimed_keyboard(message_id))
+        moderator_name = f"@{callback.from_user.username}" if callback.from_user.username else "модератор"
+        await update_moderator_keyboards(
+            callback.bot, message_id, moderator_id, create_locked_keyboard(message_id, moderator_name)
+        )
+        await callback.answer(f"✋ Сообщение закреплено за вами на {Config.MODERATION_LEASE_TTL} сек")
+    
+    elif action == "release":
+        await async_release_message_claim(message_id, moderator_id)
+        await callback.message.edit_reply_markup(reply_markup=create_moderation_keyboard(message_id))
+        await update_moderator_keyboards(callback.bot, message_id, moderator_id, create_moderation_keyboard(message_id))
+        await callback.answer("↩️ Сообщение снова доступно всем модераторам")
+    
+    elif action == "claiminfo":
+        if await async_get_message_claim(message_id) is None:
+            # Закрепление истекло — возвращаем кнопки модерации
+            await callback.message.edit_reply_markup(reply_markup=create_moderation_keyboard(message_id))
+            await callback.answer("Сообщение снова свободно")
+        else:
+            await callback.answer("🔒 Сообщение проверяет другой модератор")
+
 @error_handler
-async def handle_punishment_callback(callback: types.CallbackQuery, state: FSMContext):
+async def handle_punishment_callback(callback: types.CallbackQuery, state: FSMContext,
+                                     permissions: Optional[PermissionContext] = None):
     try:
         action, target_id = callback.data.split("_")
         target_id = int(target_id)
         
         moderator_id = callback.from_user.id
-        moderator_level = get_user_level(moderator_id)
+        moderator_level = permissions.level if permissions else await async_get_user_level(moderator_id)
         
         if moderator_level < 2:
             await callback.answer("❌ У вас нет прав для выдачи наказаний")
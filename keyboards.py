@@ -5,6 +5,29 @@ def create_moderation_keyboard(message_id):
         [
             InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{message_id}"),
             InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reject_{message_id}")
+        ],
+        [
+            InlineKeyboardButton(text="✋ Взять на проверку", callback_data=f"claim_{message_id}")
+        ]
+    ])
+
+def create_claimed_keyboard(message_id):
+    """Клавиатура модератора, за которым закреплено сообщение"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{message_id}"),
+            InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reject_{message_id}")
+        ],
+        [
+            InlineKeyboardButton(text="↩️ Отпустить", callback_data=f"release_{message_id}")
+        ]
+    ])
+
+def create_locked_keyboard(message_id, moderator_name):
+    """Клавиатура остальных модераторов, пока сообщение закреплено"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=f"🔒 Проверяет {moderator_name}", callback_data=f"claiminfo_{message_id}")
         ]
     ])
 
@@ -0,0 +1,65 @@
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+class LocalTTLCache:
+    """Ограниченный по размеру in-process кэш с TTL.
+
+    Чтение не берет блокировок: одна операция dict.get атомарна под GIL,
+    а запись хранит пару (значение, срок годности) целиком. При переполнении
+    вытесняются самые старые по времени записи ключи.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: Dict[Hashable, Tuple[Any, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        # Переустановка ключа переносит его в конец порядка вытеснения
+        self._data.pop(key, None)
+        while len(self._data) >= self.maxsize:
+            try:
+                self._data.pop(next(iter(self._data)), None)
+            except (StopIteration, RuntimeError):
+                # Словарь изменился из другого потока — повторим на следующей записи
+                break
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def invalidate(self, key: Hashable) -> bool:
+        return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0
+        }
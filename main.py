@@ -9,11 +9,17 @@ from aiogram.exceptions import TelegramForbiddenError
 
 from config import Config
 from storage import user_levels, set_user_level, init_punishment_system, load_initial_data, cleanup_old_data
-from storage import get_system_health, get_cache_stats, process_message_queue
-from database import init_database, db
-from redis_storage import redis_storage
+from storage import get_system_health, get_cache_stats
+from storage import start_cache_invalidation, stop_cache_invalidation, user_level_cache
+from database import init_database, db, async_db
+from redis_storage import redis_storage, LockNotAcquired, LockError, LockLost
+from audit_buffer import audit_buffer
+from outbound import get_fan_out_stats, send_scheduler, log_digest
 from filters import RateLimitFilter, IsPrivateOrOwnerAdmin, IsOwnerAnywhere, IsOwnerAndAdmin
-from handlers import send_error_log, handle_permission_error
+from middlewares import PermissionMiddleware
+from handlers import send_error_log, flush_error_summaries, handle_permission_error, handle_my_chat_member
+from error_throttle import error_throttle
+from queue_worker import queue_worker
 
 # Импорты команд
 from commands import (
@@ -27,7 +33,7 @@ from commands import (
 from handlers import (
     handle_text_message, handle_photo_message, handle_video_message,
     handle_voice_message, handle_video_note_message, handle_sticker_message,
-    handle_document_message, handle_moderation, handle_punishment_callback,
+    handle_document_message, handle_moderation, handle_claim_callback, handle_punishment_callback,
     handle_punishment_reason, PunishmentStates
 )
 
@@ -41,24 +47,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Система наказаний (создается в main после запуска бота)
+punishment_system = None
+
 async def global_error_handler(event: ErrorEvent):
     logger.error(f"Global error: {event.exception}", exc_info=event.exception)
-    await send_error_log("Global Error", str(event.exception))
+    await send_error_log("Global Error", str(event.exception), exc=event.exception)
+
+async def error_summary_task():
+    """Периодическая сводка подавленных повторов ошибок"""
+    while True:
+        await asyncio.sleep(error_throttle.window)
+        await flush_error_summaries()
 
 async def background_tasks():
     """Фоновые задачи для обслуживания системы"""
     while True:
         try:
-            # Очистка старых данных из базы
-            cleanup_old_data()
-            
-            # Обработка очереди сообщений
-            processed = process_message_queue()
-            if processed > 0:
-                logger.info(f"✅ Обработано {processed} сообщений из очереди")
+            # Очистка старых данных из базы — одновременно только на одном экземпляре
+            try:
+                async with redis_storage.lock("cleanup_old_data", ttl=60, timeout=0):
+                    await async_db.run(cleanup_old_data)
+            except LockNotAcquired:
+                logger.debug("⏭️ Очистку данных выполняет другой экземпляр")
+            except LockLost:
+                logger.warning("⚠️ Блокировка очистки истекла до ее завершения, возможен параллельный запуск")
+            except LockError as e:
+                # Redis недоступен: очистка идемпотентна, поэтому выполняем ее без блокировки
+                logger.error(f"❌ Не удалось взять блокировку очистки: {e}")
+                await async_db.run(cleanup_old_data)
             
             # Проверка соединения с базой данных
-            if db and (not hasattr(db, 'connection') or not db.connection.is_connected()):
+            if db and not db.is_connected():
                 logger.warning("📡 Переподключение к MySQL...")
                 db.connect()
             
@@ -79,11 +99,9 @@ async def database_health_check():
     """Проверка здоровья базы данных"""
     while True:
         try:
-            if db and hasattr(db, 'connection') and db.connection.is_connected():
-                # Простая проверка запросом
-                with db.get_cursor() as cursor:
-                    cursor.execute("SELECT 1")
-                    logger.debug("✅ Проверка базы данных: OK")
+            if db and db.is_connected():
+                logger.debug("✅ Проверка базы данных: OK")
+                logger.info(f"📊 Пул соединений MySQL: {db.get_pool_stats()}")
             else:
                 logger.warning("❌ База данных не подключена")
                 
@@ -100,6 +118,15 @@ async def cache_cleanup_task():
             # Очищаем старые кэши раз в час
             cache_stats = get_cache_stats()
             logger.info(f"📊 Статистика кэша: {cache_stats}")
+            logger.info(f"📝 Буфер аудита: {audit_buffer.get_stats()}")
+            logger.info(f"⚡ L1-кэш уровней: {user_level_cache.get_stats()}")
+            logger.info(f"📬 Рассылки модераторам: {get_fan_out_stats()}")
+            logger.info(f"📤 Планировщик отправки: {send_scheduler.get_stats()}")
+            logger.info(f"🗂 Дайджест логов: {log_digest.get_stats()}")
+            logger.info(f"🚨 Подавление ошибок: {error_throttle.get_stats()}")
+            logger.info(f"📥 Очередь задач: {queue_worker.get_stats()}")
+            if punishment_system is not None:
+                logger.info(f"⚖️ Система наказаний: {punishment_system.get_stats()}")
             
             await asyncio.sleep(3600)  # Каждый час
             
@@ -118,6 +145,9 @@ async def startup_tasks():
     except Exception as e:
         logger.error(f"❌ Ошибка загрузки данных: {e}")
     
+    # Инвалидация L1-кэша уровней между экземплярами
+    start_cache_invalidation()
+    
     # Установка уровней по умолчанию
     try:
         set_user_level(Config.MODERATOR_ID, 1)
@@ -128,8 +158,20 @@ async def startup_tasks():
     
     # Очистка старых данных
     try:
-        cleanup_old_data()
+        with redis_storage.lock("cleanup_old_data", ttl=60, timeout=0):
+            cleanup_old_data()
         logger.info("✅ Очистка старых данных выполнена")
+    except LockNotAcquired:
+        logger.info("⏭️ Очистку данных выполняет другой экземпляр")
+    except LockLost:
+        logger.warning("⚠️ Блокировка очистки истекла до ее завершения, возможен параллельный запуск")
+    except LockError as e:
+        logger.error(f"❌ Не удалось взять блокировку очистки: {e}")
+        try:
+            cleanup_old_data()
+            logger.info("✅ Очистка старых данных выполнена без блокировки")
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки данных: {e}")
     except Exception as e:
         logger.error(f"❌ Ошибка очистки данных: {e}")
     
@@ -144,16 +186,33 @@ async def shutdown_tasks():
     """Задачи выполняемые при выключении бота"""
     logger.info("🛑 Выполнение задач выключения...")
     
-    # Закрытие соединения с базой
-    if db and hasattr(db, 'connection'):
-        db.disconnect()
-        logger.info("✅ Соединение с базой данных закрыто")
+    # Отписываемся от событий инвалидации кэша
+    stop_cache_invalidation()
+    
+    # Воркеры очереди могут еще отправлять сообщения и писать в базу — останавливаем их первыми
+    await queue_worker.stop()
+    
+    # Отправляем накопленные сообщения (логи) до остановки
+    await log_digest.stop()
+    await send_scheduler.stop()
     
     # Остановка системы наказаний
-    if 'punishment_system' in globals():
+    if punishment_system is not None:
         await punishment_system.stop()
         logger.info("✅ Система наказаний остановлена")
     
+    # Дописываем накопленные записи аудита до закрытия соединений
+    audit_buffer.stop()
+    
+    # Закрытие соединения с базой
+    async_db.close()
+    if db:
+        db.disconnect()
+        logger.info("✅ Соединение с базой данных закрыто")
+    
+    # Закрываем асинхронные соединения с Redis
+    await redis_storage.async_close()
+    
     # Сохранение кэша
     try:
         cache_stats = get_cache_stats()
@@ -162,6 +221,7 @@ async def shutdown_tasks():
         logger.error(f"❌ Ошибка сохранения статистики кэша: {e}")
 
 async def main():
+    global punishment_system
     try:
         # Валидация конфигурации
         Config.validate()
@@ -179,11 +239,22 @@ async def main():
         
         logger.info("✅ MySQL подключена успешно")
         
+        # Фоновая пакетная запись лога аудита
+        audit_buffer.start()
+        
         # Инициализация Redis для FSM
         storage = RedisStorage.from_url('redis://localhost:6379/0')
         bot = Bot(token=Config.BOT_TOKEN)
         dp = Dispatcher(storage=storage)
         
+        # Очередь исходящих сообщений с приоритетами
+        send_scheduler.start(bot)
+        log_digest.start()
+        
+        # Очередь задач обрабатывается непрерывно, по мере поступления
+        if Config.QUEUE_PROCESSING_ENABLED:
+            queue_worker.start()
+        
         # Задачи при запуске
         await startup_tasks()
         
@@ -192,6 +263,9 @@ async def main():
         await punishment_system.start()
         logger.info("✅ Система наказаний запущена")
         
+        # Права пользователя вычисляются один раз на апдейт, до фильтров
+        dp.update.outer_middleware(PermissionMiddleware(punishment_system))
+        
         # Регистрируем обработчики ошибок
         dp.errors.register(global_error_handler)
         dp.errors.register(handle_permission_error, ExceptionTypeFilter(TelegramForbiddenError))
@@ -249,6 +323,8 @@ async def main():
         
         # Обработчики callback'ов (везде)
         dp.callback_query.register(handle_moderation, F.data.startswith("approve_") | F.data.startswith("reject_"))
+        dp.callback_query.register(handle_claim_callback, F.data.startswith("claim_") | F.data.startswith("release_") | 
+                                  F.data.startswith("claiminfo_"))
         dp.callback_query.register(handle_punishment_callback, F.data.startswith("mute_") | F.data.startswith("warn_") | F.data.startswith("ban_"))
         dp.callback_query.register(handle_admin_callback, F.data.startswith("users_") | F.data.startswith("mods_") | 
                                   F.data.startswith("setting_") | F.data.startswith("backup_") | 
@@ -256,10 +332,14 @@ async def main():
         
         dp.message.register(handle_punishment_reason, PunishmentStates.waiting_for_reason)
         
+        # Изменения прав бота в группах (кэш статуса администратора)
+        dp.my_chat_member.register(handle_my_chat_member)
+        
         # Запускаем фоновые задачи
         asyncio.create_task(background_tasks())
         asyncio.create_task(database_health_check())
         asyncio.create_task(cache_cleanup_task())
+        asyncio.create_task(error_summary_task())
         
         logger.info("🤖 Бот запущен успешно!")
         logger.info("🔐 Система прав доступа активирована:")
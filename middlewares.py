@@ -0,0 +1,78 @@
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from storage import async_get_user_level, async_is_user_banned
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class PermissionContext:
+    """Права пользователя, вычисленные один раз на апдейт"""
+    user_id: int
+    level: int
+    is_banned: bool = False
+    is_muted: bool = False
+
+    @property
+    def is_moderator(self) -> bool:
+        return self.level >= 1
+
+    @property
+    def is_tech_moderator(self) -> bool:
+        return self.level >= 2
+
+    @property
+    def is_owner(self) -> bool:
+        return self.level == 3
+
+def is_user_muted(user_id: int, punishment_system=None) -> bool:
+    """Проверить активный мут пользователя в системе наказаний"""
+    if punishment_system is None:
+        return False
+
+    punishment = punishment_system.active_punishments.get(user_id)
+    return (
+        punishment is not None
+        and punishment.punishment_type == 'mute'
+        and punishment.expires_at > datetime.datetime.now()
+    )
+
+async def resolve_permissions(user_id: int, punishment_system=None) -> PermissionContext:
+    """Вычислить права пользователя: уровень, бан и мут"""
+    return PermissionContext(
+        user_id=user_id,
+        level=await async_get_user_level(user_id),
+        is_banned=await async_is_user_banned(user_id),
+        is_muted=is_user_muted(user_id, punishment_system)
+    )
+
+class PermissionMiddleware(BaseMiddleware):
+    """Outer-middleware: кладет PermissionContext в data['permissions'].
+
+    Фильтры и обработчики получают его аргументом permissions вместо того,
+    чтобы каждый раз заново запрашивать уровень, бан и мут.
+    """
+
+    def __init__(self, punishment_system=None):
+        self.punishment_system = punishment_system
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            try:
+                data["permissions"] = await resolve_permissions(user.id, self.punishment_system)
+            except Exception as e:
+                # Фильтры вычислят права сами, если контекста нет
+                logger.error(f"❌ Ошибка вычисления прав пользователя {user.id}: {e}")
+
+        return await handler(event, data)
@@ -0,0 +1,441 @@
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import Config
+from local_cache import LocalTTLCache
+
+logger = logging.getLogger(__name__)
+
+class AsyncTokenBucket:
+    """Token bucket для asyncio: rate токенов в секунду, запас до capacity.
+
+    Ожидающие обслуживаются по очереди; pause() останавливает выдачу токенов
+    (например, на время retry_after от Telegram).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if self._updated is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        self._tokens = 0.0
+
+    def paused_for(self) -> float:
+        """Сколько секунд еще продлится пауза"""
+        return max(0.0, self._paused_until - asyncio.get_running_loop().time())
+
+class TelegramRateLimiter:
+    """Глобальный лимит отправки бота и отдельный лимит на каждый чат"""
+
+    def __init__(self,
+                 global_rate: float = Config.TELEGRAM_GLOBAL_RATE,
+                 per_chat_rate: float = Config.TELEGRAM_PER_CHAT_RATE,
+                 max_chats: int = Config.USER_CACHE_SIZE):
+        self.global_bucket = AsyncTokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        # Корзины неактивных чатов вытесняются: через минуту простоя корзина и так полная
+        self._chat_buckets = LocalTTLCache(max_chats, 60)
+
+    def _chat_bucket(self, chat_id: int) -> AsyncTokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = AsyncTokenBucket(self.per_chat_rate)
+        self._remember_bucket(chat_id, bucket)
+        return bucket
+
+    def _remember_bucket(self, chat_id: int, bucket: AsyncTokenBucket):
+        # Каждое обращение продлевает жизнь корзины; на паузе (retry_after может
+        # быть больше минуты) она живет до конца паузы, иначе ее сменила бы полная
+        self._chat_buckets.set(chat_id, bucket, self._chat_buckets.ttl + bucket.paused_for())
+
+    async def acquire(self, chat_id: int):
+        # Сначала слот чата, затем глобальный — чтобы не держать глобальный токен в ожидании
+        await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, chat_id: int, seconds: float):
+        bucket = self._chat_bucket(chat_id)
+        bucket.pause(seconds)
+        self._remember_bucket(chat_id, bucket)
+
+# Общий лимитер исходящих сообщений бота
+telegram_limiter = TelegramRateLimiter()
+
+async def send_with_retry(chat_id: int, send: Callable[[], Awaitable[Any]],
+                          limiter: Optional[TelegramRateLimiter] = None,
+                          max_retries: int = Config.SEND_MAX_RETRIES) -> Any:
+    """Отправить с соблюдением лимитов, повторяя после 429 retry_after"""
+    limiter = limiter or telegram_limiter
+    attempt = 0
+    while True:
+        await limiter.acquire(chat_id)
+        try:
+            return await send()
+        except TelegramRetryAfter as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            logger.warning(f"⏳ Telegram 429 для чата {chat_id}: повтор через {e.retry_after}с ({attempt}/{max_retries})")
+            limiter.pause(chat_id, e.retry_after)
+
+@dataclass
+class FanOutResult:
+    """Результат рассылки одного сообщения по нескольким чатам"""
+    delivered: Dict[int, Any] = field(default_factory=dict)
+    failed: Dict[int, Exception] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def success(self) -> bool:
+        return bool(self.delivered)
+
+_fan_out_stats = {'fan_outs': 0, 'deliveries': 0, 'failures': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+async def fan_out(chat_ids: Iterable[int], send: Callable[[int], Awaitable[Any]],
+                  concurrency: int = Config.FANOUT_CONCURRENCY,
+                  limiter: Optional[TelegramRateLimiter] = None,
+                  label: str = "рассылка") -> FanOutResult:
+    """Параллельно отправить send(chat_id) во все чаты, не больше concurrency одновременно"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = FanOutResult()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def deliver(chat_id: int):
+        async with semaphore:
+            try:
+                result.delivered[chat_id] = await send_with_retry(chat_id, lambda: send(chat_id), limiter)
+            except Exception as e:
+                result.failed[chat_id] = e
+                logger.warning(f"Не удалось отправить в чат {chat_id}: {e}")
+
+    await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids))
+    result.elapsed = loop.time() - started
+
+    elapsed_ms = result.elapsed * 1000
+    _fan_out_stats['fan_outs'] += 1
+    _fan_out_stats['deliveries'] += len(result.delivered)
+    _fan_out_stats['failures'] += len(result.failed)
+    _fan_out_stats['total_ms'] += elapsed_ms
+    _fan_out_stats['max_ms'] = max(_fan_out_stats['max_ms'], elapsed_ms)
+
+    logger.info(f"📬 {label}: доставлено {len(result.delivered)}/{len(result.delivered) + len(result.failed)} за {elapsed_ms:.0f} мс")
+    return result
+
+def get_fan_out_stats() -> Dict[str, Any]:
+    """Статистика рассылок: количество и задержка"""
+    fan_outs = _fan_out_stats['fan_outs']
+    return {
+        'fan_outs': fan_outs,
+        'deliveries': _fan_out_stats['deliveries'],
+        'failures': _fan_out_stats['failures'],
+        'avg_ms': round(_fan_out_stats['total_ms'] / fan_outs, 1) if fan_outs else 0,
+        'max_ms': round(_fan_out_stats['max_ms'], 1)
+    }
+
+# ==================== ПЛАНИРОВЩИК ОТПРАВКИ ====================
+
+# Полосы приоритета: меньше — раньше
+LANE_USER = 0       # ответы и уведомления пользователям
+LANE_CHANNEL = 1    # публикации и правки в каналах
+LANE_LOG = 2        # лог-каналы
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+LOG_SEPARATOR = "\n\n―――\n\n"
+
+def _split_text(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Разбить текст на части не длиннее limit, по возможности по переводу строки"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+@dataclass
+class _SendJob:
+    lane: int
+    chat_id: int
+    send: Optional[Callable[[], Awaitable[Any]]] = None
+    texts: List[str] = field(default_factory=list)
+    future: Optional[asyncio.Future] = None
+    # Задание полосы пользователей лежит в двух очередях; выполняет его тот, кто взял первым
+    taken: bool = False
+
+class SendScheduler:
+    """Центральная очередь исходящих сообщений бота.
+
+    Задания выполняются воркерами в порядке полос (пользователи, каналы, логи),
+    внутри полосы — по очереди поступления. Темп задает TelegramRateLimiter.
+    При нескольких воркерах один отдан только полосе пользователей: медленные
+    лог-каналы (ожидание лимита чата, 429) не могут занять всех воркеров.
+    Лог-сообщения в один чат, еще не взятые в работу, склеиваются в одно
+    сообщение до лимита Telegram в 4096 символов.
+    """
+
+    def __init__(self, limiter: Optional[TelegramRateLimiter] = None,
+                 workers: int = Config.SEND_WORKERS):
+        self.limiter = limiter or telegram_limiter
+        self.workers = max(1, workers)
+        self.bot = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._user_queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._open_logs: Dict[int, _SendJob] = {}
+        self._stats = {'sent': 0, 'failed': 0, 'coalesced': 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, bot):
+        """Запустить воркеры отправки"""
+        if self.running:
+            return
+        self.bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self._user_queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker(self._queue)) for _ in range(self.workers - 1)]
+        # Единственный воркер обслуживает все полосы; иначе один резервируется за пользователями
+        reserved = self._user_queue if self.workers > 1 else self._queue
+        self._tasks.append(asyncio.create_task(self._worker(reserved)))
+        logger.info(f"✅ Планировщик отправки запущен ({self.workers} воркеров)")
+
+    async def stop(self, timeout: float = 10.0):
+        """Отправить накопленное (не дольше timeout) и остановить воркеры"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(self._queue.join(), self._user_queue.join()), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Планировщик отправки остановлен, не отправлено: {self._queue.qsize()}")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"✅ Планировщик отправки остановлен: {self.get_stats()}")
+
+    async def submit(self, lane: int, chat_id: int, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Поставить отправку в очередь и дождаться результата"""
+        if not self.running:
+            return await send_with_retry(chat_id, send, self.limiter)
+
+        job = _SendJob(lane, chat_id, send=send, future=asyncio.get_running_loop().create_future())
+        self._put(job)
+        return await job.future
+
+    async def send_message(self, lane: int, chat_id: int, text: str, **kwargs) -> Any:
+        """Отправить текстовое сообщение через очередь"""
+        return await self.submit(lane, chat_id, lambda: self._get_bot().send_message(chat_id, text, **kwargs))
+
+    def log(self, chat_id: int, text: str):
+        """Поставить лог-сообщение без ожидания отправки (длинное — несколькими частями)"""
+        if not self.running:
+            asyncio.ensure_future(self._send_log_now(chat_id, text))
+            return
+
+        for chunk in _split_text(text):
+            self._log_chunk(chat_id, chunk)
+
+    def _log_chunk(self, chat_id: int, text: str):
+        job = self._open_logs.get(chat_id)
+        if job is not None and len(LOG_SEPARATOR.join(job.texts + [text])) <= TELEGRAM_MESSAGE_LIMIT:
+            job.texts.append(text)
+            self._stats['coalesced'] += 1
+            return
+
+        job = _SendJob(LANE_LOG, chat_id, texts=[text])
+        self._open_logs[chat_id] = job
+        self._put(job)
+
+    def _get_bot(self):
+        if self.bot is None:
+            from aiogram import Bot
+            return Bot.get_current()
+        return self.bot
+
+    async def _send_log_now(self, chat_id: int, text: str):
+        try:
+            for chunk in _split_text(text):
+                await send_with_retry(chat_id, lambda: self._get_bot().send_message(chat_id, chunk), self.limiter)
+        except Exception as e:
+            logger.error(f"❌ Не удалось отправить лог в {chat_id}: {e}")
+
+    def _put(self, job: _SendJob):
+        item = (job.lane, next(self._sequence), job)
+        self._queue.put_nowait(item)
+        if job.lane == LANE_USER and self.workers > 1:
+            self._user_queue.put_nowait(item)
+
+    async def _worker(self, queue: asyncio.PriorityQueue):
+        while True:
+            _, _, job = await queue.get()
+            try:
+                if not job.taken:
+                    job.taken = True
+                    await self._execute(job)
+            finally:
+                queue.task_done()
+
+    async def _execute(self, job: _SendJob):
+        if job.texts:
+            # Дальше к этому заданию ничего не дописывается
+            if self._open_logs.get(job.chat_id) is job:
+                del self._open_logs[job.chat_id]
+            text = LOG_SEPARATOR.join(job.texts)
+            send = lambda: self._get_bot().send_message(job.chat_id, text)
+        else:
+            send = job.send
+
+        try:
+            result = await send_with_retry(job.chat_id, send, self.limiter)
+            self._stats['sent'] += 1
+            if job.future and not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            self._stats['failed'] += 1
+            if job.future and not job.future.done():
+                job.future.set_exception(e)
+            else:
+                logger.error(f"❌ Ошибка отправки в {job.chat_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика планировщика"""
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'open_logs': len(self._open_logs),
+            **self._stats
+        }
+
+# Общий планировщик исходящих сообщений
+send_scheduler = SendScheduler()
+
+# ==================== ДАЙДЖЕСТ ЛОГОВ ====================
+
+class LogDigest:
+    """Сводка лог-записей: одно сообщение в канал раз в interval секунд.
+
+    Записи копятся по каналам и уходят одним сообщением по таймеру, при
+    накоплении max_entries записей или когда следующая запись не помещается
+    в лимит длины сообщения Telegram.
+    """
+
+    def __init__(self, scheduler: Optional[SendScheduler] = None,
+                 interval: float = Config.LOG_DIGEST_INTERVAL,
+                 max_entries: int = Config.LOG_DIGEST_MAX_ENTRIES,
+                 enabled: bool = Config.LOG_DIGEST_ENABLED):
+        self.scheduler = scheduler or send_scheduler
+        self.interval = interval
+        self.max_entries = max(1, max_entries)
+        self.enabled = enabled
+        self._entries: Dict[int, List[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {'entries': 0, 'digests': 0}
+
+    def start(self):
+        """Запустить периодическую отправку сводок"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"✅ Дайджест логов включен (раз в {self.interval}с или по {self.max_entries} записей)")
+
+    async def stop(self):
+        """Остановить таймер и отправить накопленное"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+    def add(self, chat_id: int, text: str):
+        """Добавить запись в сводку канала"""
+        if self._task is None:
+            self.scheduler.log(chat_id, text)
+            return
+
+        self._stats['entries'] += 1
+        entries = self._entries.setdefault(chat_id, [])
+        if entries and len(self._render(entries + [text])) > TELEGRAM_MESSAGE_LIMIT:
+            self._flush_chat(chat_id)
+            entries = self._entries.setdefault(chat_id, [])
+
+        entries.append(text)
+        if len(entries) >= self.max_entries:
+            self._flush_chat(chat_id)
+
+    def flush(self):
+        """Отправить сводки по всем каналам"""
+        for chat_id in list(self._entries):
+            self._flush_chat(chat_id)
+
+    @staticmethod
+    def _render(entries: List[str]) -> str:
+        if len(entries) == 1:
+            return entries[0]
+        return f"🗂 Сводка: {len(entries)} записей" + LOG_SEPARATOR + LOG_SEPARATOR.join(entries)
+
+    def _flush_chat(self, chat_id: int):
+        entries = self._entries.pop(chat_id, None)
+        if not entries:
+            return
+        text = self._render(entries)
+        if len(text) > TELEGRAM_MESSAGE_LIMIT:
+            # Одна запись длиннее лимита — обрезаем
+            text = text[:TELEGRAM_MESSAGE_LIMIT - 3] + "..."
+        self._stats['digests'] += 1
+        self.scheduler.log(chat_id, text)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки дайджеста логов: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика дайджеста"""
+        return {
+            'enabled': self.enabled,
+            'buffered': sum(len(entries) for entries in self._entries.values()),
+            **self._stats
+        }
+
+# Сводки для лог-каналов модерации и наказаний
+log_digest = LogDigest()
@@ -0,0 +1,172 @@
+import heapq
+import time
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Ключ сортировки: (-приоритет, время создания, id) — сначала важные, затем старые
+QueueKey = Tuple[int, float, int]
+
+class PendingQueue:
+    """Очередь сообщений на модерацию, упорядоченная по приоритету и возрасту.
+
+    Для постраничного просмотра ключи хранятся в отсортированном списке
+    (поиск позиции — бинарный), у каждого модератора свой курсор.
+    Для claim_next те же ключи лежат в куче: захват головы очереди — O(log n).
+    Удаленные, замененные и уже закрепленные записи из кучи не вычищаются
+    сразу, а пропускаются при извлечении (ленивое удаление); при снятии
+    закрепления сообщение возвращается в кучу.
+    """
+
+    def __init__(self):
+        self._keys: List[QueueKey] = []
+        self._heap: List[QueueKey] = []
+        self._by_id: Dict[int, QueueKey] = {}
+        self._owners: Dict[int, int] = {}
+        self._claims: Dict[int, int] = {}
+        self._cursors: Dict[int, QueueKey] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _created_at(message_data: Dict[str, Any]) -> float:
+        created = message_data.get('created_at') or message_data.get('timestamp')
+        if isinstance(created, datetime):
+            return created.timestamp()
+        if isinstance(created, str):
+            try:
+                return datetime.fromisoformat(created).timestamp()
+            except ValueError:
+                pass
+        return time.time()
+
+    def add(self, message_id: int, message_data: Dict[str, Any]):
+        """Добавить сообщение (повторное добавление обновляет позицию)"""
+        key = (-int(message_data.get('priority', 0)), self._created_at(message_data), message_id)
+        with self._lock:
+            self._remove_key(message_id)
+            insort(self._keys, key)
+            heapq.heappush(self._heap, key)
+            self._by_id[message_id] = key
+            self._owners[message_id] = message_data.get('user_id')
+
+    def remove(self, message_id: int) -> bool:
+        """Убрать сообщение из очереди (отмодерировано или удалено)"""
+        with self._lock:
+            self._claims.pop(message_id, None)
+            self._owners.pop(message_id, None)
+            removed = self._remove_key(message_id)
+            self._compact()
+            return removed
+
+    def _remove_key(self, message_id: int) -> bool:
+        key = self._by_id.pop(message_id, None)
+        if key is None:
+            return False
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+        return True
+
+    def _compact(self):
+        """Перестроить кучу, если устаревших записей в ней больше, чем живых"""
+        if len(self._heap) > 2 * len(self._by_id) + 64:
+            self._heap = [
+                key for key in self._heap
+                if self._by_id.get(key[2]) == key and key[2] not in self._claims
+            ]
+            heapq.heapify(self._heap)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._heap.clear()
+            self._by_id.clear()
+            self._owners.clear()
+            self._claims.clear()
+            self._cursors.clear()
+
+    def _available(self, message_id: int, moderator_id: int) -> bool:
+        # Свои сообщения модератор не проверяет, занятые другими — пропускаем
+        if self._owners.get(message_id) == moderator_id:
+            return False
+        claimed_by = self._claims.get(message_id)
+        return claimed_by is None or claimed_by == moderator_id
+
+    def page(self, moderator_id: int, size: int = 5, restart: bool = False) -> Tuple[List[int], bool]:
+        """Следующая страница для модератора: (id сообщений, есть ли еще)"""
+        with self._lock:
+            cursor = None if restart else self._cursors.get(moderator_id)
+            index = bisect_right(self._keys, cursor) if cursor is not None else 0
+
+            result = []
+            while index < len(self._keys) and len(result) < size:
+                key = self._keys[index]
+                if self._available(key[2], moderator_id):
+                    result.append(key[2])
+                cursor = key
+                index += 1
+
+            has_more = index < len(self._keys)
+            if has_more:
+                self._cursors[moderator_id] = cursor
+            else:
+                # Дошли до конца — следующий просмотр начнется с начала очереди
+                self._cursors.pop(moderator_id, None)
+            return result, has_more
+
+    def claim(self, message_id: int, moderator_id: int) -> bool:
+        """Закрепить сообщение за модератором"""
+        with self._lock:
+            if message_id not in self._by_id or not self._available(message_id, moderator_id):
+                return False
+            self._claims[message_id] = moderator_id
+            return True
+
+    def release(self, message_id: int, moderator_id: Optional[int] = None) -> bool:
+        """Снять закрепление (только своё, если указан moderator_id)"""
+        with self._lock:
+            claimed_by = self._claims.get(message_id)
+            if claimed_by is None or (moderator_id is not None and claimed_by != moderator_id):
+                return False
+            del self._claims[message_id]
+            # Запись могла быть вынута из кучи, пока сообщение было закреплено
+            heapq.heappush(self._heap, self._by_id[message_id])
+            return True
+
+    def claim_next(self, moderator_id: int) -> Optional[int]:
+        """Взять первое доступное сообщение из головы очереди"""
+        with self._lock:
+            # Свои сообщения модератора откладываются и возвращаются в кучу:
+            # их может взять другой модератор
+            skipped = []
+            claimed = None
+            while self._heap:
+                key = heapq.heappop(self._heap)
+                message_id = key[2]
+                if self._by_id.get(message_id) != key or message_id in self._claims:
+                    continue
+                if self._owners.get(message_id) == moderator_id:
+                    skipped.append(key)
+                    continue
+                self._claims[message_id] = moderator_id
+                claimed = message_id
+                break
+
+            for key in skipped:
+                heapq.heappush(self._heap, key)
+            return claimed
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._by_id
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'pending': len(self._keys),
+            'heap': len(self._heap),
+            'claimed': len(self._claims),
+            'cursors': len(self._cursors)
+        }
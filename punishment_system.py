@@ -1,12 +1,17 @@
 import asyncio
 import datetime
-from typing import Dict, List
+import heapq
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
 from aiogram import Bot
 from dataclasses import dataclass
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Предельный сон планировщика: страхует от перевода системных часов
+MAX_SLEEP_SECONDS = 3600
+
 @dataclass
 class Punishment:
     user_id: int
@@ -18,13 +23,41 @@ class Punishment:
     expires_at: datetime.datetime
 
 class PunishmentSystem:
+    """Активные наказания и их снятие по истечении срока.
+
+    Сроки хранятся в куче (expires_at, seq, user_id, punishment): фоновая
+    задача спит до ближайшего срока и снимает только истекшие наказания.
+    Замененные и снятые вручную записи не удаляются из кучи сразу, а
+    пропускаются при извлечении (ленивое удаление).
+    """
+
     def __init__(self, bot: Bot):
         self.bot = bot
         self.active_punishments: Dict[int, Punishment] = {}
         self.task = None
+        self._expiry_heap: List[Tuple[datetime.datetime, int, int, Punishment]] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+    
+    def _schedule(self, punishment: Punishment):
+        """Поставить срок наказания в кучу; разбудить задачу, если он ближайший"""
+        entry = (punishment.expires_at, next(self._sequence), punishment.user_id, punishment)
+        heapq.heappush(self._expiry_heap, entry)
+        if self._expiry_heap[0] is entry:
+            self._wakeup.set()
+    
+    def _is_current(self, user_id: int, punishment: Punishment) -> bool:
+        return self.active_punishments.get(user_id) is punishment
+    
+    def _compact(self):
+        """Убрать устаревшие записи, если их в куче больше, чем активных"""
+        if len(self._expiry_heap) > 2 * len(self.active_punishments) + 64:
+            self._expiry_heap = [entry for entry in self._expiry_heap if self._is_current(entry[2], entry[3])]
+            heapq.heapify(self._expiry_heap)
     
     async def add_punishment(self, punishment: Punishment):
         self.active_punishments[punishment.user_id] = punishment
+        self._schedule(punishment)
         
         if punishment.punishment_type == 'mute':
             await self.apply_mute(punishment)
@@ -66,18 +99,29 @@ class PunishmentSystem:
                 await self.remove_ban(punishment)
             
             del self.active_punishments[user_id]
+            self._compact()
     
-    async def check_expired_punishments(self):
+    async def check_expired_punishments(self) -> int:
+        """Снять истекшие наказания: O(log n) на каждое, без обхода активных"""
         now = datetime.datetime.now()
-        expired = []
-        
-        for user_id, punishment in self.active_punishments.items():
-            if now >= punishment.expires_at:
-                expired.append(user_id)
+        expired = 0
         
-        for user_id in expired:
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, _, user_id, punishment = heapq.heappop(self._expiry_heap)
+            if not self._is_current(user_id, punishment):
+                continue
             await self.remove_punishment(user_id)
+            expired += 1
             logger.info(f"Punishment expired for user {user_id}")
+        
+        return expired
+    
+    def _next_delay(self) -> float:
+        """Секунд до ближайшего срока (не больше MAX_SLEEP_SECONDS)"""
+        if not self._expiry_heap:
+            return MAX_SLEEP_SECONDS
+        delay = (self._expiry_heap[0][0] - datetime.datetime.now()).total_seconds()
+        return min(max(0.0, delay), MAX_SLEEP_SECONDS)
     
     async def start(self):
         """Запуск фоновой задачи проверки наказаний"""
@@ -86,11 +130,28 @@ class PunishmentSystem:
     async def _background_check(self):
         while True:
             try:
+                # Событие сбрасывается до проверки: наказание, добавленное во
+                # время снятия истекших, разбудит задачу сразу
+                self._wakeup.clear()
                 await self.check_expired_punishments()
-                await asyncio.sleep(60)  # Проверка каждую минуту
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._next_delay())
+                except asyncio.TimeoutError:
+                    pass
             except Exception as e:
                 logger.error(f"Error in punishment background check: {e}")
-                await asyncio.sleep(60)
+                await asyncio.sleep(1)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Активные наказания, размер кучи сроков и время до ближайшего"""
+        next_expiry: Optional[float] = None
+        if self._expiry_heap:
+            next_expiry = round((self._expiry_heap[0][0] - datetime.datetime.now()).total_seconds(), 1)
+        return {
+            'active': len(self.active_punishments),
+            'scheduled': len(self._expiry_heap),
+            'next_expiry_in': next_expiry
+        }
     
     async def stop(self):
         if self.task:
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import Config
+from redis_storage import redis_storage
+from outbound import send_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Очередь фоновых задач (надежная очередь в Redis)
+TASK_QUEUE = "tasks"
+
+# Сколько ждать новых сообщений за одно чтение; после пустого ожидания
+# воркер заново забирает просроченные сообщения и проверяет остановку
+_BLOCK_MS = 5000
+
+# ==================== РЕЕСТР ЗАДАЧ ====================
+
+TaskHandler = Callable[..., Awaitable[Any]]
+_task_registry: Dict[str, TaskHandler] = {}
+
+def register_task(name: str):
+    """Декоратор: зарегистрировать обработчик задачи из очереди"""
+    def decorator(func: TaskHandler) -> TaskHandler:
+        _task_registry[name] = func
+        return func
+    return decorator
+
+def enqueue_task(name: str, **payload) -> Optional[str]:
+    """Поставить задачу в очередь; ее выполнит любой экземпляр бота"""
+    if name not in _task_registry:
+        logger.warning(f"⚠️ Задача {name} не зарегистрирована в этом процессе")
+    return redis_storage.reliable_push(TASK_QUEUE, {'task': name, 'payload': payload})
+
+async def dispatch_task(message: Dict[str, Any]):
+    """Выполнить задачу из сообщения очереди"""
+    handler = _task_registry.get(message.get('task'))
+    if handler is None:
+        raise LookupError(f"Неизвестная задача: {message.get('task')}")
+    await handler(**message.get('payload', {}))
+
+@register_task("send_message")
+async def _send_message_task(chat_id: int, text: str, lane: int = 0, **kwargs):
+    """Отправить сообщение от имени бота (например, из API-сервера)"""
+    await send_scheduler.send_message(lane, chat_id, text, **kwargs)
+
+# ==================== ПУЛ ВОРКЕРОВ ====================
+
+class QueueWorker:
+    """Пул воркеров, обрабатывающих надежную очередь по мере поступления.
+
+    Каждый воркер блокируется на чтении stream и сразу передает сообщение
+    обработчику. Успешно обработанное сообщение подтверждается; при ошибке
+    оно остается неподтвержденным и будет выдано повторно после
+    QUEUE_VISIBILITY_TIMEOUT (после MAX_QUEUE_RETRIES — в мертвые письма).
+    """
+
+    def __init__(self, queue_name: str = TASK_QUEUE,
+                 handler: Callable[[Dict[str, Any]], Awaitable[Any]] = dispatch_task,
+                 concurrency: int = Config.QUEUE_WORKERS):
+        self.queue_name = queue_name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._stats = {
+            'processed': 0, 'failed': 0,
+            'total_ms': 0.0, 'max_ms': 0.0,
+            'last_lag_ms': 0, 'max_lag_ms': 0
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Запустить воркеры"""
+        if self.running:
+            return
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{self.consumer}:{i}"))
+            for i in range(self.concurrency)
+        ]
+        logger.info(f"✅ Воркеры очереди {self.queue_name} запущены ({self.concurrency})")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дождаться текущих сообщений (не дольше timeout) и остановить воркеры"""
+        if not self.running:
+            return
+        self._stopping = True
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            # Неподтвержденные сообщения заберет другой экземпляр
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"✅ Воркеры очереди {self.queue_name} остановлены: {self.get_stats()}")
+
+    async def _worker(self, consumer: str):
+        while not self._stopping:
+            try:
+                entries = await redis_storage.async_reliable_pop(
+                    self.queue_name, consumer, count=1, block=_BLOCK_MS
+                )
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения очереди {self.queue_name}: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for entry_id, message in entries:
+                await self._process(entry_id, message)
+
+    async def _process(self, entry_id: str, message: Dict[str, Any]):
+        # id записи stream начинается с времени добавления в мс
+        lag_ms = max(0, int(time.time() * 1000) - int(entry_id.split('-')[0]))
+        self._stats['last_lag_ms'] = lag_ms
+        self._stats['max_lag_ms'] = max(self._stats['max_lag_ms'], lag_ms)
+
+        started = time.perf_counter()
+        try:
+            await self.handler(message)
+        except Exception as e:
+            self._stats['failed'] += 1
+            logger.error(f"❌ Ошибка обработки {entry_id} из очереди {self.queue_name}: {e}")
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats['processed'] += 1
+        self._stats['total_ms'] += elapsed_ms
+        self._stats['max_ms'] = max(self._stats['max_ms'], elapsed_ms)
+        await redis_storage.async_reliable_ack(self.queue_name, entry_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Глубина очереди, задержка и время обработки"""
+        processed = self._stats['processed']
+        info = redis_storage.get_reliable_queue_info(self.queue_name)
+        return {
+            'workers': len(self._tasks),
+            'depth': max(0, info['length'] - info['pending']),
+            'in_flight': info['pending'],
+            'dead': info['dead'],
+            'processed': processed,
+            'failed': self._stats['failed'],
+            'avg_ms': round(self._stats['total_ms'] / processed, 1) if processed else 0,
+            'max_ms': round(self._stats['max_ms'], 1),
+            'last_lag_ms': self._stats['last_lag_ms'],
+            'max_lag_ms': self._stats['max_lag_ms']
+        }
+
+# Воркеры очереди фоновых задач
+queue_worker = QueueWorker()
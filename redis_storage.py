@@ -1,18 +1,182 @@
 import redis
+import redis.asyncio
 import json
-import pickle
 from typing import Dict, Any, List, Optional, Union
 from datetime import datetime, timedelta
 import logging
 import asyncio
+import time
+import uuid
+import secrets
+
+from config import Config
+from cache_codec import CacheCodec, CodecError, get_serializer
 
 logger = logging.getLogger(__name__)
 
+# Скользящее окно на ZSET: очистка старых отметок, проверка и запись за один вызов.
+# Время берется с сервера Redis, чтобы часы экземпляров бота не влияли на окно.
+# KEYS[1] - отметки запросов, KEYS[2] - лимит и период ключа
+# ARGV[1] - лимит, ARGV[2] - период в мс, ARGV[3] - уникальный суффикс отметки
+# Возвращает {разрешено, осталось, мс до освобождения слота}
+_RATE_LIMIT_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - period)
+local count = redis.call('ZCARD', KEYS[1])
+
+local allowed = 0
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, now .. ':' .. ARGV[3])
+    count = count + 1
+    allowed = 1
+end
+
+local retry_after = 0
+if count >= limit then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    retry_after = math.max(0, tonumber(oldest[2]) + period - now)
+end
+
+redis.call('PEXPIRE', KEYS[1], period)
+redis.call('HSET', KEYS[2], 'limit', limit, 'period', period)
+redis.call('PEXPIRE', KEYS[2], period)
+
+return {allowed, limit - count, retry_after}
+"""
+
+# Снять блокировку / продлить ее, только если ею владеет токен ARGV[1]
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_EXTEND_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Захват блокировки с выдачей fencing-токена: растущего номера владения.
+# KEYS[1] - блокировка, KEYS[2] - счетчик владений; ARGV[1] - токен, ARGV[2] - TTL в мс
+# Возвращает номер владения или 0, если блокировка занята
+_ACQUIRE_LOCK_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return redis.call('INCR', KEYS[2])
+end
+return 0
+"""
+
+# Ящик уведомлений пользователя: KEYS[1] - ZSET id со сроком жизни каждого
+# уведомления (мс) в score, KEYS[2] - HASH id -> уведомление, KEYS[3] - SET
+# прочитанных id. Истекшие (score <= сейчас) удаляются перед каждой операцией.
+_INBOX_TRIM = """
+local function remove_ids(ids)
+    for i = 1, #ids, 500 do
+        local chunk = {unpack(ids, i, math.min(i + 499, #ids))}
+        redis.call('ZREM', KEYS[1], unpack(chunk))
+        redis.call('HDEL', KEYS[2], unpack(chunk))
+        redis.call('SREM', KEYS[3], unpack(chunk))
+    end
+    return #ids
+end
+local function remove_expired(now)
+    return remove_ids(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now))
+end
+"""
+
+# ARGV: id, уведомление, сейчас в мс, срок жизни уведомления в мс, размер ящика
+# При переполнении вытесняются уведомления, которые истекли бы раньше всех
+_INBOX_ADD_SCRIPT = _INBOX_TRIM + """
+local removed = remove_expired(ARGV[3])
+local overflow = redis.call('ZCARD', KEYS[1]) + 1 - tonumber(ARGV[5])
+if overflow > 0 then
+    removed = removed + remove_ids(redis.call('ZRANGE', KEYS[1], 0, overflow - 1))
+end
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+-- Ключи живут до истечения самого позднего уведомления, поэтому TTL только растет
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')[2]
+for i = 1, 3 do redis.call('PEXPIREAT', KEYS[i], last) end
+return removed
+"""
+
+# Страница ящика: ARGV - начало, конец, сейчас в мс
+# Плоский список {id, уведомление, прочитано}, позже истекающие первыми
+_INBOX_PAGE_SCRIPT = _INBOX_TRIM + """
+remove_expired(ARGV[3])
+local ids = redis.call('ZREVRANGE', KEYS[1], ARGV[1], ARGV[2])
+if #ids == 0 then return {} end
+local payloads = redis.call('HMGET', KEYS[2], unpack(ids))
+local result = {}
+for i, id in ipairs(ids) do
+    table.insert(result, id)
+    table.insert(result, payloads[i])
+    table.insert(result, redis.call('SISMEMBER', KEYS[3], id))
+end
+return result
+"""
+
+# Число непрочитанных: ARGV[1] - сейчас в мс
+_INBOX_COUNT_SCRIPT = _INBOX_TRIM + """
+remove_expired(ARGV[1])
+return redis.call('ZCARD', KEYS[1]) - redis.call('SCARD', KEYS[3])
+"""
+
+# Пометить прочитанным, если уведомление есть в ящике и не истекло; TTL набора — как у ящика
+# ARGV: id, сейчас в мс
+_INBOX_READ_SCRIPT = """
+local expires_at = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not expires_at or tonumber(expires_at) <= tonumber(ARGV[2]) then return 0 end
+redis.call('SADD', KEYS[2], ARGV[1])
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then redis.call('PEXPIRE', KEYS[2], ttl) end
+return 1
+"""
+
+# Группа потребителей надежных очередей по умолчанию
+STREAM_GROUP = "workers"
+
+# Маркер промаха при разборе значений кэша
+_MISS = object()
+
+class LockNotAcquired(Exception):
+    """Блокировку не удалось получить за отведенное время"""
+
+class LockError(Exception):
+    """Redis недоступен: занята блокировка или нет — неизвестно"""
+
+class LockLost(Exception):
+    """Блокировка истекла или перешла к другому владельцу до конца блока"""
+
 class RedisStorage:
-    def __init__(self, redis_url: str = "redis://localhost:6379/0"):
+    def __init__(self, redis_url: str = "redis://localhost:6379/0", serializer: Optional[CacheCodec] = None):
         try:
             self.redis = redis.from_url(redis_url, decode_responses=False)
+            # Асинхронный клиент для обработчиков; соединения создаются при первом обращении
+            self.aredis = redis.asyncio.from_url(redis_url, decode_responses=False)
             self.prefix = "anon_bot:"
+            self.serializer = serializer or get_serializer(Config.CACHE_SERIALIZER)
+            self._rate_limit_script = self.redis.register_script(_RATE_LIMIT_SCRIPT)
+            self._release_lock_script = self.redis.register_script(_RELEASE_LOCK_SCRIPT)
+            self._extend_lock_script = self.redis.register_script(_EXTEND_LOCK_SCRIPT)
+            self._acquire_lock_script = self.redis.register_script(_ACQUIRE_LOCK_SCRIPT)
+            self._stream_groups = set()
+            self._inbox_add_script = self.redis.register_script(_INBOX_ADD_SCRIPT)
+            self._inbox_page_script = self.redis.register_script(_INBOX_PAGE_SCRIPT)
+            self._inbox_read_script = self.redis.register_script(_INBOX_READ_SCRIPT)
+            self._inbox_count_script = self.redis.register_script(_INBOX_COUNT_SCRIPT)
+            self._async_rate_limit_script = self.aredis.register_script(_RATE_LIMIT_SCRIPT)
+            self._async_release_lock_script = self.aredis.register_script(_RELEASE_LOCK_SCRIPT)
+            self._async_extend_lock_script = self.aredis.register_script(_EXTEND_LOCK_SCRIPT)
+            self._async_acquire_lock_script = self.aredis.register_script(_ACQUIRE_LOCK_SCRIPT)
             self.redis.ping()  # Проверка подключения
             logger.info("✅ Redis подключен успешно")
         except Exception as e:
@@ -22,15 +186,75 @@ class RedisStorage:
     def _key(self, name: str) -> str:
         return f"{self.prefix}{name}"
     
+    # Ключи и разбор ответов общие для синхронных и async_* методов:
+    # различаются только сами обращения к Redis.
+    
+    def _cache_key(self, key: str) -> str:
+        return self._key(f"cache:{key}")
+    
+    def _lock_key(self, lock_name: str) -> str:
+        return self._key(f"lock:{lock_name}")
+    
+    def _stream_key(self, queue_name: str) -> str:
+        return self._key(f"stream:{queue_name}")
+    
+    def _dead_key(self, queue_name: str) -> str:
+        return self._key(f"queue_dead:{queue_name}")
+    
+    def _scan_keys(self, pattern: str):
+        """Инкрементально перебрать ключи по шаблону (SCAN не блокирует Redis, в отличие от KEYS)"""
+        return self.redis.scan_iter(match=pattern, count=Config.REDIS_SCAN_COUNT)
+    
+    def _unlink_keys(self, keys) -> int:
+        """Удалить ключи пачками через UNLINK (память освобождается в фоне)"""
+        deleted = 0
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= Config.REDIS_DELETE_BATCH:
+                deleted += self.redis.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += self.redis.unlink(*batch)
+        return deleted
+    
     # ==================== КЭШИРОВАНИЕ ДАННЫХ ====================
     
+    def _decode_cached(self, key: str, data: Optional[bytes], default: Any = None) -> Any:
+        if not data:
+            return default
+        try:
+            return self.serializer.loads(data)
+        except CodecError as e:
+            # Значение в старом или неизвестном формате считаем промахом кэша
+            logger.debug(f"Redis cache decode miss for {key}: {e}")
+            return default
+    
+    def _decode_cached_many(self, keys: List[str], values: List[Optional[bytes]]) -> Dict[str, Any]:
+        """{ключ: значение} для ответа MGET; промахи в результат не попадают"""
+        result = {}
+        for key, data in zip(keys, values):
+            value = self._decode_cached(key, data, _MISS)
+            if value is not _MISS:
+                result[key] = value
+        return result
+    
+    def _queue_cache_set(self, pipe, key: str, value: Any, ttl: int):
+        """Добавить в pipeline запись ключа кэша"""
+        serialized = self.serializer.dumps(value)
+        if ttl > 0:
+            pipe.setex(self._cache_key(key), ttl, serialized)
+        else:
+            pipe.set(self._cache_key(key), serialized)
+    
+    @staticmethod
+    def _item_ttl(ttl: Union[int, Dict[str, int]], key: str) -> int:
+        return ttl.get(key, 300) if isinstance(ttl, dict) else ttl
+    
     def cache_get(self, key: str, default: Any = None) -> Any:
         """Получить данные из кэша"""
         try:
-            data = self.redis.get(self._key(f"cache:{key}"))
-            if data:
-                return pickle.loads(data)
-            return default
+            return self._decode_cached(key, self.redis.get(self._cache_key(key)), default)
         except Exception as e:
             logger.error(f"❌ Redis cache get error: {e}")
             return default
@@ -38,11 +262,9 @@ class RedisStorage:
     def cache_set(self, key: str, value: Any, ttl: int = 300) -> bool:
         """Установить данные в кэш"""
         try:
-            serialized = pickle.dumps(value)
-            if ttl > 0:
-                self.redis.setex(self._key(f"cache:{key}"), ttl, serialized)
-            else:
-                self.redis.set(self._key(f"cache:{key}"), serialized)
+            with self.redis.pipeline(transaction=False) as pipe:
+                self._queue_cache_set(pipe, key, value, ttl)
+                pipe.execute()
             return True
         except Exception as e:
             logger.error(f"❌ Redis cache set error: {e}")
@@ -51,7 +273,7 @@ class RedisStorage:
     def cache_delete(self, key: str) -> bool:
         """Удалить данные из кэша"""
         try:
-            return self.redis.delete(self._key(f"cache:{key}")) > 0
+            return self.redis.delete(self._cache_key(key)) > 0
         except Exception as e:
             logger.error(f"❌ Redis cache delete error: {e}")
             return False
@@ -59,21 +281,63 @@ class RedisStorage:
     def cache_delete_pattern(self, pattern: str) -> int:
         """Удалить данные по шаблону"""
         try:
-            keys = self.redis.keys(self._key(f"cache:{pattern}"))
-            if keys:
-                return self.redis.delete(*keys)
-            return 0
+            return self._unlink_keys(self._scan_keys(self._key(f"cache:{pattern}")))
         except Exception as e:
             logger.error(f"❌ Redis cache delete pattern error: {e}")
             return 0
     
+    def cache_get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Получить несколько ключей через MGET; отсутствующих в ответе нет"""
+        result = {}
+        try:
+            for start in range(0, len(keys), Config.REDIS_PIPELINE_BATCH):
+                chunk = keys[start:start + Config.REDIS_PIPELINE_BATCH]
+                values = self.redis.mget([self._cache_key(key) for key in chunk])
+                result.update(self._decode_cached_many(chunk, values))
+            return result
+        except Exception as e:
+            logger.error(f"❌ Redis cache get many error: {e}")
+            return result
+    
+    def cache_set_many(self, items: Dict[str, Any], ttl: Union[int, Dict[str, int]] = 300) -> int:
+        """Установить несколько ключей пачками через pipeline.
+        
+        ttl — общий для всех ключей или словарь {ключ: ttl}; 0 — без срока.
+        Возвращает число записанных ключей.
+        """
+        written = 0
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    self._queue_cache_set(pipe, key, value, self._item_ttl(ttl, key))
+                    if len(pipe) >= Config.REDIS_PIPELINE_BATCH:
+                        written += len(pipe.execute())
+                written += len(pipe.execute())
+            return written
+        except Exception as e:
+            logger.error(f"❌ Redis cache set many error: {e}")
+            return written
+    
+    def cache_delete_many(self, keys: List[str]) -> int:
+        """Удалить несколько ключей пачками через UNLINK"""
+        try:
+            return self._unlink_keys(self._cache_key(key) for key in keys)
+        except Exception as e:
+            logger.error(f"❌ Redis cache delete many error: {e}")
+            return 0
+    
     def cache_get_size(self) -> Dict[str, int]:
-        """Получить размер кэша"""
+        """Получить размер кэша (память — оценка по первым 100 ключам)"""
         try:
-            cache_keys = self.redis.keys(self._key("cache:*"))
+            total_keys = 0
+            sampled_memory = 0
+            for key in self._scan_keys(self._key("cache:*")):
+                if total_keys < 100:
+                    sampled_memory += self.redis.memory_usage(key) or 0
+                total_keys += 1
             return {
-                'total_keys': len(cache_keys),
-                'memory_usage': self.redis.memory_usage(self._key("cache:") + "*") if cache_keys else 0
+                'total_keys': total_keys,
+                'memory_usage': sampled_memory * total_keys // min(total_keys, 100) if total_keys else 0
             }
         except Exception as e:
             logger.error(f"❌ Redis cache size error: {e}")
@@ -81,52 +345,85 @@ class RedisStorage:
     
     # ==================== RATE LIMITING ====================
     
-    def check_rate_limit(self, key: str, limit: int, period: int) -> bool:
-        """Проверить rate limit"""
+    def _rate_limit_call(self, key: str, limit: int, period: float) -> Dict[str, list]:
+        """Аргументы вызова _RATE_LIMIT_SCRIPT"""
+        return {
+            'keys': [self._key(f"ratelimit:{key}"), self._key(f"ratelimit_meta:{key}")],
+            'args': [limit, max(1, int(period * 1000)), uuid.uuid4().hex]
+        }
+    
+    @staticmethod
+    def _rate_limit_result(response: list) -> Dict[str, Any]:
+        allowed, remaining, retry_after = response
+        return {
+            'allowed': bool(allowed),
+            'remaining': int(remaining),
+            'retry_after': int(retry_after) / 1000
+        }
+    
+    def hit_rate_limit(self, key: str, limit: int, period: float) -> Dict[str, Any]:
+        """Учесть запрос в скользящем окне (period секунд) и вернуть результат"""
         try:
-            redis_key = self._key(f"ratelimit:{key}")
-            current = self.redis.llen(redis_key)
-            
-            if current >= limit:
-                return False
-            
-            # Добавляем текущее время в список
-            self.redis.rpush(redis_key, datetime.now().isoformat())
-            # Устанавливаем время жизни для всего списка
-            self.redis.expire(redis_key, period)
-            return True
-            
+            return self._rate_limit_result(self._rate_limit_script(**self._rate_limit_call(key, limit, period)))
         except Exception as e:
             logger.error(f"❌ Redis rate limit error: {e}")
-            return True
+            return {'allowed': True, 'remaining': limit, 'retry_after': 0}
+    
+    def check_rate_limit(self, key: str, limit: int, period: int) -> bool:
+        """Проверить rate limit"""
+        return self.hit_rate_limit(key, limit, period)['allowed']
     
     def get_rate_limit_info(self, key: str) -> Dict[str, Any]:
         """Получить информацию о rate limit"""
         try:
             redis_key = self._key(f"ratelimit:{key}")
-            requests = self.redis.lrange(redis_key, 0, -1)
-            ttl = self.redis.ttl(redis_key)
+            meta = self.redis.hgetall(self._key(f"ratelimit_meta:{key}"))
+            if not meta:
+                return {'current': 0, 'limit': None, 'period': None, 'remaining': None,
+                        'requests': [], 'reset_in': 0, 'ttl': -2, 'limit_reached': False}
+            
+            limit = int(meta[b'limit'])
+            period_ms = int(meta[b'period'])
+            seconds, microseconds = self.redis.time()
+            now_ms = seconds * 1000 + microseconds // 1000
+            
+            with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrangebyscore(redis_key, now_ms - period_ms + 1, '+inf', withscores=True)
+                pipe.pttl(redis_key)
+                entries, ttl_ms = pipe.execute()
+            
+            current = len(entries)
+            reset_in = max(0, entries[0][1] + period_ms - now_ms) / 1000 if current >= limit else 0
             
             return {
-                'current': len(requests),
-                'requests': [req.decode('utf-8') for req in requests],
-                'ttl': ttl,
-                'limit_reached': len(requests) >= 5  # Пример лимита
+                'current': current,
+                'limit': limit,
+                'period': period_ms / 1000,
+                'remaining': max(0, limit - current),
+                'requests': [datetime.fromtimestamp(score / 1000).isoformat() for _, score in entries],
+                'reset_in': reset_in,
+                'ttl': ttl_ms // 1000 if ttl_ms >= 0 else ttl_ms,
+                'limit_reached': current >= limit
             }
         except Exception as e:
             logger.error(f"❌ Redis rate limit info error: {e}")
-            return {'current': 0, 'requests': [], 'ttl': -1, 'limit_reached': False}
+            return {'current': 0, 'limit': None, 'period': None, 'remaining': None,
+                    'requests': [], 'reset_in': 0, 'ttl': -1, 'limit_reached': False}
     
     def clear_rate_limit(self, key: str) -> bool:
         """Очистить rate limit для ключа"""
         try:
-            return self.redis.delete(self._key(f"ratelimit:{key}")) > 0
+            return self.redis.delete(self._key(f"ratelimit:{key}"), self._key(f"ratelimit_meta:{key}")) > 0
         except Exception as e:
             logger.error(f"❌ Redis rate limit clear error: {e}")
             return False
     
     # ==================== ОЧЕРЕДИ СООБЩЕНИЙ ====================
     
+    @staticmethod
+    def _decode_message(data: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        return json.loads(data.decode('utf-8')) if data else None
+    
     def queue_push(self, queue_name: str, message: Dict[str, Any]) -> bool:
         """Добавить сообщение в очередь"""
         try:
@@ -142,13 +439,8 @@ class RedisStorage:
         try:
             if timeout > 0:
                 result = self.redis.blpop(self._key(f"queue:{queue_name}"), timeout)
-                if result:
-                    _, data = result
-                    return json.loads(data.decode('utf-8'))
-                return None
-            else:
-                data = self.redis.lpop(self._key(f"queue:{queue_name}"))
-                return json.loads(data.decode('utf-8')) if data else None
+                return self._decode_message(result[1] if result else None)
+            return self._decode_message(self.redis.lpop(self._key(f"queue:{queue_name}")))
         except Exception as e:
             logger.error(f"❌ Redis queue pop error: {e}")
             return None
@@ -156,14 +448,9 @@ class RedisStorage:
     def queue_bulk_pop(self, queue_name: str, count: int = 10) -> List[Dict[str, Any]]:
         """Извлечь несколько сообщений из очереди"""
         try:
-            with self.redis.pipeline() as pipe:
-                pipe.lrange(self._key(f"queue:{queue_name}"), 0, count - 1)
-                pipe.ltrim(self._key(f"queue:{queue_name}"), count, -1)
-                results = pipe.execute()
-                
-                if results[0]:
-                    return [json.loads(item.decode('utf-8')) for item in results[0]]
-                return []
+            # LPOP с count атомарен: параллельный RPUSH не попадет между чтением и обрезкой
+            items = self.redis.lpop(self._key(f"queue:{queue_name}"), count)
+            return [json.loads(item.decode('utf-8')) for item in items] if items else []
         except Exception as e:
             logger.error(f"❌ Redis queue bulk pop error: {e}")
             return []
@@ -197,33 +484,267 @@ class RedisStorage:
             logger.error(f"❌ Redis queue info error: {e}")
             return {'name': queue_name, 'length': 0, 'memory_usage': 0}
     
-    # ==================== СИСТЕМА БЛОКИРОВОК ====================
+    # ==================== НАДЕЖНЫЕ ОЧЕРЕДИ ====================
+    # Redis Streams с группой потребителей: сообщение остается в stream до
+    # подтверждения (reliable_ack). Неподтвержденное за visibility_timeout
+    # забирает другой потребитель; после MAX_QUEUE_RETRIES повторов сообщение
+    # уходит в очередь мертвых писем queue_dead:{queue_name}.
     
-    def acquire_lock(self, lock_name: str, ttl: int = 10) -> bool:
-        """Получить распределенную блокировку"""
+    def _ensure_group(self, queue_name: str, group: str):
+        if (queue_name, group) in self._stream_groups:
+            return
         try:
-            return self.redis.set(
-                self._key(f"lock:{lock_name}"),
-                "1",
-                ex=ttl,
-                nx=True
+            self.redis.xgroup_create(self._stream_key(queue_name), group, id='0', mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._stream_groups.add((queue_name, group))
+    
+    def _forget_group(self, queue_name: str, group: str, error: Exception) -> bool:
+        """Группа пропала вместе с удаленным stream (UNLINK, FLUSHDB): забыть ее,
+        чтобы следующий вызов создал ее заново. False — ошибка другая."""
+        if not isinstance(error, redis.exceptions.ResponseError) or 'NOGROUP' not in str(error):
+            return False
+        self._stream_groups.discard((queue_name, group))
+        logger.warning(f"⚠️ Группа {group} очереди {queue_name} пропала, создаем заново")
+        return True
+    
+    @staticmethod
+    def _encode_entry(message: Dict[str, Any]) -> Dict[str, str]:
+        return {'data': json.dumps(message, ensure_ascii=False)}
+    
+    def reliable_push(self, queue_name: str, message: Dict[str, Any]) -> Optional[str]:
+        """Добавить сообщение в надежную очередь, вернуть его id"""
+        try:
+            entry_id = self.redis.xadd(self._stream_key(queue_name), self._encode_entry(message))
+            return entry_id.decode('utf-8')
+        except Exception as e:
+            logger.error(f"❌ Redis reliable push error: {e}")
+            return None
+    
+    def reliable_pop(self, queue_name: str, consumer: str, count: int = 10, block: int = 0,
+                     visibility_timeout: int = Config.QUEUE_VISIBILITY_TIMEOUT,
+                     group: str = STREAM_GROUP) -> List[tuple]:
+        """Взять до count сообщений: (id, сообщение). block — ожидание новых в мс.
+        
+        Сначала забираются сообщения, не подтвержденные другими потребителями
+        дольше visibility_timeout секунд, затем новые.
+        """
+        args = (queue_name, consumer, count, block, visibility_timeout, group)
+        try:
+            try:
+                entries = self._read_group(*args)
+            except redis.exceptions.ResponseError as e:
+                if not self._forget_group(queue_name, group, e):
+                    raise
+                entries = self._read_group(*args)
+            return self._decode_entries(entries)
+        except Exception as e:
+            logger.error(f"❌ Redis reliable pop error: {e}")
+            return []
+    
+    def _read_group(self, queue_name: str, consumer: str, count: int, block: int,
+                    visibility_timeout: int, group: str) -> List[tuple]:
+        self._ensure_group(queue_name, group)
+        entries = self._reclaim_expired(queue_name, consumer, count, visibility_timeout, group)
+        
+        if len(entries) < count:
+            response = self.redis.xreadgroup(
+                group, consumer, {self._stream_key(queue_name): '>'},
+                count=count - len(entries), block=block or None
             )
+            for _, items in response or []:
+                entries.extend(items)
+        return entries
+    
+    @staticmethod
+    def _decode_entries(entries: List[tuple]) -> List[tuple]:
+        return [
+            (entry_id.decode('utf-8'), json.loads(fields[b'data'].decode('utf-8')))
+            for entry_id, fields in entries
+        ]
+    
+    @staticmethod
+    def _claimed_entries(response: list) -> List[tuple]:
+        # Записи, удаленные из stream, XAUTOCLAIM возвращает без полей
+        return [(entry_id, fields) for entry_id, fields in response[1] if fields]
+    
+    @staticmethod
+    def _queue_pending_lookups(pipe, stream: str, group: str, claimed: List[tuple]):
+        """Добавить в pipeline запрос счетчика доставок каждой записи"""
+        for entry_id, _ in claimed:
+            pipe.xpending_range(stream, group, min=entry_id, max=entry_id, count=1)
+    
+    def _reclaim_expired(self, queue_name: str, consumer: str, count: int,
+                         visibility_timeout: int, group: str) -> List[tuple]:
+        stream = self._stream_key(queue_name)
+        claimed = self._claimed_entries(self.redis.xautoclaim(
+            stream, group, consumer, min_idle_time=visibility_timeout * 1000, start_id='0-0', count=count
+        ))
+        if not claimed:
+            return []
+        
+        with self.redis.pipeline(transaction=False) as pipe:
+            self._queue_pending_lookups(pipe, stream, group, claimed)
+            pending = pipe.execute()
+        
+        entries, dead = self._split_reclaimed(claimed, pending)
+        if dead:
+            with self.redis.pipeline() as pipe:
+                self._queue_dead_letters(pipe, queue_name, group, dead)
+                pipe.execute()
+        return entries
+    
+    @staticmethod
+    def _split_reclaimed(claimed: List[tuple], pending: List[list]):
+        """Разделить забранные записи на живые и исчерпавшие повторы"""
+        entries, dead = [], []
+        for (entry_id, fields), info in zip(claimed, pending):
+            deliveries = info[0]['times_delivered'] if info else 1
+            if deliveries - 1 > Config.MAX_QUEUE_RETRIES:
+                dead.append((entry_id, fields, deliveries))
+            else:
+                entries.append((entry_id, fields))
+        return entries, dead
+    
+    def _queue_dead_letters(self, pipe, queue_name: str, group: str, dead: List[tuple]):
+        """Добавить в pipeline перенос записей в мертвые письма"""
+        stream = self._stream_key(queue_name)
+        for entry_id, fields, deliveries in dead:
+            record = {
+                'id': entry_id.decode('utf-8'),
+                'message': json.loads(fields[b'data'].decode('utf-8')),
+                'deliveries': deliveries,
+                'dead_at': datetime.now().isoformat()
+            }
+            pipe.rpush(self._dead_key(queue_name), json.dumps(record, ensure_ascii=False))
+            pipe.xack(stream, group, entry_id)
+            pipe.xdel(stream, entry_id)
+            logger.warning(f"⚠️ Сообщение {record['id']} из очереди {queue_name} перенесено в мертвые письма после {deliveries} доставок")
+    
+    def _queue_ack(self, pipe, queue_name: str, group: str, entry_ids):
+        """Добавить в pipeline подтверждение и удаление записей"""
+        stream = self._stream_key(queue_name)
+        pipe.xack(stream, group, *entry_ids)
+        pipe.xdel(stream, *entry_ids)
+    
+    def reliable_ack(self, queue_name: str, *entry_ids: str, group: str = STREAM_GROUP) -> int:
+        """Подтвердить обработку и удалить сообщения из очереди"""
+        if not entry_ids:
+            return 0
+        try:
+            with self.redis.pipeline() as pipe:
+                self._queue_ack(pipe, queue_name, group, entry_ids)
+                acked, _ = pipe.execute()
+            return acked
+        except Exception as e:
+            logger.error(f"❌ Redis reliable ack error: {e}")
+            return 0
+    
+    def reliable_extend(self, queue_name: str, consumer: str, *entry_ids: str, group: str = STREAM_GROUP) -> bool:
+        """Продлить видимость долго обрабатываемых сообщений (счетчик доставок не растет)"""
+        if not entry_ids:
+            return False
+        try:
+            self.redis.xclaim(self._stream_key(queue_name), group, consumer, 0, list(entry_ids), justid=True)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Redis reliable extend error: {e}")
+            return False
+    
+    def get_dead_letters(self, queue_name: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Получить сообщения из очереди мертвых писем"""
+        try:
+            items = self.redis.lrange(self._dead_key(queue_name), 0, limit - 1)
+            return [json.loads(item.decode('utf-8')) for item in items]
+        except Exception as e:
+            logger.error(f"❌ Redis dead letters error: {e}")
+            return []
+    
+    def requeue_dead_letters(self, queue_name: str, count: int = 100) -> int:
+        """Вернуть мертвые письма в очередь с обнуленным счетчиком доставок"""
+        requeued = 0
+        try:
+            items = self.redis.lpop(self._dead_key(queue_name), count) or []
+            for item in items:
+                if self.reliable_push(queue_name, json.loads(item.decode('utf-8'))['message']):
+                    requeued += 1
+            return requeued
+        except Exception as e:
+            logger.error(f"❌ Redis requeue dead letters error: {e}")
+            return requeued
+    
+    def get_reliable_queue_info(self, queue_name: str, group: str = STREAM_GROUP) -> Dict[str, Any]:
+        """Получить информацию о надежной очереди"""
+        try:
+            try:
+                self._ensure_group(queue_name, group)
+                pending = self.redis.xpending(self._stream_key(queue_name), group)
+            except redis.exceptions.ResponseError as e:
+                if not self._forget_group(queue_name, group, e):
+                    raise
+                self._ensure_group(queue_name, group)
+                pending = self.redis.xpending(self._stream_key(queue_name), group)
+            return {
+                'name': queue_name,
+                'length': self.redis.xlen(self._stream_key(queue_name)),
+                'pending': pending['pending'],
+                'consumers': len(pending['consumers']),
+                'dead': self.redis.llen(self._dead_key(queue_name))
+            }
+        except Exception as e:
+            logger.error(f"❌ Redis reliable queue info error: {e}")
+            return {'name': queue_name, 'length': 0, 'pending': 0, 'consumers': 0, 'dead': 0}
+    
+    # ==================== СИСТЕМА БЛОКИРОВОК ====================
+    
+    def acquire_lock(self, lock_name: str, ttl: int = 10, token: Optional[str] = None) -> bool:
+        """Получить распределенную блокировку (token — идентификатор владельца)"""
+        try:
+            return bool(self.redis.set(self._lock_key(lock_name), token or "1", ex=ttl, nx=True))
         except Exception as e:
             logger.error(f"❌ Redis lock acquire error: {e}")
             return False
     
-    def release_lock(self, lock_name: str) -> bool:
-        """Освободить распределенную блокировку"""
+    def release_lock(self, lock_name: str, token: Optional[str] = None) -> bool:
+        """Освободить распределенную блокировку; с token — только свою"""
         try:
-            return self.redis.delete(self._key(f"lock:{lock_name}")) > 0
+            if token is None:
+                return self.redis.delete(self._lock_key(lock_name)) > 0
+            return bool(self._release_lock_script(keys=[self._lock_key(lock_name)], args=[token]))
         except Exception as e:
             logger.error(f"❌ Redis lock release error: {e}")
             return False
     
+    def extend_lock(self, lock_name: str, token: str, ttl: int = 10) -> bool:
+        """Продлить свою блокировку на ttl секунд"""
+        try:
+            return bool(self._extend_lock_script(keys=[self._lock_key(lock_name)], args=[token, int(ttl * 1000)]))
+        except Exception as e:
+            logger.error(f"❌ Redis lock extend error: {e}")
+            return False
+    
+    def lock(self, lock_name: str, ttl: float = 10, timeout: Optional[float] = None,
+             retry_interval: float = 0.1) -> 'RedisLock':
+        """Создать блокировку с токеном владельца (см. RedisLock)"""
+        return RedisLock(self, lock_name, ttl, timeout, retry_interval)
+    
+    @staticmethod
+    def _decode_owner(owner: Optional[bytes]) -> Optional[str]:
+        return owner.decode('utf-8') if owner is not None else None
+    
+    def get_lock_owner(self, lock_name: str) -> Optional[str]:
+        """Получить токен владельца блокировки"""
+        try:
+            return self._decode_owner(self.redis.get(self._lock_key(lock_name)))
+        except Exception as e:
+            logger.error(f"❌ Redis lock owner error: {e}")
+            return None
+    
     def check_lock(self, lock_name: str) -> bool:
         """Проверить наличие блокировки"""
         try:
-            return self.redis.exists(self._key(f"lock:{lock_name}")) > 0
+            return self.redis.exists(self._lock_key(lock_name)) > 0
         except Exception as e:
             logger.error(f"❌ Redis lock check error: {e}")
             return False
@@ -266,50 +787,78 @@ class RedisStorage:
             return False
     
     # ==================== СИСТЕМА УВЕДОМЛЕНИЙ ====================
+    # Ящик пользователя: ZSET id по сроку жизни, HASH с уведомлениями и SET
+    # прочитанных id. У каждого уведомления свой ttl; хранится не больше
+    # NOTIFICATIONS_INBOX_SIZE неистекших; каждая операция — один вызов скрипта.
+    
+    def _inbox_keys(self, user_id: int) -> List[str]:
+        return [
+            self._key(f"inbox:{user_id}"),
+            self._key(f"inbox_data:{user_id}"),
+            self._key(f"inbox_read:{user_id}")
+        ]
     
-    def add_notification(self, user_id: int, notification_type: str, data: Dict[str, Any], ttl: int = 86400) -> bool:
-        """Добавить уведомление"""
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+    
+    def add_notification(self, user_id: int, notification_type: str, data: Dict[str, Any], ttl: int = 86400) -> Optional[str]:
+        """Добавить уведомление, вернуть его id"""
         try:
-            notification = {
-                'id': str(datetime.now().timestamp()),
+            created_at = datetime.now()
+            now_ms = int(created_at.timestamp() * 1000)
+            notification_id = uuid.uuid4().hex
+            payload = self.serializer.dumps({
                 'type': notification_type,
                 'data': data,
-                'created_at': datetime.now().isoformat(),
-                'read': False
-            }
-            return self.cache_set(f"notifications:{user_id}:{notification['id']}", notification, ttl)
+                'created_at': created_at.isoformat()
+            })
+            self._inbox_add_script(
+                keys=self._inbox_keys(user_id),
+                args=[notification_id, payload, now_ms, now_ms + ttl * 1000, Config.NOTIFICATIONS_INBOX_SIZE]
+            )
+            return notification_id
         except Exception as e:
             logger.error(f"❌ Redis notification add error: {e}")
-            return False
+            return None
     
-    def get_user_notifications(self, user_id: int) -> List[Dict[str, Any]]:
-        """Получить уведомления пользователя"""
+    def get_user_notifications(self, user_id: int, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Получить неистекшие уведомления пользователя, позже истекающие первыми
+        (при одинаковом ttl — новые первыми)"""
         try:
-            pattern = self._key(f"cache:notifications:{user_id}:*")
-            keys = self.redis.keys(pattern)
+            flat = self._inbox_page_script(
+                keys=self._inbox_keys(user_id), args=[offset, offset + limit - 1, self._now_ms()]
+            )
             notifications = []
-            
-            for key in keys:
-                data = self.redis.get(key)
-                if data:
-                    notifications.append(pickle.loads(data))
-            
-            return sorted(notifications, key=lambda x: x['created_at'], reverse=True)
+            for i in range(0, len(flat), 3):
+                notification_id, payload, is_read = flat[i:i + 3]
+                if payload is None:
+                    continue
+                try:
+                    notification = self.serializer.loads(payload)
+                except CodecError:
+                    continue
+                notification['id'] = notification_id.decode('utf-8')
+                notification['read'] = bool(is_read)
+                notifications.append(notification)
+            return notifications
         except Exception as e:
             logger.error(f"❌ Redis notifications get error: {e}")
             return []
     
+    def count_unread_notifications(self, user_id: int) -> int:
+        """Количество непрочитанных уведомлений"""
+        try:
+            return max(0, self._inbox_count_script(keys=self._inbox_keys(user_id), args=[self._now_ms()]))
+        except Exception as e:
+            logger.error(f"❌ Redis notifications count error: {e}")
+            return 0
+    
     def mark_notification_read(self, user_id: int, notification_id: str) -> bool:
         """Пометить уведомление как прочитанное"""
         try:
-            key = self._key(f"cache:notifications:{user_id}:{notification_id}")
-            data = self.redis.get(key)
-            if data:
-                notification = pickle.loads(data)
-                notification['read'] = True
-                self.redis.set(key, pickle.dumps(notification))
-                return True
-            return False
+            inbox_key, _, read_key = self._inbox_keys(user_id)
+            return bool(self._inbox_read_script(keys=[inbox_key, read_key], args=[notification_id, self._now_ms()]))
         except Exception as e:
             logger.error(f"❌ Redis notification mark read error: {e}")
             return False
@@ -317,11 +866,12 @@ class RedisStorage:
     def clear_notifications(self, user_id: int) -> int:
         """Очистить уведомления пользователя"""
         try:
-            pattern = self._key(f"cache:notifications:{user_id}:*")
-            keys = self.redis.keys(pattern)
-            if keys:
-                return self.redis.delete(*keys)
-            return 0
+            keys = self._inbox_keys(user_id)
+            with self.redis.pipeline() as pipe:
+                pipe.zcard(keys[0])
+                pipe.unlink(*keys)
+                count, _ = pipe.execute()
+            return count
         except Exception as e:
             logger.error(f"❌ Redis notifications clear error: {e}")
             return 0
@@ -372,6 +922,38 @@ class RedisStorage:
             logger.error(f"❌ Redis metric get error: {e}")
             return default
     
+    # ==================== СОБЫТИЯ МЕЖДУ ЭКЗЕМПЛЯРАМИ ====================
+    
+    def publish_event(self, channel: str, message: Dict[str, Any]) -> int:
+        """Опубликовать событие для всех экземпляров бота"""
+        try:
+            return self.redis.publish(self._key(f"events:{channel}"), json.dumps(message, ensure_ascii=False))
+        except Exception as e:
+            logger.error(f"❌ Redis publish error: {e}")
+            return 0
+    
+    def subscribe_events(self, channel: str, handler) -> Optional[Any]:
+        """Подписаться на события канала; handler вызывается в фоновом потоке"""
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            
+            def on_message(message):
+                try:
+                    handler(json.loads(message['data']))
+                except Exception as e:
+                    logger.error(f"❌ Redis event handler error ({channel}): {e}")
+            
+            def on_error(error, pubsub, thread):
+                # Поток не должен умирать при обрыве: переподписка выполнится при следующем чтении
+                logger.error(f"❌ Redis subscription error ({channel}): {error}")
+                time.sleep(1)
+            
+            pubsub.subscribe(**{self._key(f"events:{channel}"): on_message})
+            return pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=on_error)
+        except Exception as e:
+            logger.error(f"❌ Redis subscribe error: {e}")
+            return None
+    
     # ==================== СЛУЖЕБНЫЕ МЕТОДЫ ====================
     
     def get_info(self) -> Dict[str, Any]:
@@ -403,10 +985,7 @@ class RedisStorage:
     def flush_pattern(self, pattern: str) -> int:
         """Очистить данные по шаблону"""
         try:
-            keys = self.redis.keys(self._key(pattern))
-            if keys:
-                return self.redis.delete(*keys)
-            return 0
+            return self._unlink_keys(self._scan_keys(self._key(pattern)))
         except Exception as e:
             logger.error(f"❌ Redis flush pattern error: {e}")
             return 0
@@ -434,30 +1013,402 @@ class RedisStorage:
             return {}
     
     # ==================== АСИНХРОННЫЕ МЕТОДЫ ====================
+    # Нативный asyncio-клиент (redis.asyncio) с общим пулом соединений:
+    # обращения не блокируют event loop и не занимают потоки пула.
     
     async def async_cache_get(self, key: str, default: Any = None) -> Any:
         """Асинхронно получить данные из кэша"""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, self.cache_get, key, default
-        )
+        try:
+            return self._decode_cached(key, await self.aredis.get(self._cache_key(key)), default)
+        except Exception as e:
+            logger.error(f"❌ Redis async cache get error: {e}")
+            return default
     
     async def async_cache_set(self, key: str, value: Any, ttl: int = 300) -> bool:
         """Асинхронно установить данные в кэш"""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, self.cache_set, key, value, ttl
-        )
+        try:
+            async with self.aredis.pipeline(transaction=False) as pipe:
+                self._queue_cache_set(pipe, key, value, ttl)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Redis async cache set error: {e}")
+            return False
+    
+    async def async_cache_delete(self, key: str) -> bool:
+        """Асинхронно удалить данные из кэша"""
+        try:
+            return await self.aredis.delete(self._cache_key(key)) > 0
+        except Exception as e:
+            logger.error(f"❌ Redis async cache delete error: {e}")
+            return False
+    
+    async def async_cache_get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Асинхронно получить несколько ключей через MGET"""
+        result = {}
+        try:
+            for start in range(0, len(keys), Config.REDIS_PIPELINE_BATCH):
+                chunk = keys[start:start + Config.REDIS_PIPELINE_BATCH]
+                values = await self.aredis.mget([self._cache_key(key) for key in chunk])
+                result.update(self._decode_cached_many(chunk, values))
+            return result
+        except Exception as e:
+            logger.error(f"❌ Redis async cache get many error: {e}")
+            return result
+    
+    async def async_cache_set_many(self, items: Dict[str, Any], ttl: Union[int, Dict[str, int]] = 300) -> int:
+        """Асинхронно установить несколько ключей пачками через pipeline"""
+        written = 0
+        try:
+            async with self.aredis.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    self._queue_cache_set(pipe, key, value, self._item_ttl(ttl, key))
+                    if len(pipe) >= Config.REDIS_PIPELINE_BATCH:
+                        written += len(await pipe.execute())
+                written += len(await pipe.execute())
+            return written
+        except Exception as e:
+            logger.error(f"❌ Redis async cache set many error: {e}")
+            return written
+    
+    async def async_hit_rate_limit(self, key: str, limit: int, period: float) -> Dict[str, Any]:
+        """Асинхронно учесть запрос в скользящем окне"""
+        try:
+            return self._rate_limit_result(
+                await self._async_rate_limit_script(**self._rate_limit_call(key, limit, period))
+            )
+        except Exception as e:
+            logger.error(f"❌ Redis async rate limit error: {e}")
+            return {'allowed': True, 'remaining': limit, 'retry_after': 0}
     
     async def async_queue_push(self, queue_name: str, message: Dict[str, Any]) -> bool:
         """Асинхронно добавить сообщение в очередь"""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, self.queue_push, queue_name, message
-        )
+        try:
+            await self.aredis.rpush(self._key(f"queue:{queue_name}"), json.dumps(message, ensure_ascii=False))
+            return True
+        except Exception as e:
+            logger.error(f"❌ Redis async queue push error: {e}")
+            return False
     
     async def async_queue_pop(self, queue_name: str, timeout: int = 0) -> Optional[Dict[str, Any]]:
-        """Асинхронно извлечь сообщение из очереди"""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, self.queue_pop, queue_name, timeout
-        )
+        """Асинхронно извлечь сообщение из очереди (BLPOP не блокирует event loop)"""
+        try:
+            if timeout > 0:
+                result = await self.aredis.blpop(self._key(f"queue:{queue_name}"), timeout)
+                return self._decode_message(result[1] if result else None)
+            return self._decode_message(await self.aredis.lpop(self._key(f"queue:{queue_name}")))
+        except Exception as e:
+            logger.error(f"❌ Redis async queue pop error: {e}")
+            return None
+    
+    async def async_acquire_lock(self, lock_name: str, ttl: int = 10, token: Optional[str] = None) -> bool:
+        """Асинхронно получить распределенную блокировку"""
+        try:
+            return bool(await self.aredis.set(self._lock_key(lock_name), token or "1", ex=ttl, nx=True))
+        except Exception as e:
+            logger.error(f"❌ Redis async lock acquire error: {e}")
+            return False
+    
+    async def async_release_lock(self, lock_name: str, token: Optional[str] = None) -> bool:
+        """Асинхронно освободить блокировку; с token — только свою"""
+        try:
+            if token is None:
+                return await self.aredis.delete(self._lock_key(lock_name)) > 0
+            return bool(await self._async_release_lock_script(keys=[self._lock_key(lock_name)], args=[token]))
+        except Exception as e:
+            logger.error(f"❌ Redis async lock release error: {e}")
+            return False
+    
+    async def async_extend_lock(self, lock_name: str, token: str, ttl: int = 10) -> bool:
+        """Асинхронно продлить свою блокировку"""
+        try:
+            return bool(await self._async_extend_lock_script(keys=[self._lock_key(lock_name)], args=[token, int(ttl * 1000)]))
+        except Exception as e:
+            logger.error(f"❌ Redis async lock extend error: {e}")
+            return False
+    
+    async def async_get_lock_owner(self, lock_name: str) -> Optional[str]:
+        """Асинхронно получить токен владельца блокировки"""
+        try:
+            return self._decode_owner(await self.aredis.get(self._lock_key(lock_name)))
+        except Exception as e:
+            logger.error(f"❌ Redis async lock owner error: {e}")
+            return None
+    
+    async def _async_ensure_group(self, queue_name: str, group: str):
+        if (queue_name, group) in self._stream_groups:
+            return
+        try:
+            await self.aredis.xgroup_create(self._stream_key(queue_name), group, id='0', mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._stream_groups.add((queue_name, group))
+    
+    async def async_reliable_push(self, queue_name: str, message: Dict[str, Any]) -> Optional[str]:
+        """Асинхронно добавить сообщение в надежную очередь"""
+        try:
+            entry_id = await self.aredis.xadd(self._stream_key(queue_name), self._encode_entry(message))
+            return entry_id.decode('utf-8')
+        except Exception as e:
+            logger.error(f"❌ Redis async reliable push error: {e}")
+            return None
+    
+    async def async_reliable_pop(self, queue_name: str, consumer: str, count: int = 10, block: int = 0,
+                                 visibility_timeout: int = Config.QUEUE_VISIBILITY_TIMEOUT,
+                                 group: str = STREAM_GROUP) -> List[tuple]:
+        """Асинхронно взять сообщения из надежной очереди (см. reliable_pop).
+        
+        В отличие от reliable_pop ошибки Redis не глушатся: воркер должен
+        отличать пустую очередь от недоступного Redis и делать паузу.
+        """
+        args = (queue_name, consumer, count, block, visibility_timeout, group)
+        try:
+            entries = await self._async_read_group(*args)
+        except redis.exceptions.ResponseError as e:
+            if not self._forget_group(queue_name, group, e):
+                raise
+            entries = await self._async_read_group(*args)
+        return self._decode_entries(entries)
+    
+    async def _async_read_group(self, queue_name: str, consumer: str, count: int, block: int,
+                                visibility_timeout: int, group: str) -> List[tuple]:
+        await self._async_ensure_group(queue_name, group)
+        entries = await self._async_reclaim_expired(queue_name, consumer, count, visibility_timeout, group)
+        
+        if len(entries) < count:
+            response = await self.aredis.xreadgroup(
+                group, consumer, {self._stream_key(queue_name): '>'},
+                count=count - len(entries), block=block or None
+            )
+            for _, items in response or []:
+                entries.extend(items)
+        return entries
+    
+    async def _async_reclaim_expired(self, queue_name: str, consumer: str, count: int,
+                                     visibility_timeout: int, group: str) -> List[tuple]:
+        stream = self._stream_key(queue_name)
+        claimed = self._claimed_entries(await self.aredis.xautoclaim(
+            stream, group, consumer, min_idle_time=visibility_timeout * 1000, start_id='0-0', count=count
+        ))
+        if not claimed:
+            return []
+        
+        async with self.aredis.pipeline(transaction=False) as pipe:
+            self._queue_pending_lookups(pipe, stream, group, claimed)
+            pending = await pipe.execute()
+        
+        entries, dead = self._split_reclaimed(claimed, pending)
+        if dead:
+            async with self.aredis.pipeline() as pipe:
+                self._queue_dead_letters(pipe, queue_name, group, dead)
+                await pipe.execute()
+        return entries
+    
+    async def async_reliable_ack(self, queue_name: str, *entry_ids: str, group: str = STREAM_GROUP) -> int:
+        """Асинхронно подтвердить обработку и удалить сообщения"""
+        if not entry_ids:
+            return 0
+        try:
+            async with self.aredis.pipeline() as pipe:
+                self._queue_ack(pipe, queue_name, group, entry_ids)
+                acked, _ = await pipe.execute()
+            return acked
+        except Exception as e:
+            logger.error(f"❌ Redis async reliable ack error: {e}")
+            return 0
+    
+    async def async_close(self):
+        """Закрыть пул соединений асинхронного клиента"""
+        try:
+            # aclose появился в redis-py 5, close оставлен для 4.x
+            close = getattr(self.aredis, 'aclose', None) or self.aredis.close
+            await close()
+        except Exception as e:
+            logger.error(f"❌ Redis async close error: {e}")
+
+class RedisLock:
+    """Распределенная блокировка со случайным токеном владельца.
+
+    Снять или продлить блокировку может только ее владелец. При каждом захвате
+    выдается fencing_token — номер, который растет с каждым новым владельцем;
+    его можно передавать в операции, чтобы отсекать записи от владельца,
+    блокировка которого уже истекла.
+
+    timeout: None — ждать бесконечно, 0 — одна попытка, иначе секунды ожидания.
+    Контекстные менеджеры (with / async with) бросают LockNotAcquired, если
+    блокировка занята, и LockError, если Redis недоступен. async with продлевает
+    TTL, пока блок выполняется; если продлить не удалось, выставляется lost, а
+    при выходе из блока бросается LockLost. Длинные операции могут проверять
+    is_current() между шагами и прерываться, если владелец уже сменился.
+    """
+
+    def __init__(self, storage: 'RedisStorage', name: str, ttl: float = 10,
+                 timeout: Optional[float] = None, retry_interval: float = 0.1):
+        self.storage = storage
+        self.name = name
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.token: Optional[str] = None
+        self.fencing_token: Optional[int] = None
+        self.lost = False
+        self._renew_task: Optional[asyncio.Task] = None
+
+    @property
+    def locked(self) -> bool:
+        return self.token is not None
+
+    def _lock_keys(self) -> List[str]:
+        return [self.storage._lock_key(self.name), self.storage._key(f"lock_fence:{self.name}")]
+
+    def _take(self, token: str, fence) -> bool:
+        if not fence:
+            return False
+        self.token = token
+        self.fencing_token = int(fence)
+        return True
+
+    def _try_acquire(self) -> bool:
+        token = secrets.token_hex(16)
+        try:
+            fence = self.storage._acquire_lock_script(keys=self._lock_keys(), args=[token, int(self.ttl * 1000)])
+        except Exception as e:
+            raise LockError(f"{self.name}: {e}") from e
+        return self._take(token, fence)
+
+    async def _try_acquire_async(self) -> bool:
+        token = secrets.token_hex(16)
+        try:
+            fence = await self.storage._async_acquire_lock_script(
+                keys=self._lock_keys(), args=[token, int(self.ttl * 1000)]
+            )
+        except Exception as e:
+            raise LockError(f"{self.name}: {e}") from e
+        return self._take(token, fence)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Захватить блокировку, ожидая до timeout секунд"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.retry_interval)
+        return True
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """Захватить блокировку, не блокируя event loop"""
+        loop = asyncio.get_event_loop()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else loop.time() + timeout
+        while not await self._try_acquire_async():
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            await asyncio.sleep(self.retry_interval)
+        return True
+
+    def release(self) -> bool:
+        """Снять блокировку, если она все еще наша.
+
+        False — блокировка уже истекла или у другого владельца; ошибки Redis
+        пробрасываются, чтобы их нельзя было принять за потерю владения.
+        """
+        if self.token is None:
+            return False
+        token, self.token = self.token, None
+        return bool(self.storage._release_lock_script(keys=[self.storage._lock_key(self.name)], args=[token]))
+
+    async def release_async(self) -> bool:
+        if self.token is None:
+            return False
+        token, self.token = self.token, None
+        return bool(await self.storage._async_release_lock_script(
+            keys=[self.storage._lock_key(self.name)], args=[token]
+        ))
+
+    def is_current(self) -> bool:
+        """Блокировка все еще наша и за это время не выдавалась никому другому"""
+        if self.token is None or self.lost:
+            return False
+        lock_key, fence_key = self._lock_keys()
+        try:
+            owner, fence = self.storage.redis.mget(lock_key, fence_key)
+        except Exception as e:
+            logger.error(f"❌ Redis lock check error: {e}")
+            return False
+        return (owner is not None and owner.decode() == self.token
+                and fence is not None and int(fence) == self.fencing_token)
+
+    def extend(self, ttl: Optional[float] = None) -> bool:
+        """Продлить блокировку; False — она уже истекла или у другого владельца"""
+        if self.token is None:
+            return False
+        return self.storage.extend_lock(self.name, self.token, ttl or self.ttl)
+
+    async def _renew(self):
+        loop = asyncio.get_running_loop()
+        extended_at = loop.time()
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            token = self.token
+            if token is None:
+                return
+            try:
+                extended = await self.storage._async_extend_lock_script(
+                    keys=[self.storage._lock_key(self.name)], args=[token, int(self.ttl * 1000)]
+                )
+            except Exception as e:
+                # Redis недоступен: блокировка еще может быть нашей, пока не истек TTL
+                logger.error(f"❌ Не удалось продлить блокировку {self.name}: {e}")
+                if loop.time() - extended_at < self.ttl:
+                    continue
+                extended = False
+            if not extended:
+                self.lost = True
+                logger.warning(f"⚠️ Блокировка {self.name} потеряна до завершения работы")
+                return
+            extended_at = loop.time()
+
+    def __enter__(self) -> 'RedisLock':
+        self.lost = False
+        if not self.acquire():
+            raise LockNotAcquired(self.name)
+        return self
+
+    def _release_failed(self, e: Exception):
+        # Ошибка Redis при снятии — не нарушение владения: блокировка истечет по TTL.
+        # Не бросаем, чтобы не подменить исключение из блока и не повторять уже сделанную работу
+        logger.error(f"❌ Не удалось снять блокировку {self.name}: {e}")
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            released = self.release()
+        except Exception as e:
+            self._release_failed(e)
+            return
+        if exc_type is None and not released:
+            raise LockLost(self.name)
+
+    async def __aenter__(self) -> 'RedisLock':
+        self.lost = False
+        if not await self.acquire_async():
+            raise LockNotAcquired(self.name)
+        self._renew_task = asyncio.create_task(self._renew())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._renew_task is not None:
+            self._renew_task.cancel()
+            await asyncio.gather(self._renew_task, return_exceptions=True)
+            self._renew_task = None
+        try:
+            released = await self.release_async()
+        except Exception as e:
+            self._release_failed(e)
+            released = True
+        if exc_type is None and (self.lost or not released):
+            raise LockLost(self.name)
 
 # Глобальный экземпляр Redis
 redis_storage = RedisStorage()
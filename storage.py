@@ -3,47 +3,139 @@ from datetime import datetime, timedelta
 import logging
 import time
 import hashlib
+import threading
+from itertools import islice
 import uuid
-from database import db
-from redis_storage import RedisStorage
+from config import Config
+from database import db, async_db
+from redis_storage import redis_storage
+from audit_buffer import audit_buffer
+from local_cache import LocalTTLCache
+from pending_queue import PendingQueue
 
 logger = logging.getLogger(__name__)
 
-# Инициализация Redis
-redis_storage = RedisStorage()
-
 # Глобальные переменные для кэширования
 user_levels: Dict[int, int] = {}
 moderator_stats: Dict[int, Dict[str, int]] = {}
 pending_messages: Dict[int, Dict[str, Any]] = {}
+# Порядок просмотра ожидающих сообщений (приоритет, возраст) и курсоры модераторов
+pending_queue = PendingQueue()
 user_statistics: Dict[int, Dict[str, Any]] = {}
 
+# Индекс уровень -> пользователи; уровень 0 не индексируется (это все остальные).
+# Уровни пишутся и из потоков (пул базы данных, подписка на события), поэтому
+# изменения и чтение индекса идут под блокировкой
+users_by_level: Dict[int, set] = {1: set(), 2: set(), 3: set()}
+_level_index_lock = threading.RLock()
+
+# L1-кэш уровней пользователей: проверяется до Redis, фильтры читают его на каждом апдейте
+user_level_cache = LocalTTLCache(Config.USER_CACHE_SIZE, Config.CACHE_TTL)
+
+# Статус бана аккаунта (включая отрицательный), читается middleware прав на каждом апдейте
+ban_status_cache = LocalTTLCache(Config.USER_CACHE_SIZE, Config.BAN_STATUS_CACHE_TTL)
+
+# Идентификатор процесса, чтобы не обрабатывать собственные события инвалидации
+INSTANCE_ID = uuid.uuid4().hex
+USER_LEVEL_EVENTS = "user_level"
+_user_level_subscription = None
+
+# Система наказаний процесса; создается в init_punishment_system при запуске бота
+punishment_system = None
+
 def init_punishment_system(bot):
     """Инициализация системы наказаний"""
+    global punishment_system
     from punishment_system import PunishmentSystem
-    return PunishmentSystem(bot)
+    punishment_system = PunishmentSystem(bot)
+    return punishment_system
 
 # ==================== ОСНОВНЫЕ ФУНКЦИИ С REDIS КЭШИРОВАНИЕМ ====================
 
+def _remember_user_level(user_id: int, level: int):
+    """Записать уровень в user_levels, поддерживая индекс users_by_level"""
+    with _level_index_lock:
+        previous = user_levels.get(user_id)
+        user_levels[user_id] = level
+        if previous is not None and previous != level and previous in users_by_level:
+            users_by_level[previous].discard(user_id)
+        if level >= 1:
+            users_by_level.setdefault(level, set()).add(user_id)
+
+def rebuild_level_index():
+    """Перестроить индекс уровней по user_levels"""
+    with _level_index_lock:
+        for user_ids in users_by_level.values():
+            user_ids.clear()
+        for user_id, level in list(user_levels.items()):
+            if level >= 1:
+                users_by_level.setdefault(level, set()).add(user_id)
+
+def get_moderators(min_level: int = 1) -> List[int]:
+    """Пользователи с уровнем не ниже min_level (по индексу, без обхода всех пользователей)"""
+    with _level_index_lock:
+        return [user_id for level, user_ids in users_by_level.items() if level >= min_level for user_id in user_ids]
+
+def count_moderators(min_level: int = 1) -> int:
+    """Количество пользователей с уровнем не ниже min_level"""
+    with _level_index_lock:
+        return sum(len(user_ids) for level, user_ids in users_by_level.items() if level >= min_level)
+
+def get_user_levels_page(limit: int = 10) -> List[Tuple[int, int]]:
+    """Первые limit пар (пользователь, уровень) без копирования всего user_levels"""
+    with _level_index_lock:
+        return list(islice(user_levels.items(), limit))
+
+def _on_user_level_event(event: Dict[str, Any]):
+    """Применить изменение уровня, сделанное другим экземпляром"""
+    if event.get('instance_id') == INSTANCE_ID:
+        return
+    
+    user_id = int(event['user_id'])
+    user_level_cache.invalidate(user_id)
+    if event.get('level') is not None:
+        _remember_user_level(user_id, int(event['level']))
+
+def start_cache_invalidation():
+    """Подписаться на события инвалидации L1-кэша"""
+    global _user_level_subscription
+    if _user_level_subscription is None:
+        _user_level_subscription = redis_storage.subscribe_events(USER_LEVEL_EVENTS, _on_user_level_event)
+
+def stop_cache_invalidation():
+    """Отписаться от событий инвалидации L1-кэша"""
+    global _user_level_subscription
+    if _user_level_subscription is not None:
+        _user_level_subscription.stop()
+        _user_level_subscription = None
+
+
 def get_user_level(user_id: int) -> int:
-    """Получить уровень пользователя с кэшированием в Redis"""
+    """Получить уровень пользователя: L1 -> Redis -> memory -> база данных"""
+    cached_level = user_level_cache.get(user_id)
+    if cached_level is not None:
+        return cached_level
+    
     cache_key = f"user_level:{user_id}"
     
     # Пробуем получить из Redis кэша
     cached_level = redis_storage.cache_get(cache_key)
     if cached_level is not None:
+        user_level_cache.set(user_id, cached_level)
         return cached_level
     
     # Пробуем получить из memory кэша
     if user_id in user_levels:
         redis_storage.cache_set(cache_key, user_levels[user_id], 3600)  # Кэш на 1 час
+        user_level_cache.set(user_id, user_levels[user_id])
         return user_levels[user_id]
     
     # Получаем из базы данных
     try:
         level = db.get_user_level(user_id)
-        user_levels[user_id] = level
+        _remember_user_level(user_id, level)
         redis_storage.cache_set(cache_key, level, 3600)
+        user_level_cache.set(user_id, level)
         return level
     except Exception as e:
         logger.error(f"❌ Ошибка получения уровня пользователя {user_id}: {e}")
@@ -53,14 +145,22 @@ def set_user_level(user_id: int, level: int):
     """Установить уровень пользователя с обновлением кэшей"""
     try:
         db.set_user_level(user_id, level)
-        user_levels[user_id] = level
+        _remember_user_level(user_id, level)
+        user_level_cache.set(user_id, level)
         
         # Обновляем Redis кэш
         cache_key = f"user_level:{user_id}"
         redis_storage.cache_set(cache_key, level, 3600)
         
-        # Логируем действие
-        db.add_audit_log(
+        # Сбрасываем L1-кэш на остальных экземплярах бота
+        redis_storage.publish_event(USER_LEVEL_EVENTS, {
+            'instance_id': INSTANCE_ID,
+            'user_id': user_id,
+            'level': level
+        })
+        
+        # Логируем действие (запись в БД выполняется фоново пачками)
+        audit_buffer.add(
             user_id=0,  # system
             action_type="user_level_change",
             action_details={"user_id": user_id, "new_level": level, "old_level": user_levels.get(user_id, 0)}
@@ -98,12 +198,13 @@ def add_message(message_data: Dict[str, Any]) -> int:
     try:
         message_id = db.add_message(message_data)
         pending_messages[message_id] = message_data
+        pending_queue.add(message_id, message_data)
         
         # Кэшируем в Redis
         redis_storage.cache_set(f"message:{message_id}", message_data, 1800)  # 30 минут
         
         # Логируем создание сообщения
-        db.add_audit_log(
+        audit_buffer.add(
             user_id=message_data['user_id'],
             action_type="message_created",
             action_details={"message_id": message_id, "type": message_data['type']}
@@ -155,10 +256,11 @@ def update_message_status(message_id: int, approved: bool, moderation_time: int)
         
         # Удаляем из кэшей
         pending_messages.pop(message_id, None)
+        pending_queue.remove(message_id)
         redis_storage.cache_delete(f"message:{message_id}")
         
         # Логируем модерацию
-        db.add_audit_log(
+        audit_buffer.add(
             user_id=0,  # system
             action_type="message_moderated",
             action_details={
@@ -177,6 +279,7 @@ def delete_message(message_id: int):
     try:
         db.delete_message(message_id)
         pending_messages.pop(message_id, None)
+        pending_queue.remove(message_id)
         redis_storage.cache_delete(f"message:{message_id}")
         logger.debug(f"🗑️ Сообщение {message_id} удалено")
         
@@ -337,16 +440,17 @@ def add_advanced_ban(user_id: int, ban_type: str, identifier: str,
                         ban_count = ban_count + 1
                     WHERE user_id = %s
                 """, (reason, duration, user_id))
+            ban_status_cache.set(user_id, True)
         
         # Кэшируем бан в Redis для быстрой проверки
         redis_storage.cache_set(
-            f"ban:{ban_type}:{identifier}", 
+            _ban_cache_key(identifier, ban_type),
             {'banned': True, 'expires_at': datetime.now() + timedelta(seconds=duration)},
             duration
         )
         
         # Логируем бан
-        db.add_audit_log(
+        audit_buffer.add(
             user_id=moderator_id,
             action_type="user_banned",
             action_details={
@@ -365,12 +469,16 @@ def add_advanced_ban(user_id: int, ban_type: str, identifier: str,
         logger.error(f"❌ Ошибка добавления бана: {e}")
         return False
 
+def _ban_cache_key(identifier: str, ban_type: str) -> str:
+    return f"ban:{ban_type}:{identifier}"
+
+def _is_cached_ban(cached_ban: Optional[Dict[str, Any]]) -> bool:
+    return bool(cached_ban and cached_ban['banned'])
+
 def check_advanced_ban(identifier: str, ban_type: str) -> bool:
     """Проверить наличие активного бана"""
     # Сначала проверяем Redis кэш
-    cache_key = f"ban:{ban_type}:{identifier}"
-    cached_ban = redis_storage.cache_get(cache_key)
-    if cached_ban and cached_ban['banned']:
+    if _is_cached_ban(redis_storage.cache_get(_ban_cache_key(identifier, ban_type))):
         return True
     
     # Затем проверяем базу данных
@@ -380,6 +488,24 @@ def check_advanced_ban(identifier: str, ban_type: str) -> bool:
         logger.error(f"❌ Ошибка проверки бана: {e}")
         return False
 
+def is_user_banned(user_id: int) -> bool:
+    """Проверить бан аккаунта пользователя с кэшированием в памяти"""
+    cached = ban_status_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    if _is_cached_ban(redis_storage.cache_get(_ban_cache_key(str(user_id), 'account'))):
+        banned = True
+    else:
+        try:
+            banned = db.check_advanced_ban(str(user_id), 'account')
+        except Exception as e:
+            # Ошибку базы не кэшируем: при следующем запросе проверим снова
+            logger.error(f"❌ Ошибка проверки бана: {e}")
+            return False
+    ban_status_cache.set(user_id, banned)
+    return banned
+
 def get_user_bans(user_id: int) -> List[Dict[str, Any]]:
     """Получить историю банов пользователя"""
     try:
@@ -400,18 +526,8 @@ def add_audit_log(user_id: int, action_type: str, action_details: Dict[str, Any]
                  ip_address: str = None, user_agent: str = None):
     """Добавить запись в лог аудита"""
     try:
-        db.add_audit_log(user_id, action_type, action_details, ip_address, user_agent)
-        
-        # Также пишем в Redis для real-time мониторинга
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'user_id': user_id,
-            'action_type': action_type,
-            'action_details': action_details
-        }
-        
-        redis_storage.queue_push("audit_logs", log_entry)
-        
+        # Запись в базу выполняется фоново пачками; обращений к сети здесь нет
+        audit_buffer.add(user_id, action_type, action_details, ip_address, user_agent)
     except Exception as e:
         logger.error(f"❌ Ошибка добавления лога аудита: {e}")
 
@@ -504,6 +620,170 @@ def get_daily_moderation_stats(days: int = 7) -> List[Dict[str, Any]]:
         logger.error(f"❌ Ошибка получения ежедневной статистики: {e}")
         return []
 
+# ==================== ЗАКРЕПЛЕНИЕ СООБЩЕНИЙ ЗА МОДЕРАТОРАМИ ====================
+# Аренда на блокировке Redis: владелец — токен модератора, истекает через
+# MODERATION_LEASE_TTL секунд, если модератор ее не продлил.
+
+def _claim_lock(message_id: int) -> str:
+    return f"moderation:{message_id}"
+
+def _claim_token(moderator_id: int) -> str:
+    return f"moderator:{moderator_id}"
+
+def _claim_owner(owner: Optional[str]) -> Optional[int]:
+    """ID модератора из токена владельца блокировки"""
+    if owner and owner.startswith("moderator:"):
+        return int(owner.split(":", 1)[1])
+    return None
+
+def _deliveries_key(message_id: int) -> str:
+    return f"deliveries:{message_id}"
+
+def _encode_deliveries(deliveries: Dict[int, int]) -> Dict[str, int]:
+    return {str(moderator_id): chat_message_id for moderator_id, chat_message_id in deliveries.items()}
+
+def _decode_deliveries(deliveries: Optional[Dict[str, int]]) -> Dict[int, int]:
+    return {int(moderator_id): chat_message_id for moderator_id, chat_message_id in (deliveries or {}).items()}
+
+def claim_message(message_id: int, moderator_id: int, ttl: int = Config.MODERATION_LEASE_TTL) -> bool:
+    """Закрепить сообщение за модератором или продлить его закрепление"""
+    lock_name = _claim_lock(message_id)
+    token = _claim_token(moderator_id)
+    if redis_storage.acquire_lock(lock_name, ttl, token) or redis_storage.extend_lock(lock_name, token, ttl):
+        pending_queue.claim(message_id, moderator_id)
+        return True
+    return False
+
+def release_message_claim(message_id: int, moderator_id: int) -> bool:
+    """Снять закрепление, если оно принадлежит модератору"""
+    pending_queue.release(message_id, moderator_id)
+    return redis_storage.release_lock(_claim_lock(message_id), _claim_token(moderator_id))
+
+def get_message_claim(message_id: int) -> Optional[int]:
+    """ID модератора, за которым закреплено сообщение"""
+    return _claim_owner(redis_storage.get_lock_owner(_claim_lock(message_id)))
+
+def remember_deliveries(message_id: int, deliveries: Dict[int, int]):
+    """Запомнить, какое сообщение получил каждый модератор (для обновления клавиатур)"""
+    redis_storage.cache_set(
+        _deliveries_key(message_id), _encode_deliveries(deliveries), Config.MESSAGE_EXPIRY_HOURS * 3600
+    )
+
+def get_deliveries(message_id: int) -> Dict[int, int]:
+    """Доставленные модераторам копии: moderator_id -> message_id в их чате"""
+    return _decode_deliveries(redis_storage.cache_get(_deliveries_key(message_id)))
+
+def forget_deliveries(message_id: int):
+    redis_storage.cache_delete(_deliveries_key(message_id))
+
+# ==================== АСИНХРОННЫЕ ВЕРСИИ ДЛЯ ОБРАБОТЧИКОВ ====================
+# Redis опрашивается асинхронным клиентом прямо из event loop; блокирующие
+# обращения к MySQL выполняются в пуле потоков базы данных, чтобы медленный
+# запрос не останавливал polling loop.
+
+async def async_get_user_level(user_id: int) -> int:
+    """Асинхронно получить уровень пользователя"""
+    cached_level = user_level_cache.get(user_id)
+    if cached_level is not None:
+        return cached_level
+    
+    cache_key = f"user_level:{user_id}"
+    cached_level = await redis_storage.async_cache_get(cache_key)
+    if cached_level is not None:
+        user_level_cache.set(user_id, cached_level)
+        return cached_level
+    
+    if user_id in user_levels:
+        level = user_levels[user_id]
+        await redis_storage.async_cache_set(cache_key, level, 3600)
+        user_level_cache.set(user_id, level)
+        return level
+    
+    return await async_db.run(get_user_level, user_id)
+
+async def async_claim_message(message_id: int, moderator_id: int, ttl: int = Config.MODERATION_LEASE_TTL) -> bool:
+    """Асинхронно закрепить сообщение за модератором"""
+    lock_name = _claim_lock(message_id)
+    token = _claim_token(moderator_id)
+    if (await redis_storage.async_acquire_lock(lock_name, ttl, token)
+            or await redis_storage.async_extend_lock(lock_name, token, ttl)):
+        pending_queue.claim(message_id, moderator_id)
+        return True
+    return False
+
+async def async_release_message_claim(message_id: int, moderator_id: int) -> bool:
+    """Асинхронно снять закрепление"""
+    pending_queue.release(message_id, moderator_id)
+    return await redis_storage.async_release_lock(_claim_lock(message_id), _claim_token(moderator_id))
+
+async def async_get_message_claim(message_id: int) -> Optional[int]:
+    """Асинхронно получить владельца закрепления"""
+    return _claim_owner(await redis_storage.async_get_lock_owner(_claim_lock(message_id)))
+
+async def async_remember_deliveries(message_id: int, deliveries: Dict[int, int]):
+    """Асинхронно запомнить доставленные модераторам копии"""
+    await redis_storage.async_cache_set(
+        _deliveries_key(message_id), _encode_deliveries(deliveries), Config.MESSAGE_EXPIRY_HOURS * 3600
+    )
+
+async def async_get_deliveries(message_id: int) -> Dict[int, int]:
+    """Асинхронно получить доставленные модераторам копии"""
+    return _decode_deliveries(await redis_storage.async_cache_get(_deliveries_key(message_id)))
+
+async def async_forget_deliveries(message_id: int):
+    """Асинхронно забыть доставленные копии"""
+    await redis_storage.async_cache_delete(_deliveries_key(message_id))
+
+async def async_hit_rate_limit(key: str, limit: int, period: float) -> Dict[str, Any]:
+    """Асинхронно учесть запрос в общем (Redis) rate limit"""
+    return await redis_storage.async_hit_rate_limit(key, limit, period)
+
+async def async_is_user_banned(user_id: int) -> bool:
+    """Асинхронно проверить бан аккаунта пользователя"""
+    cached = ban_status_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    if _is_cached_ban(await redis_storage.async_cache_get(_ban_cache_key(str(user_id), 'account'))):
+        banned = True
+    else:
+        try:
+            banned = await async_db.run(db.check_advanced_ban, str(user_id), 'account')
+        except Exception as e:
+            # Ошибку базы не кэшируем: при следующем запросе проверим снова
+            logger.error(f"❌ Ошибка проверки бана: {e}")
+            return False
+    ban_status_cache.set(user_id, banned)
+    return banned
+
+async def async_set_user_level(user_id: int, level: int):
+    """Асинхронно установить уровень пользователя"""
+    await async_db.run(set_user_level, user_id, level)
+
+async def async_update_moderator_stats(moderator_id: int, action: str, moderation_time: int = 0):
+    """Асинхронно обновить статистику модератора"""
+    await async_db.run(update_moderator_stats, moderator_id, action, moderation_time)
+
+async def async_add_message(message_data: Dict[str, Any]) -> int:
+    """Асинхронно добавить сообщение в очередь"""
+    return await async_db.run(add_message, message_data)
+
+async def async_get_message(message_id: int) -> Optional[Dict[str, Any]]:
+    """Асинхронно получить сообщение"""
+    return await async_db.run(get_message, message_id)
+
+async def async_update_message_status(message_id: int, approved: bool, moderation_time: int):
+    """Асинхронно обновить статус сообщения"""
+    await async_db.run(update_message_status, message_id, approved, moderation_time)
+
+async def async_delete_message(message_id: int):
+    """Асинхронно удалить сообщение"""
+    await async_db.run(delete_message, message_id)
+
+async def async_can_send_message(user_id: int) -> bool:
+    """Асинхронно проверить лимит отправки сообщений"""
+    return await async_db.run(can_send_message, user_id)
+
 # ==================== СИСТЕМНЫЕ ФУНКЦИИ ====================
 
 def load_initial_data():
@@ -512,11 +792,16 @@ def load_initial_data():
     
     try:
         # Загружаем пользователей
-        user_levels.update(db.get_all_user_levels())
-        logger.info(f"👥 Загружено {len(user_levels)} пользователей")
+        all_levels = db.get_all_user_levels()
+        with _level_index_lock:
+            user_levels.update(all_levels)
+            rebuild_level_index()
+        logger.info(f"👥 Загружено {len(user_levels)} пользователей, модераторов: {count_moderators()}")
         
         # Загружаем сообщения в очереди
         pending_messages.update(db.get_all_pending_messages())
+        for message_id, message_data in pending_messages.items():
+            pending_queue.add(message_id, message_data)
         logger.info(f"📨 Загружено {len(pending_messages)} сообщений в очереди")
         
         # Pre-cache активных банов в Redis
@@ -531,15 +816,18 @@ def pre_cache_active_bans():
     """Предварительное кэширование активных банов в Redis"""
     try:
         active_bans = db.get_active_bans()
+        now = datetime.now()
+        items = {}
+        ttls = {}
         for ban in active_bans:
-            cache_key = f"ban:{ban['ban_type']}:{ban['identifier']}"
-            expires_in = (ban['expires_at'] - datetime.now()).total_seconds() if ban['expires_at'] else 3600
+            cache_key = _ban_cache_key(ban['identifier'], ban['ban_type'])
+            expires_in = (ban['expires_at'] - now).total_seconds() if ban['expires_at'] else 3600
             
-            redis_storage.cache_set(
-                cache_key,
-                {'banned': True, 'expires_at': ban['expires_at'].isoformat() if ban['expires_at'] else None},
-                max(60, int(expires_in))
-            )
+            items[cache_key] = {'banned': True, 'expires_at': ban['expires_at'].isoformat() if ban['expires_at'] else None}
+            ttls[cache_key] = max(60, int(expires_in))
+        
+        # Пачками по REDIS_PIPELINE_BATCH вместо SETEX на каждый бан
+        redis_storage.cache_set_many(items, ttls)
         
         logger.info(f"✅ Загружено {len(active_bans)} активных банов в кэш")
         